@@ -3,14 +3,36 @@ tests to run and debug your minimax and alphabeta agents locally.  The test
 cases used by the project assistant are not public.
 """
 
+import os
+import subprocess
+import sys
+import tempfile
 import unittest
+import time
 import timeit
 import random
 from importlib import reload
 
-from isolation import Board
-from game_agent import AlphaBetaPlayer, MinimaxPlayer,\
-    custom_score, custom_score_2, custom_score_3
+try:
+    import numpy
+    from isolation.batch import BoardBatch
+except ImportError:
+    numpy = None
+
+from isolation import Board, BitBoard, CompactBoard, Deadline
+from isolation import symmetry
+from isolation.endgame import EndgameSolver
+from isolation.mobility import child_scores
+from tournament import Agent, SPRT, play_fair_pair, play_sprt
+from game_records import GameRecorder, read_records
+from ratings import Ratings
+from benchmark import build_corpus, compare, replay, search_to_depth
+from opening_book import build_book, book_positions, write_book
+import competition_agent
+from mcts_agent import MCTSPlayer
+from parallel_agent import ParallelAlphaBetaPlayer, SharedTranspositionTable, merge_split
+from game_agent import AlphaBetaPlayer, MinimaxPlayer, TranspositionTable, MoveOrdering,\
+    BATCH_SCORES, custom_score, custom_score_2, custom_score_3
 from sample_players import RandomPlayer, GreedyPlayer, \
     open_move_score, improved_score, center_score
 
@@ -48,6 +70,103 @@ class IsolationTest(unittest.TestCase):
         self.assertIn(alphabeta.get_move(board, time_left),
                       board.get_legal_moves(alphabeta))
 
+    def test_parallel_alphabeta_valid(self):
+        for mode in ParallelAlphaBetaPlayer.MODES:
+            player = ParallelAlphaBetaPlayer(processes=1, mode=mode)
+            board = Board(player, RandomPlayer())
+            board.apply_move(random.choice(board.get_legal_moves()))
+            board.apply_move(random.choice(board.get_legal_moves()))
+
+            test_start = self.time_millis()
+            time_left = lambda: 100 - (self.time_millis() - test_start)
+            try:
+                self.assertIn(player.get_move(board, time_left),
+                              board.get_legal_moves(player))
+                self.assertGreaterEqual(time_left(), 0)
+            finally:
+                player.close()
+
+    def test_split_merge_needs_every_share(self):
+        own = {1: ((0, 1), 2.), 2: ((0, 1), 1.)}
+        other = {1: ((2, 3), 3.)}
+        self.assertEqual((2, 3), merge_split([own, other]))
+        # A share that did not answer or completed no pass leaves part of the
+        # root unsearched
+        self.assertIsNone(merge_split([own, None]))
+        self.assertIsNone(merge_split([own, {}]))
+
+    def test_pondering_fills_table_between_moves(self):
+        player = ParallelAlphaBetaPlayer(processes=0, mode="lazy", ponder=True)
+        try:
+            board = Board(player, RandomPlayer())
+            board.apply_move((3, 3))
+            board.apply_move((2, 4))
+
+            test_start = self.time_millis()
+            time_left = lambda: 50 - (self.time_millis() - test_start)
+            move = player.get_move(board.copy(), time_left)
+            self.assertIn(move, board.get_legal_moves(player))
+            self.assertIsNotNone(player._pondering)
+
+            time.sleep(0.2)
+            board.apply_move(move)
+            board.apply_move(random.choice(board.get_legal_moves()))
+            test_start = self.time_millis()
+            self.assertIn(player.get_move(board.copy(), time_left),
+                          board.get_legal_moves(player))
+            self.assertGreater(player.ponder_depth, 1)
+
+            # Board.play() stops the background search when the game ends
+            board.play(time_limit=50)
+            self.assertIsNone(player._pondering)
+        finally:
+            player.close()
+
+    def test_mcts_valid_and_reuses_tree(self):
+        player = MCTSPlayer()
+        board = Board(player, RandomPlayer())
+        board.apply_move(random.choice(board.get_legal_moves()))
+        board.apply_move(random.choice(board.get_legal_moves()))
+
+        test_start = self.time_millis()
+        time_left = lambda: 100 - (self.time_millis() - test_start)
+        move = player.get_move(board, time_left)
+        self.assertIn(move, board.get_legal_moves(player))
+        self.assertGreaterEqual(time_left(), 0)
+        self.assertGreater(player.stats.leaves, 0)
+
+        # The subtree under the move pair played becomes the next tree, with
+        # the visits it had
+        board.apply_move(move)
+        board.apply_move(random.choice(board.get_legal_moves()))
+        row, col = board.get_player_location(board.inactive_player)
+        reply = player.tree.child(player._last[1], row + col * board.height)
+        visits = player.tree.visits[reply]
+        self.assertGreater(visits, 0)
+
+        test_start = self.time_millis()
+        self.assertIn(player.get_move(board, time_left), board.get_legal_moves(player))
+        self.assertEqual(visits + player.stats.leaves, player.tree.visits[0])
+
+        # A copy stopped for lack of time leaves an empty tree
+        tree = player.tree
+        self.assertFalse(tree.reroot(tree.firsts[0], stop=lambda: True))
+        self.assertEqual(1, len(tree))
+
+    def test_shared_transposition_table_entries(self):
+        table = SharedTranspositionTable(size=64)
+        table.store(70, 3, 2.5, float("-inf"), float("inf"), (1, 2))
+        self.assertEqual((2.5, (1, 2)), table.probe(70, 3, 0., 1.))
+        self.assertEqual((None, (1, 2)), table.probe(70, 4, 0., 1.))
+        self.assertIsNone(table.lookup(6))
+
+        table.store(6, 1, float("-inf"), float("-inf"), float("inf"), None)
+        self.assertEqual(3, table.lookup(70).depth)
+        table.new_search()
+        table.store(6, 1, float("-inf"), float("-inf"), float("inf"), None)
+        self.assertIsNone(table.lookup(70))
+        self.assertEqual(float("-inf"), table.lookup(6).score)
+
     def test_hash_different(self):
         board = Board(AlphaBetaPlayer(), RandomPlayer())
 
@@ -59,6 +178,606 @@ class IsolationTest(unittest.TestCase):
 
         self.assertNotEqual(b1.__hash__(), b2.__hash__())
 
+    def test_bitboard_matches_board(self):
+        for board_cls in (BitBoard, CompactBoard):
+            player1, player2 = RandomPlayer(), RandomPlayer()
+            board = Board(player1, player2, width=6, height=8)
+            bitboard = board_cls(player1, player2, width=6, height=8)
+
+            while True:
+                legal_moves = sorted(board.get_legal_moves())
+                self.assertEqual(legal_moves, sorted(bitboard.get_legal_moves()))
+                self.assertEqual(board.to_string(), bitboard.to_string())
+                self.assertEqual(board._blank_mask(), bitboard._blank_mask())
+                self.assertEqual(board.get_regions(), bitboard.get_regions())
+                for player in (player1, player2):
+                    self.assertEqual(board.get_player_location(player),
+                                     bitboard.get_player_location(player))
+                    self.assertEqual(board.utility(player), bitboard.utility(player))
+                    self.assertEqual(board.is_winner(player), bitboard.is_winner(player))
+                    self.assertIs(board.get_opponent(player), bitboard.get_opponent(player))
+                if not legal_moves:
+                    break
+                move = random.choice(legal_moves)
+                board.apply_move(move)
+                bitboard = bitboard.forecast_move(move)
+
+    def test_compact_board_has_no_instance_dict(self):
+        player1, player2 = GreedyPlayer(), RandomPlayer()
+        board = CompactBoard(player1, player2)
+        self.assertFalse(hasattr(board, "__dict__"))
+        with self.assertRaises(RuntimeError):
+            board.get_player_location(RandomPlayer())
+
+        winner, history, _ = board.copy().play()
+        self.assertIn(winner, (player1, player2))
+        for move in history:
+            board.apply_move(tuple(move))
+        self.assertTrue(board.is_winner(winner))
+        self.assertEqual(winner, board.inactive_player)
+
+    def test_unshuffled_moves_follow_move_table(self):
+        for board_cls in (Board, BitBoard, CompactBoard):
+            board = board_cls(RandomPlayer(), RandomPlayer(), shuffle_moves=False)
+            board.apply_move((3, 3))
+            board.apply_move((0, 0))
+            copied = board.copy()
+
+            coords, neighbours = Board.move_table(board.width, board.height)
+            expected = [move for _, move in neighbours[3 + 3 * board.height]]
+            self.assertEqual(expected, board.get_legal_moves())
+            self.assertEqual(expected, copied.get_legal_moves())
+            self.assertEqual([c for c in coords if c not in [(3, 3), (0, 0)]],
+                             board.get_blank_spaces())
+
+    def test_symmetry_canonical_key(self):
+        for width, height in ((7, 7), (5, 8)):
+            board = Board(RandomPlayer(), RandomPlayer(), width, height)
+            for _ in range(5):
+                board.apply_move(random.choice(board.get_legal_moves()))
+
+            key, _ = symmetry.canonical_key(board)
+            perms = symmetry.transforms(width, height)
+            self.assertEqual(8 if width == height else 4, len(perms))
+            for perm in perms:
+                image = symmetry.transform_board(board, perm)
+                self.assertEqual(key, symmetry.canonical_key(image)[0])
+                self.assertEqual(symmetry.canonical_key(image),
+                                 competition_agent.canonical_key(image))
+
+            # The transform keys are updated incrementally during the search
+            for game in (board, Board(RandomPlayer(), RandomPlayer(), width, height)):
+                keys = competition_agent.transform_keys(game)
+                for move in game.get_legal_moves():
+                    self.assertEqual(competition_agent.transform_keys(game.forecast_move(move)),
+                                     competition_agent.child_keys(game, keys, move))
+                self.assertEqual(sorted(symmetry.transform_move(board, perm, m)
+                                        for m in board.get_legal_moves()),
+                                 sorted(image.get_legal_moves()))
+
+    def test_competition_agent_runs_with_stock_isolation(self):
+        # The PvP competition runs competition_agent.py and its data.json
+        # book next to the stock isolation package and game_agent.py, which
+        # only provide Board and AlphaBetaPlayer, with a plain time_left
+        script = """if True:
+            import sys
+            import game_agent, sample_players
+            import isolation
+            board_cls = isolation.Board
+            for name in list(sys.modules):
+                if name == "isolation" or name.startswith("isolation."):
+                    del sys.modules[name]
+            stock = type(sys)("isolation")
+            stock.Board = board_cls
+            sys.modules["isolation"] = stock
+            stock_agent = type(sys)("game_agent")
+            stock_agent.AlphaBetaPlayer = game_agent.AlphaBetaPlayer
+            sys.modules["game_agent"] = stock_agent
+
+            import competition_agent
+            assert "opening_book" not in sys.modules
+            player = competition_agent.CustomPlayer()
+            board = board_cls(player, sample_players.RandomPlayer())
+            move = player.get_move(board, lambda: 1.)
+            assert move == player.book.lookup(board) and move is not None
+            board.apply_move((3, 3))
+            board.apply_move((2, 4))
+            import time
+            start = time.monotonic()
+            time_left = lambda: 50. - 1000 * (time.monotonic() - start)
+            assert player.get_move(board, time_left) in board.get_legal_moves()
+        """
+        result = subprocess.run([sys.executable, "-c", script],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, timeout=60)
+        self.assertEqual(0, result.returncode, result.stderr)
+
+    def test_game_agent_runs_with_stock_isolation(self):
+        # The graded game_agent.py runs next to the stock isolation package,
+        # whose Board has none of the later additions and which has no
+        # submodules: the default players must import and search with it
+        script = """if True:
+            import sys
+            import time
+            import isolation
+            board_cls = isolation.Board
+            for name in list(sys.modules):
+                if name == "isolation" or name.startswith("isolation."):
+                    del sys.modules[name]
+
+            class Board:
+                API = {"width", "height", "move_count", "hash", "active_player",
+                       "inactive_player", "get_opponent", "move_is_legal",
+                       "get_blank_spaces", "get_player_location",
+                       "get_legal_moves", "apply_move", "is_winner", "is_loser",
+                       "utility", "to_string"}
+
+                def __init__(self, player_1, player_2, width=7, height=7, board=None):
+                    if board is None:
+                        board = board_cls(player_1, player_2, width, height)
+                    self._board = board
+
+                def __getattr__(self, name):
+                    if name not in self.API:
+                        raise AttributeError(name)
+                    return getattr(self._board, name)
+
+                def copy(self):
+                    return Board(None, None, board=self._board.copy())
+
+                def forecast_move(self, move):
+                    return Board(None, None, board=self._board.forecast_move(move))
+
+            stock = type(sys)("isolation")
+            stock.Board = Board
+            sys.modules["isolation"] = stock
+
+            import game_agent
+            from sample_players import RandomPlayer
+            for player in (game_agent.MinimaxPlayer(), game_agent.AlphaBetaPlayer()):
+                board = Board(player, RandomPlayer())
+                board.apply_move((3, 3))
+                board.apply_move((2, 4))
+                start = time.monotonic()
+                time_left = lambda: 50. - 1000 * (time.monotonic() - start)
+                assert player.get_move(board, time_left) in board.get_legal_moves()
+        """
+        result = subprocess.run([sys.executable, "-c", script],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True, timeout=60)
+        self.assertEqual(0, result.returncode, result.stderr)
+
+    def test_symmetry_prunes_opening_moves(self):
+        board = Board(RandomPlayer(), RandomPlayer())
+        self.assertEqual(10, len(symmetry.unique_moves(board, board.get_legal_moves())))
+        board.apply_move((3, 3))
+        self.assertEqual(9, len(symmetry.unique_moves(board, board.get_legal_moves())))
+        board.apply_move((0, 1))
+        moves = board.get_legal_moves()
+        self.assertEqual(moves, symmetry.unique_moves(board, moves))
+
+    def test_fair_pair_is_reproducible_from_seed(self):
+        cpu_agent = Agent(RandomPlayer(), "Random")
+        test_agent = Agent(GreedyPlayer(), "Greedy")
+
+        results = play_fair_pair(cpu_agent, test_agent, 1234)
+        self.assertEqual(2, len(results))
+        self.assertEqual(results, play_fair_pair(cpu_agent, test_agent, 1234))
+
+    def test_sprt_stops_on_clear_results(self):
+        for score, status in ((1., "stronger"), (0., "weaker"), (None, "equal")):
+            sprt = SPRT(margin=0.1)
+            while sprt.status() is None:
+                sprt.add(score if score is not None else sprt.pairs % 2)
+                self.assertLess(sprt.pairs, 1000)
+            self.assertEqual(status, sprt.status())
+
+        greedy, rand = Agent(GreedyPlayer(), "Greedy"), Agent(RandomPlayer(), "Random")
+        sprt = SPRT(margin=0.2)
+        self.assertEqual("stronger", play_sprt(greedy, rand, sprt, 200, seed=1))
+        self.assertLess(sprt.pairs, 200)
+
+        # A process pool adds the same pairs in the same order
+        parallel = SPRT(margin=0.2)
+        self.assertEqual("stronger", play_sprt(greedy, rand, parallel, 200, processes=2, seed=1))
+        self.assertEqual((sprt.pairs, sprt.mean), (parallel.pairs, parallel.mean))
+
+    def test_ratings_from_streamed_games(self):
+        ratings = Ratings()
+        for _ in range(30):
+            ratings.add_game("strong", "weak")
+            ratings.add_game("strong", "middle")
+            ratings.add_game("middle", "weak")
+        ratings.add_game("weak", "strong")
+        interval = ratings.rating("middle")[1]
+        ratings.fit()
+        table = ratings.table()
+        self.assertEqual(["strong", "middle", "weak"], [row[0] for row in table])
+        self.assertGreater(ratings.win_probability("strong", "weak"), 0.9)
+
+        # New and uncertain agents are scheduled first, and more games
+        # narrow the confidence interval
+        self.assertIn("new", ratings.next_pairing(["strong", "middle", "weak", "new"]))
+        ratings.add_game("middle", "new")
+        self.assertLess(ratings.rating("middle")[1], interval)
+
+        records = []
+        play_fair_pair(Agent(RandomPlayer(), "Random"), Agent(GreedyPlayer(), "Greedy"),
+                       1234, records)
+        for record in records:
+            ratings.add_record(record)
+        self.assertEqual({"Random": 2}, ratings.games["Greedy"])
+
+    def test_game_records_replay_games(self):
+        cpu_agent = Agent(RandomPlayer(), "Random")
+        test_agent = Agent(GreedyPlayer(), "Greedy")
+        records = []
+        results = play_fair_pair(cpu_agent, test_agent, 1234, records)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.jsonl")
+            with GameRecorder(path) as recorder:
+                for record in records:
+                    recorder.write(record)
+            self.assertEqual(records, list(read_records(path)))
+
+        for (test_won, termination), record in zip(results, records):
+            self.assertEqual(record["opening"], record["moves"][:2])
+            self.assertEqual(len(record["times"]), len(record["moves"]) - 1)
+            self.assertEqual(termination, record["termination"])
+            winner = record["players"][record["winner"]]
+            self.assertEqual(test_won, winner == test_agent.name)
+
+            board = Board(RandomPlayer(), RandomPlayer())
+            for move in record["moves"]:
+                self.assertTrue(board.move_is_legal(tuple(move)))
+                board.apply_move(tuple(move))
+            # The game ended because the player to move was stuck
+            self.assertFalse(board.get_legal_moves())
+            self.assertEqual(record["winner"], 1 - len(record["moves"]) % 2)
+
+    @unittest.skipIf(numpy is None, "BoardBatch requires numpy")
+    def test_board_batch_matches_bitboard(self):
+        rng = numpy.random.default_rng(1)
+        start = BitBoard(RandomPlayer(), RandomPlayer(), width=5, height=6)
+        start.apply_move((2, 2))
+        batch = BoardBatch.from_board(start, 20)
+        boards = [start.copy() for _ in range(batch.n)]
+
+        policies = ("greedy", lambda batch, legal: batch.mobility() ** 2)
+        while not batch.done.all():
+            legal = batch.legal_moves()
+            for game, board in enumerate(boards):
+                moves = board.get_legal_moves()
+                self.assertEqual(sorted(r + c * board.height for r, c in moves),
+                                 list(numpy.flatnonzero(legal[game])))
+                self.assertEqual(not moves, batch.done[game])
+            moves = numpy.where(batch.initiative == 0,
+                                batch.greedy_moves(legal, rng),
+                                batch.policy_moves(legal, legal * 1., rng))
+            for game, board in enumerate(boards):
+                if not batch.done[game]:
+                    board.apply_move((moves[game] % board.height, moves[game] // board.height))
+            batch.step(moves)
+
+        for game, board in enumerate(boards):
+            winner = 0 if board.is_winner(board._player_1) else 1
+            self.assertEqual(winner, batch.winner[game])
+            self.assertEqual(board.move_count, batch.move_count[game])
+
+        batch = BoardBatch(200)
+        winners = batch.play(policies, rng)
+        self.assertTrue(batch.done.all())
+        self.assertTrue(((winners == 0) | (winners == 1)).all())
+        with self.assertRaises(ValueError):
+            BoardBatch(1).step(numpy.array([-1]))
+
+    def test_zobrist_hash_is_incremental(self):
+        player1, player2 = RandomPlayer(), RandomPlayer()
+        board = Board(player1, player2)
+        bitboard = BitBoard(player1, player2)
+        compact = CompactBoard(player1, player2)
+
+        while board.get_legal_moves():
+            self.assertEqual(board._compute_hash(), board.hash())
+            self.assertEqual(bitboard._compute_hash(), bitboard.hash())
+            self.assertEqual(compact._compute_hash(), compact.hash())
+            self.assertEqual(board.hash(), bitboard.hash())
+            self.assertEqual(board.hash(), compact.hash())
+            self.assertLess(board.hash(), 2 ** 64)
+            move = random.choice(board.get_legal_moves())
+            board.apply_move(move)
+            bitboard.apply_move(move)
+            compact.apply_move(move)
+
+    def test_transposition_table_preserves_search_value(self):
+        alphabeta = AlphaBetaPlayer(score_fn=improved_score)
+        alphabeta.time_left = lambda: float("inf")
+        table = TranspositionTable(size=1021)
+        board = Board(alphabeta, RandomPlayer())
+        for _ in range(6):
+            board.apply_move(random.choice(board.get_legal_moves()))
+
+        for depth in range(1, 6):
+            alphabeta.transposition_table = None
+            expected = alphabeta.max_play(board, depth, float("-inf"), float("inf"))
+            alphabeta.transposition_table = table
+            table.clear()
+            self.assertEqual(expected, alphabeta.max_play(
+                board, depth, float("-inf"), float("inf")))
+
+    def test_pvs_and_aspiration_preserve_search_value(self):
+        for seed in range(4):
+            random.seed(seed)
+            moves = []
+            board = Board(RandomPlayer(), RandomPlayer())
+            for _ in range(8):
+                moves.append(random.choice(board.get_legal_moves()))
+                board.apply_move(moves[-1])
+
+            values = []
+            for options in ({}, {"pvs": True}, {"aspiration": 0.5},
+                            {"pvs": True, "aspiration": 1., "in_place": True,
+                             "transposition_table": TranspositionTable(),
+                             "move_ordering": MoveOrdering()}):
+                player = AlphaBetaPlayer(score_fn=improved_score, **options)
+                game = replay(Board, moves, player, RandomPlayer())
+                game.shuffle_moves = False
+                stats = search_to_depth(player, game, 6)
+                values.append(player.root_value)
+            self.assertEqual(1, len(set(values)))
+        self.assertGreater(stats.researches, 0)
+
+    def test_move_ordering_preserves_search_value(self):
+        alphabeta = AlphaBetaPlayer(score_fn=improved_score)
+        alphabeta.time_left = lambda: float("inf")
+        ordering = MoveOrdering()
+        board = Board(alphabeta, RandomPlayer())
+        for _ in range(6):
+            board.apply_move(random.choice(board.get_legal_moves()))
+
+        for depth in range(1, 6):
+            alphabeta.move_ordering = None
+            alphabeta._root_move_count = board.move_count
+            expected = alphabeta.max_play(board, depth, float("-inf"), float("inf"))
+            alphabeta.move_ordering = ordering
+            ordering.new_iteration(board)
+            self.assertEqual(expected, alphabeta.max_play(
+                board, depth, float("-inf"), float("inf")))
+
+        self.assertTrue(ordering.history)
+        best_move = alphabeta.alphabeta(board, 5)
+        ordering.new_iteration(board)
+        self.assertEqual(best_move, ordering.pv[0])
+
+    def test_undo_move_restores_state(self):
+        for board_cls in (Board, BitBoard, CompactBoard):
+            board = board_cls(RandomPlayer(), RandomPlayer())
+            states = []
+            while board.get_legal_moves():
+                states.append((board.to_string(), board.hash(), board.move_count,
+                               board.active_player, board.get_legal_moves()))
+                board.apply_move(random.choice(board.get_legal_moves()))
+
+            while states:
+                board.undo_move()
+                text, key, move_count, active_player, legal_moves = states.pop()
+                self.assertEqual(text, board.to_string())
+                self.assertEqual(key, board.hash())
+                self.assertEqual(move_count, board.move_count)
+                self.assertIs(active_player, board.active_player)
+                self.assertEqual(sorted(legal_moves), sorted(board.get_legal_moves()))
+
+    def test_in_place_search_leaves_board_unchanged(self):
+        for player in (MinimaxPlayer(in_place=True), AlphaBetaPlayer(in_place=True),
+                       competition_agent.CustomPlayer()):
+            test_start = self.time_millis()
+            time_left = lambda: 100 - (self.time_millis() - test_start)
+            board = Board(player, RandomPlayer())
+            board.apply_move(random.choice(board.get_legal_moves()))
+            board.apply_move(random.choice(board.get_legal_moves()))
+            before = board.to_string(), board.hash()
+
+            self.assertIn(player.get_move(board, time_left),
+                          board.get_legal_moves(player))
+            self.assertEqual(before, (board.to_string(), board.hash()))
+            self.assertEqual(2, board.move_count)
+
+    def test_endgame_solver_matches_full_search(self):
+        def negamax(board):
+            moves = board.get_legal_moves()
+            if not moves:
+                return -1
+            return max(-negamax(board.forecast_move(m)) for m in moves)
+
+        solver = EndgameSolver(leaf_nodes=10**6, min_blocked=0)
+        for seed in range(50):
+            random.seed(seed)
+            board = BitBoard(RandomPlayer(), RandomPlayer(), width=5, height=5)
+            while board.get_legal_moves() and not board.is_partitioned():
+                board.apply_move(random.choice(board.get_legal_moves()))
+            if not board.get_legal_moves():
+                continue
+
+            value = negamax(board)
+            self.assertEqual(value > 0,
+                             solver.evaluate(board, board.active_player) > 0)
+            move = solver.best_move(board)
+            self.assertEqual(value, -negamax(board.forecast_move(move)))
+
+        # The same cell indices and region are different cells on another
+        # board size, so the memo must not mix sizes
+        self.assertEqual(7, solver.longest_path(4, 5, 11, 611720))
+        self.assertEqual(4, solver.longest_path(4, 6, 11, 611720))
+
+    def test_search_stops_once_game_is_resolved(self):
+        def negamax(board):
+            moves = board.get_legal_moves()
+            if not moves:
+                return -1
+            return max(-negamax(board.forecast_move(m)) for m in moves)
+
+        for seed in range(20):
+            random.seed(seed)
+            players = (MinimaxPlayer(),
+                       AlphaBetaPlayer(transposition_table=TranspositionTable(),
+                                       move_ordering=MoveOrdering()),
+                       AlphaBetaPlayer(score_fn=improved_score, batch_leaves=True,
+                                       pvs=True, aspiration=1.))
+            for player in players:
+                board = Board(player, RandomPlayer(), width=5, height=5)
+                while len(board.get_blank_spaces()) > 10 and board.get_legal_moves():
+                    board.apply_move(random.choice(board.get_legal_moves()))
+                if board.active_player is not player and board.get_legal_moves():
+                    board.apply_move(random.choice(board.get_legal_moves()))
+                if board.active_player is not player or not board.get_legal_moves():
+                    continue
+
+                test_start = self.time_millis()
+                time_left = lambda: 1000 - (self.time_millis() - test_start)
+                move = player.get_move(board, time_left)
+                self.assertGreater(time_left(), 500)
+                self.assertLessEqual(player.stats.depth, len(board.get_blank_spaces()) + 1)
+                self.assertIn(move, board.get_legal_moves())
+                if negamax(board) > 0:
+                    self.assertEqual(1, -negamax(board.forecast_move(move)))
+
+    def test_opening_book_lookup(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.bin")
+            write_book(path, 5, 5, 2, build_book(5, 5, 2, 20))
+            book = competition_agent.OpeningBook(path)
+            self.assertEqual(len(book_positions(5, 5, 2)), len(book))
+
+            for seed in range(10):
+                random.seed(seed)
+                board = Board(RandomPlayer(), RandomPlayer(), width=5, height=5)
+                for _ in range(seed % 2):
+                    board.apply_move(random.choice(board.get_legal_moves()))
+                move = book.lookup(board)
+                self.assertIn(move, board.get_legal_moves())
+
+                # Symmetric positions get symmetric moves
+                expected, _ = symmetry.canonical_key(board.forecast_move(move))
+                for perm in symmetry.transforms(5, 5):
+                    image = symmetry.transform_board(board, perm)
+                    image_move = book.lookup(image)
+                    self.assertIn(image_move, image.get_legal_moves())
+                    self.assertEqual(expected, symmetry.canonical_key(
+                        image.forecast_move(image_move))[0])
+
+            board.apply_move(random.choice(board.get_legal_moves()))
+            board.apply_move(random.choice(board.get_legal_moves()))
+            self.assertIsNone(book.lookup(board))
+            book.close()
+
+    def test_batch_scores_match_score_functions(self):
+        for seed in range(40):
+            random.seed(seed)
+            player_1, player_2 = RandomPlayer(), RandomPlayer()
+            board = (BitBoard if seed % 2 else Board)(player_1, player_2)
+            for _ in range(seed):
+                if not board.get_legal_moves():
+                    break
+                board.apply_move(random.choice(board.get_legal_moves()))
+            moves = board.get_legal_moves()
+
+            for score_fn, batch_fn in BATCH_SCORES.items():
+                for player in (player_1, player_2):
+                    self.assertEqual(
+                        [score_fn(board.forecast_move(m), player) for m in moves],
+                        child_scores(board, moves, player, batch_fn))
+
+    def test_batch_leaves_preserve_search_value(self):
+        for score_fn in (custom_score, improved_score):
+            results = []
+            for batch_leaves in (False, True):
+                player = AlphaBetaPlayer(score_fn=score_fn, batch_leaves=batch_leaves)
+                player.time_left = lambda: float("inf")
+                board = Board(player, RandomPlayer(), shuffle_moves=False)
+                board.apply_move((3, 3))
+                board.apply_move((2, 4))
+                results.append((player.alphabeta(board, 5), player.root_value))
+            self.assertEqual(results[0], results[1])
+
+        # Leaves that the endgame solver applies to, one move after a parent
+        # it does not apply to, are still solved exactly
+        for seed in (65, 70, 88):
+            results = []
+            for batch_leaves in (False, True):
+                random.seed(seed)
+                player = AlphaBetaPlayer(score_fn=improved_score, batch_leaves=batch_leaves)
+                player.time_left = lambda: float("inf")
+                board = Board(player, RandomPlayer(), 5, 5, shuffle_moves=False)
+                for _ in range(10):
+                    if board.get_legal_moves():
+                        board.apply_move(random.choice(board.get_legal_moves()))
+                player.endgame = EndgameSolver(min_blocked=(board.move_count + 3) / 25)
+                results.append((player.alphabeta(board, 3), player.root_value))
+            self.assertEqual(results[0], results[1])
+
+    def test_search_stats(self):
+        player = AlphaBetaPlayer(transposition_table=TranspositionTable(),
+                                 move_ordering=MoveOrdering())
+        player.stats_log = []
+        board = Board(player, RandomPlayer())
+        board.apply_move((3, 3))
+        board.apply_move((2, 4))
+        test_start = self.time_millis()
+        player.get_move(board, lambda: 100 - (self.time_millis() - test_start))
+
+        stats = player.stats
+        self.assertEqual([stats], player.stats_log)
+        self.assertGreater(stats.depth, 1)
+        self.assertEqual(stats.depth, len(stats.iteration_times))
+        self.assertLessEqual(sum(stats.iteration_nodes), stats.nodes)
+        self.assertLessEqual(stats.leaves, stats.nodes)
+        self.assertLessEqual(stats.first_move_cutoffs, stats.cutoffs)
+        self.assertLessEqual(stats.tt_hits, stats.tt_probes)
+        self.assertGreater(stats.effective_branching_factor, 0)
+        self.assertGreaterEqual(stats.time, sum(stats.iteration_times))
+
+    def test_deadline_checks_clock_every_few_nodes(self):
+        for player in (MinimaxPlayer(), AlphaBetaPlayer()):
+            board = Board(player, RandomPlayer())
+            board.apply_move((3, 3))
+            board.apply_move((2, 4))
+            time_left = Deadline(100)
+            self.assertLessEqual(time_left(), 100)
+            self.assertIn(player.get_move(board, time_left), board.get_legal_moves())
+            self.assertGreaterEqual(time_left(), 0)
+
+            # Far from the deadline the clock is read once every several nodes
+            player.time_left = Deadline(10000)
+            player.new_stats()
+            if isinstance(player, AlphaBetaPlayer):
+                player.alphabeta(board, 4)
+            else:
+                player.minimax(board, 3)
+            self.assertGreater(player._check_interval, 1)
+
+    def test_benchmark_corpus_and_compare(self):
+        corpus = build_corpus(games=3)
+        self.assertEqual(corpus, build_corpus(games=3))
+        for positions in corpus.values():
+            for moves in positions:
+                self.assertTrue(replay(Board, moves).get_legal_moves())
+
+        player, moves = AlphaBetaPlayer(), corpus["middlegame"][0]
+        players = (RandomPlayer(), player) if len(moves) % 2 else (player, RandomPlayer())
+        board = replay(Board, moves, *players)
+        self.assertEqual(search_to_depth(player, board, 3).depth, 3)
+
+        baseline = {"micro": {"Board": {"copy": {"opening": 100.}}},
+                    "macro": {"AB": {"nodes": 10, "nodes_per_sec": 1000.}}}
+        results = {"micro": {"Board": {"copy": {"opening": 105.}}},
+                   "macro": {"AB": {"nodes": 20, "nodes_per_sec": 800.}}}
+        self.assertEqual([path for path, *_ in compare(results, baseline, 0.1)],
+                         ["macro.AB.nodes_per_sec"])
+        self.assertEqual(len(compare(results, baseline, 0.01)), 2)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,373 @@
+"""Benchmark the board engines and the search agents.
+
+Two groups of benchmarks run on a fixed corpus of positions, built from
+seeded random games so that every run measures the same positions:
+
+- micro: the time of one call of each board operation (`get_legal_moves`,
+  `forecast_move`, `copy`, `hash`, `apply_move` followed by `undo_move`) and
+  of each score function, per game phase (opening, middlegame, endgame) and
+  board engine;
+- macro: iterative deepening searches to a fixed depth from the middlegame
+  positions, reporting the cumulative time to reach each depth and the
+  search speed in nodes per second.
+
+With `--scaling`, both groups run instead on square boards of increasing
+size (from 7x7 to 20x20), each with its own corpus, to show how the costs
+grow with the board area.
+
+The results are written as JSON. With `--compare`, the results are checked
+against a saved baseline and every metric that got worse by more than the
+threshold is reported as a regression.
+
+Usage:
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json
+    python benchmark.py --scaling --output scaling.json
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import timeit
+
+from isolation import Board, BitBoard, CompactBoard, Deadline
+from sample_players import (RandomPlayer, open_move_score, improved_score,
+                            center_score)
+from game_agent import (MinimaxPlayer, AlphaBetaPlayer, MoveOrdering,
+                        TranspositionTable, custom_score, custom_score_2,
+                        custom_score_3)
+
+CORPUS_SEED = 20170401
+CORPUS_GAMES = 10  # number of positions in each game phase
+PHASES = ("opening", "middlegame", "endgame")
+
+NUMBER = 200  # calls of each operation per timing
+REPEAT = 5  # timings per operation; the fastest one is reported
+THRESHOLD = 0.1  # relative change reported as a regression
+SCALING_SIZES = (7, 9, 11, 15, 20)  # board sizes of the scaling benchmarks
+
+ENGINES = {"Board": Board, "BitBoard": BitBoard, "CompactBoard": CompactBoard}
+
+SCORE_FUNCTIONS = [open_move_score, improved_score, center_score,
+                   custom_score, custom_score_2, custom_score_3]
+
+# Search agents of the macro benchmarks and the depth each one searches to
+SEARCH_AGENTS = {
+    "MM": (lambda: MinimaxPlayer(), 4),
+    "AB": (lambda: AlphaBetaPlayer(), 6),
+    "AB_Tuned": (lambda: AlphaBetaPlayer(in_place=True,
+                                         transposition_table=TranspositionTable(),
+                                         move_ordering=MoveOrdering(),
+                                         batch_leaves=True), 6),
+    "AB_PVS": (lambda: AlphaBetaPlayer(in_place=True,
+                                       transposition_table=TranspositionTable(),
+                                       move_ordering=MoveOrdering(),
+                                       batch_leaves=True, pvs=True,
+                                       aspiration=1.), 6),
+}
+
+DESCRIPTION = """
+This script times the board operations, the score functions and fixed-depth
+searches on a fixed corpus of positions, and saves the results as JSON or
+compares them to a saved baseline.
+"""
+
+
+def build_corpus(seed=CORPUS_SEED, games=CORPUS_GAMES, width=7, height=7):
+    """Return the corpus of positions as lists of moves from the empty board,
+    grouped by game phase.
+
+    Each seeded random game contributes one position to each phase: the
+    opening is taken right after both players are placed, the middlegame
+    halfway through the game and the endgame three plies before its end.
+    Every position has at least one legal move.
+    """
+    rng = random.Random(seed)
+    corpus = {phase: [] for phase in PHASES}
+    while len(corpus["opening"]) < games:
+        board = Board(RandomPlayer(), RandomPlayer(), width, height,
+                      shuffle_moves=False)
+        moves = []
+        while board.get_legal_moves():
+            moves.append(rng.choice(board.get_legal_moves()))
+            board.apply_move(moves[-1])
+        if len(moves) < 8:
+            continue
+        corpus["opening"].append(moves[:2 + rng.randrange(2)])
+        corpus["middlegame"].append(moves[:len(moves) // 2])
+        corpus["endgame"].append(moves[:len(moves) - 3])
+    return corpus
+
+
+def replay(board_cls, moves, player_1=None, player_2=None, width=7, height=7):
+    """Return a new board of class `board_cls` with `moves` applied. """
+    board = board_cls(player_1 or RandomPlayer(), player_2 or RandomPlayer(),
+                      width, height)
+    for move in moves:
+        board.apply_move(move)
+    return board
+
+
+def board_operations():
+    """Return the benchmarked board operations, keyed by name; each takes a
+    board and one of its legal moves, and leaves the board unchanged.
+    """
+    def apply_undo(board, move):
+        board.apply_move(move)
+        board.undo_move()
+
+    return {
+        "get_legal_moves": lambda board, move: board.get_legal_moves(),
+        "forecast_move": lambda board, move: board.forecast_move(move),
+        "copy": lambda board, move: board.copy(),
+        "hash": lambda board, move: board.hash(),
+        "apply_move+undo_move": apply_undo,
+    }
+
+
+def time_calls(fn, cases, number, repeat):
+    """Return the fastest time in nanoseconds of one call of `fn` on each of
+    the `(board, move)` pairs of `cases`, averaged over the pairs.
+    """
+    def run():
+        for _ in range(number):
+            for board, move in cases:
+                fn(board, move)
+
+    best = min(timeit.repeat(run, number=1, repeat=repeat))
+    return 1e9 * best / (number * len(cases))
+
+
+def micro_benchmarks(corpus, number=NUMBER, repeat=REPEAT, width=7, height=7):
+    """Time every board operation and score function on every engine, on a
+    corpus of positions of a `width` x `height` board.
+
+    Returns
+    -------
+    dict
+        `{engine: {operation: {phase: nanoseconds per call}}}`.
+    """
+    results = dict()
+    operations = board_operations()
+    for name, board_cls in ENGINES.items():
+        engine_results = results[name] = dict()
+        boards = {phase: [replay(board_cls, moves, width=width, height=height)
+                          for moves in positions]
+                  for phase, positions in corpus.items()}
+        cases = {phase: [(board, board.get_legal_moves()[0]) for board in phase_boards]
+                 for phase, phase_boards in boards.items()}
+
+        for op_name, op in operations.items():
+            engine_results[op_name] = {
+                phase: time_calls(op, phase_cases, number, repeat)
+                for phase, phase_cases in cases.items()}
+
+        for score_fn in SCORE_FUNCTIONS:
+            op = lambda board, move: score_fn(board, board.active_player)
+            engine_results[score_fn.__name__] = {
+                phase: time_calls(op, phase_cases, number, repeat)
+                for phase, phase_cases in cases.items()}
+    return results
+
+
+def search_to_depth(player, game, depth):
+    """Run the iterative deepening search of `player` from `game` without a
+    time limit up to `depth` and return its `SearchStats`.
+    """
+    # A distant deadline, so the clock is checked as in a timed game
+    player.time_left = Deadline(1e9)
+    stats = player.new_stats()
+    if isinstance(player, AlphaBetaPlayer):
+        player.new_search(game)
+    for d in range(1, depth + 1):
+        if isinstance(player, AlphaBetaPlayer):
+            player.deepen(game, d)
+        else:
+            player.minimax(game, d)
+        stats.complete_iteration(d)
+    stats.finish()
+    return stats
+
+
+def macro_benchmarks(corpus, board_cls=BitBoard, width=7, height=7):
+    """Search every middlegame position of the corpus, on a `width` x
+    `height` board, to a fixed depth with each search agent.
+
+    Returns
+    -------
+    dict
+        `{agent: {"nodes": total nodes, "nodes_per_sec": speed,
+        "time_to_depth": {depth: seconds}}}`, where the time to a depth is
+        the total over the positions of the time needed to complete all the
+        iterations up to that depth.
+    """
+    results = dict()
+    for name, (make_player, depth) in SEARCH_AGENTS.items():
+        nodes = 0
+        times = [0.] * depth
+        for moves in corpus["middlegame"]:
+            player = make_player()
+            players = (RandomPlayer(), player) if len(moves) % 2 else (player, RandomPlayer())
+            game = replay(board_cls, moves, *players, width=width, height=height)
+            game.shuffle_moves = False
+
+            stats = search_to_depth(player, game, depth)
+            nodes += stats.nodes
+            elapsed = 0.
+            for d, iteration_time in enumerate(stats.iteration_times):
+                elapsed += iteration_time
+                times[d] += elapsed
+
+        results[name] = {
+            "nodes": nodes,
+            "nodes_per_sec": nodes / times[-1],
+            "time_to_depth": {str(d + 1): t for d, t in enumerate(times)},
+        }
+    return results
+
+
+def run_benchmarks(number=NUMBER, repeat=REPEAT, scaling=False):
+    """Run all benchmarks, or the scaling benchmarks if `scaling` is True,
+    and return the results as a JSON-ready dict.
+    """
+    meta = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "corpus_seed": CORPUS_SEED,
+        "corpus_games": CORPUS_GAMES,
+        "number": number,
+        "repeat": repeat,
+    }
+    if scaling:
+        return {"meta": meta, "scaling": scaling_benchmarks(number=number, repeat=repeat)}
+    corpus = build_corpus()
+    return {
+        "meta": meta,
+        "micro": micro_benchmarks(corpus, number, repeat),
+        "macro": macro_benchmarks(corpus),
+    }
+
+
+def scaling_benchmarks(sizes=SCALING_SIZES, number=NUMBER, repeat=REPEAT):
+    """Run the micro and macro benchmarks on square boards of each size.
+
+    Returns
+    -------
+    dict
+        `{"<size>x<size>": {"micro": ..., "macro": ...}}`, in the formats of
+        `micro_benchmarks()` and `macro_benchmarks()`.
+    """
+    results = dict()
+    for size in sizes:
+        corpus = build_corpus(width=size, height=size)
+        results["{0}x{0}".format(size)] = {
+            "micro": micro_benchmarks(corpus, number, repeat, size, size),
+            "macro": macro_benchmarks(corpus, width=size, height=size),
+        }
+    return results
+
+
+def flatten(results, prefix=""):
+    """Return the numeric metrics of a results dict keyed by dotted path. """
+    metrics = dict()
+    for key, value in results.items():
+        path = prefix + key
+        if isinstance(value, dict):
+            metrics.update(flatten(value, path + "."))
+        elif path.startswith(("micro.", "macro.", "scaling.")) and \
+                not path.endswith(".nodes"):
+            metrics[path] = value
+    return metrics
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """Compare the metrics of `results` to those of `baseline`.
+
+    Speeds (`nodes_per_sec`) should not decrease and every other metric is
+    a time that should not increase.
+
+    Returns
+    -------
+    list<(str, float, float, float)>
+        The regressions as `(metric, baseline value, new value, relative
+        change)`, where the change is positive when the metric got worse.
+    """
+    current = flatten(results)
+    regressions = []
+    for path, old in sorted(flatten(baseline).items()):
+        new = current.get(path)
+        if new is None or not old:
+            continue
+        change = (new - old) / old
+        if path.endswith("nodes_per_sec"):
+            change = -change
+        if change > threshold:
+            regressions.append((path, old, new, change))
+    return regressions
+
+
+def print_results(results):
+    """Print the benchmark results as tables. """
+    if "scaling" in results:
+        for size, size_results in results["scaling"].items():
+            print("\n{:-^74}".format(" {} ".format(size)))
+            print_results(size_results)
+        return
+
+    for engine, operations in results["micro"].items():
+        print("\n{:<24}{:>12}{:>12}{:>12}   (ns per call, {})".format(
+            "Operation", *PHASES, engine))
+        for op_name, phases in operations.items():
+            print("{:<24}{:>12.0f}{:>12.0f}{:>12.0f}".format(
+                op_name, *(phases[phase] for phase in PHASES)))
+
+    print("\n{:<12}{:>12}{:>14}   time to depth (s)".format("Agent", "Nodes", "Nodes/s"))
+    for name, result in results["macro"].items():
+        print("{:<12}{:>12}{:>14.0f}   {}".format(
+            name, result["nodes"], result["nodes_per_sec"],
+            " ".join("{}:{:.3f}".format(d, t)
+                     for d, t in result["time_to_depth"].items())))
+
+
+def main(args):
+    print(DESCRIPTION)
+    results = run_benchmarks(args.number, args.repeat, args.scaling)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print("\nResults written to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.threshold)
+        if not regressions:
+            print("\nNo regressions against {}".format(args.compare))
+            return 0
+        print("\n{} regressions against {}:".format(len(regressions), args.compare))
+        for path, old, new, change in regressions:
+            print("  {:<52}{:>14.4g} -> {:<14.4g}({:+.1%})".format(path, old, new, change))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("-o", "--output", default=None,
+                        help="file to save the results to as JSON")
+    parser.add_argument("-c", "--compare", default=None,
+                        help="JSON results of an earlier run to compare against")
+    parser.add_argument("-t", "--threshold", type=float, default=THRESHOLD,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument("-n", "--number", type=int, default=NUMBER,
+                        help="calls of each operation per timing")
+    parser.add_argument("-r", "--repeat", type=int, default=REPEAT,
+                        help="timings per operation (the fastest is kept)")
+    parser.add_argument("-s", "--scaling", action="store_true",
+                        help="benchmark square boards from 7x7 to 20x20 instead")
+    sys.exit(main(parser.parse_args()))
@@ -1,15 +1,259 @@
+import mmap
+import os
 import random
 import itertools
+import struct
+import time
 
 from isolation import Board
 from game_agent import AlphaBetaPlayer
 from sample_players import improved_score
 
+# The PvP competition only ships this file (and data.json) next to the stock
+# `isolation` package, so the symmetry helpers below are local copies of
+# those in `isolation.symmetry` and `isolation.zobrist` that only use the
+# public `Board` API. The keys must stay identical to those of
+# `isolation.zobrist` for the hashes to match the opening book.
+_KEYS = {}
+_TRANSFORMS = {}
+
+# Target time between two clock reads of a search given a deadline, and the
+# largest number of nodes searched between them; see `game_agent.py`
+CHECK_PERIOD_NS = 200000
+MAX_CHECK_INTERVAL = 4096
+
+# The opening book file format; `opening_book.py` writes books with these
+MAGIC = b"ISOBOOK\x01"
+BOOK_FILE = "data.json"
+BOOK_HEADER = struct.Struct("<8sHHHxxI")
+BOOK_SLOT = struct.Struct("<QBBxxf")
+EMPTY_SLOT = 0xFF
+
+
+def zobrist_keys(width, height):
+    """Return the Zobrist keys `(cells, locations, initiative)` of a board of
+    the given size; see `isolation.zobrist.zobrist_keys()`.
+    """
+    key = (width, height)
+    if key not in _KEYS:
+        size = width * height
+        rng = random.Random(size * 1000003 + height)
+        cells = tuple(rng.getrandbits(64) for _ in range(size))
+        locations = (tuple(rng.getrandbits(64) for _ in range(size)),
+                     tuple(rng.getrandbits(64) for _ in range(size)))
+        _KEYS[key] = (cells, locations, rng.getrandbits(64))
+    return _KEYS[key]
+
+
+def transforms(width, height):
+    """Return the symmetry transforms of a board of the given size as
+    permutation tables over the cell indices `row + col * height`; see
+    `isolation.symmetry.transforms()`.
+    """
+    key = (width, height)
+    if key not in _TRANSFORMS:
+        h, w = height - 1, width - 1
+        maps = [lambda r, c: (r, c),
+                lambda r, c: (h - r, c),
+                lambda r, c: (r, w - c),
+                lambda r, c: (h - r, w - c)]
+        if width == height:
+            maps += [lambda r, c: (c, r),
+                     lambda r, c: (w - c, h - r),
+                     lambda r, c: (c, h - r),
+                     lambda r, c: (w - c, r)]
+
+        cells = [(idx % height, idx // height) for idx in range(width * height)]
+        _TRANSFORMS[key] = tuple(
+            tuple(nr + nc * height for nr, nc in (f(r, c) for r, c in cells))
+            for f in maps)
+    return _TRANSFORMS[key]
+
+
+def inverse(perm):
+    """Return the permutation table of the inverse transform. """
+    inv = [0] * len(perm)
+    for idx, image in enumerate(perm):
+        inv[image] = idx
+    return tuple(inv)
+
+
+def transform_move(game, perm, move):
+    """Return the image of `move` (a (row, column) pair) under `perm`. """
+    idx = perm[move[0] + move[1] * game.height]
+    return (idx % game.height, idx // game.height)
+
+
+def transform_keys(game):
+    """Return the Zobrist hash of each image of `game` under the transforms
+    of `transforms()`, in the same order.
+    """
+    height = game.height
+    cell_keys, location_keys, initiative_key = zobrist_keys(game.width, height)
+    blank = set(r + c * height for r, c in game.get_blank_spaces())
+    blocked = [idx for idx in range(game.width * height) if idx not in blank]
+
+    initiative = game.move_count % 2
+    if initiative:
+        players = (game.inactive_player, game.active_player)
+    else:
+        players = (game.active_player, game.inactive_player)
+    locations = []
+    for player in players:
+        loc = game.get_player_location(player)
+        locations.append(None if loc is Board.NOT_MOVED else loc[0] + loc[1] * height)
+
+    base = initiative_key if initiative else 0
+    keys = []
+    for perm in transforms(game.width, height):
+        key = base
+        for idx in blocked:
+            key ^= cell_keys[perm[idx]]
+        for player, idx in enumerate(locations):
+            if idx is not None:
+                key ^= location_keys[player][perm[idx]]
+        keys.append(key)
+    return tuple(keys)
+
+
+def child_keys(game, keys, move):
+    """Return the transform keys of `game.forecast_move(move)` from the
+    transform keys `keys` of `game`, in a few XORs per transform.
+    """
+    height = game.height
+    cell_keys, location_keys, initiative_key = zobrist_keys(game.width, height)
+    own_keys = location_keys[game.move_count % 2]
+    idx = move[0] + move[1] * height
+    last = game.get_player_location(game.active_player)
+    perms = transforms(game.width, height)
+    if last is Board.NOT_MOVED:
+        return tuple(key ^ cell_keys[perm[idx]] ^ own_keys[perm[idx]] ^ initiative_key
+                     for key, perm in zip(keys, perms))
+    last = last[0] + last[1] * height
+    return tuple(key ^ own_keys[perm[last]] ^ cell_keys[perm[idx]] ^
+                 own_keys[perm[idx]] ^ initiative_key
+                 for key, perm in zip(keys, perms))
+
+
+def canonical_key(game):
+    """Return the canonical hash of `game` under its symmetry group and the
+    transform mapping `game` onto the canonical position; equal to
+    `isolation.symmetry.canonical_key(game)`.
+    """
+    keys = transform_keys(game)
+    best = min(keys)
+    return best, transforms(game.width, game.height)[keys.index(best)]
+
 
 class SearchTimeout(Exception):
+    """Subclass base exception for code clarity. """
     pass
 
 
+def check_time(player):
+    """Raise `SearchTimeout` if the search of `player` is out of time.
+
+    A copy of `game_agent.check_time()`, which the stock `game_agent.py` of
+    the competition does not have. The searches call this every
+    `player._check_interval` nodes. If `player.time_left` has a `deadline_ns`
+    attribute the clock is read directly and the interval adapts to about
+    `CHECK_PERIOD_NS` between reads; otherwise `time_left()` is called at
+    every node.
+    """
+    player._countdown = 1
+    time_left = player.time_left
+    deadline_ns = getattr(time_left, "deadline_ns", None)
+    if deadline_ns is None:
+        if time_left() < player.TIMER_THRESHOLD: raise SearchTimeout()
+        return
+
+    now = time.monotonic_ns()
+    remaining = deadline_ns - int(player.TIMER_THRESHOLD * 1000000) - now
+    if remaining <= 0:
+        raise SearchTimeout()
+
+    elapsed = max(now - player._last_check_ns, 1)
+    player._last_check_ns = now
+    interval = player._check_interval
+    interval = interval * min(CHECK_PERIOD_NS, remaining // 2) // elapsed
+    interval = max(1, min(interval, 2 * player._check_interval, MAX_CHECK_INTERVAL))
+    player._check_interval = player._countdown = interval
+
+
+class OpeningBook:
+    """A read-only opening book backed by a memory-mapped book file written
+    by `opening_book.py`.
+
+    The file is a header (magic, width, height, plies, number of slots)
+    followed by an open-addressing hash table with linear probing, keyed by
+    the canonical hash of each position and holding the move for the
+    canonical position; see `opening_book.py` for the layout.
+
+    Parameters
+    ----------
+    path : str
+        The name of the book file.
+
+    Raises
+    ------
+    ValueError
+        If the file is not an opening book.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as book_file:
+            self._data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.width, self.height, self.plies, self.size = \
+            BOOK_HEADER.unpack_from(self._data)
+        if magic != MAGIC:
+            self._data.close()
+            raise ValueError("Not an opening book: {}".format(path))
+
+    def __getstate__(self):
+        # Memory maps cannot be pickled; processes reopen the file instead
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+    def __len__(self):
+        return sum(1 for idx in range(self.size) if self._slot(idx)[1] != EMPTY_SLOT)
+
+    def close(self):
+        """Unmap the book file. """
+        self._data.close()
+
+    def _slot(self, idx):
+        return BOOK_SLOT.unpack_from(self._data, BOOK_HEADER.size + idx * BOOK_SLOT.size)
+
+    def probe(self, key):
+        """Return the entry `(row, col, score)` stored for the canonical hash
+        `key`, or None.
+        """
+        idx = key % self.size
+        while True:
+            slot_key, row, col, score = self._slot(idx)
+            if row == EMPTY_SLOT:
+                return None
+            if slot_key == key:
+                return row, col, score
+            idx = (idx + 1) % self.size
+
+    def lookup(self, game):
+        """Return the book move for `game`, or None if the position is not in
+        the book.
+        """
+        if (game.width, game.height) != (self.width, self.height) or \
+                game.move_count >= self.plies:
+            return None
+
+        key, perm = canonical_key(game)
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        return transform_move(game, inverse(perm), entry[:2])
+
+
 def custom_score(game, player):
     if game.is_loser(player):
         return float("-inf")
@@ -21,17 +265,6 @@ def custom_score(game, player):
     return float(len(own_moves) - len(opp_moves))
 
 
-def get_board_clockwise_rotation(game):
-    rotated = game.copy()
-
-    for j in range(game.height):
-        for i in range(game.height):
-            rotated._board_state[(game.height-1-j) + i*game.height] = \
-                game._board_state[j*game.height + i]
-
-    return rotated
-
-
 class CustomPlayer:
     """Game-playing agent to use in the optional player vs player Isolation
     competition.
@@ -47,26 +280,56 @@ class CustomPlayer:
 
     Parameters
     ----------
-    data : string
-        The name of the search method to use in get_move().
+    data : string (optional)
+        The name of an opening book file written by `opening_book.py`. If
+        None, the `data.json` file next to this module is used when it
+        exists, and the player searches every move otherwise.
 
     timeout : float (optional)
         Time remaining (in milliseconds) when search is aborted.  Note that
         the PvP competition uses more accurate timers that are not cross-
         platform compatible, so a limit of 1ms (vs 10ms for the other classes)
         is generally sufficient.
+
+    The search advances the board it is given in place and takes the moves
+    back with `undo_move()` when the board has that method, as the boards of
+    this repository do, so that a node costs the same on any board size. The
+    stock `Board` has no `undo_move()`, and the search copies it with
+    `forecast_move()` at every node instead.
     """
 
     def __init__(self, data=None, timeout=1.):
         self.score = custom_score
         self.time_left = None
         self.TIMER_THRESHOLD = timeout
+        self.in_place = False
         self.saved_games = dict()
         self.reached_nodes = 0
+        self._countdown = self._check_interval = 1
+        self._last_check_ns = 0
+
+        if data is None:
+            data = os.path.join(os.path.dirname(os.path.abspath(__file__)), BOOK_FILE)
+            if not os.path.exists(data):
+                data = None
+        self.book = OpeningBook(data) if data is not None else None
 
     def get_move(self, game, time_left):
         self.time_left = time_left
         best_move = (-1, -1)
+        self.in_place = hasattr(game, "undo_move")
+        move_count = game.move_count
+
+        # Delete the scores of the last move's search here rather than in
+        # every iteration: freeing a large table takes milliseconds on big
+        # boards, and the scores do not depend on the search depth
+        self.saved_games = dict()
+        self.reached_nodes = 0
+
+        if self.book is not None:
+            book_move = self.book.lookup(game)
+            if book_move is not None and book_move in game.get_legal_moves(self):
+                return book_move
 
         reached_depth = 0
 
@@ -78,22 +341,40 @@ class CustomPlayer:
                 # print("Move: " + str(game.move_count) + ", depth: " + str(reached_depth) +
                 #      ", saved states " + str(len(self.saved_games)) + ", nodes: " + str(self.reached_nodes))
         except SearchTimeout:
-            pass
+            # Take back the moves of the interrupted search
+            while self.in_place and game.move_count > move_count:
+                game.undo_move()
 
         return best_move
 
+    def forecast(self, game, move):
+        """Return the successor of `game` after `move`; in place mode this is
+        `game` itself and must be paired with a call to `retract()`.
+        """
+        if self.in_place:
+            game.apply_move(move)
+            return game
+        return game.forecast_move(move)
+
+    def retract(self, game):
+        """Undo the move applied by the matching call to `forecast()`. """
+        if self.in_place:
+            game.undo_move()
+
     def alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf")):
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
 
         legal_moves = game.get_legal_moves(self)
         best_move = legal_moves[0] if legal_moves else (-1, -1)
         best_score = float("-inf")
-
-        self.saved_games = dict()  # delete the old search scores
-        self.reached_nodes = 0
+        keys = transform_keys(game)
 
         for move in legal_moves:
-            score = self.min_play(game.forecast_move(move), depth - 1, alpha, beta)
+            move_keys = child_keys(game, keys, move)
+            score = self.min_play(self.forecast(game, move), depth - 1, alpha, beta,
+                                  move_keys)
+            self.retract(game)
 
             if score > best_score:
                 best_score = score
@@ -103,56 +384,59 @@ class CustomPlayer:
 
         return best_move
 
-    def min_play(self, game, depth, alpha, beta):
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+    def min_play(self, game, depth, alpha, beta, keys):
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
 
         legal_moves = game.get_legal_moves()
         value = float("inf")
 
         if not legal_moves or depth == 0:
-            return self.calculate_game(game)
+            return self.calculate_game(game, keys)
 
         for move in legal_moves:
-            value = min(value, self.max_play(game.forecast_move(move), depth - 1, alpha, beta))
+            move_keys = child_keys(game, keys, move)
+            value = min(value, self.max_play(self.forecast(game, move), depth - 1, alpha, beta,
+                                             move_keys))
+            self.retract(game)
             if value <= alpha: return value
             beta = min(beta, value)
 
         return value
 
-    def max_play(self, game, depth, alpha, beta):
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+    def max_play(self, game, depth, alpha, beta, keys):
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
 
         legal_moves = game.get_legal_moves()
         value = float("-inf")
 
         if not legal_moves or depth == 0:
-            return self.calculate_game(game)
+            return self.calculate_game(game, keys)
 
         for move in legal_moves:
-            value = max(value, self.min_play(game.forecast_move(move), depth - 1, alpha, beta))
+            move_keys = child_keys(game, keys, move)
+            value = max(value, self.min_play(self.forecast(game, move), depth - 1, alpha, beta,
+                                             move_keys))
+            self.retract(game)
             if value >= beta: return value
             alpha = max(alpha, value)
 
         return value
 
-    def calculate_game(self, game):
-        # Check if we have this board's score handy and return if we do
-        if game.hash() in self.saved_games:
-            return self.saved_games[game.hash()]
+    def calculate_game(self, game, keys):
+        # Check if we have the score of this board, or of any rotation or
+        # reflection of it, handy and return if we do. The canonical key is
+        # the smallest of the transform keys maintained along the search path
+        key = min(keys)
+        if key in self.saved_games:
+            return self.saved_games[key]
 
-        # Approximate the score
+        # Approximate the score and save it for all the symmetric boards
         score = self.score(game, self)
-
-        # Save the calculated score for all the rotated boards
-        self.saved_games[game.hash()] = score
+        self.saved_games[key] = score
         self.reached_nodes += 1
 
-
-        rotated = game
-        for i in range(3):
-            rotated = get_board_clockwise_rotation(rotated)
-            self.saved_games[rotated.hash()] = score
-
         return score
 
 
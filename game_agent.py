@@ -1,12 +1,59 @@
 import itertools
+import math
+import time
+from array import array
+from collections import namedtuple
+
 from isolation import Board
 from sample_players import RandomPlayer, open_move_score, improved_score
 
+# Target time between two clock reads of a search given a deadline, and the
+# largest number of nodes searched between them
+CHECK_PERIOD_NS = 200000
+MAX_CHECK_INTERVAL = 4096
+
+
 class SearchTimeout(Exception):
     """Subclass base exception for code clarity. """
     pass
 
 
+def check_time(player):
+    """Raise `SearchTimeout` if the search of `player` is out of time.
+
+    The searches call this every `player._check_interval` nodes, counting
+    down `player._countdown`. If `player.time_left` has a `deadline_ns`
+    attribute (see `isolation.Deadline`), the clock is read directly and the
+    interval is recalibrated from the measured time per node so that the
+    clock is read about every `CHECK_PERIOD_NS` nanoseconds, and at least
+    twice in the time left before the stop -- `player.TIMER_THRESHOLD`
+    milliseconds before the deadline. Otherwise `time_left()` is called at
+    every node.
+    """
+    # Check again at the next node unless the interval is recalibrated, also
+    # when raising, so that the next search does not count down past zero
+    player._countdown = 1
+    time_left = player.time_left
+    deadline_ns = getattr(time_left, "deadline_ns", None)
+    if deadline_ns is None:
+        if time_left() < player.TIMER_THRESHOLD: raise SearchTimeout()
+        return
+
+    now = time.monotonic_ns()
+    remaining = deadline_ns - int(player.TIMER_THRESHOLD * 1000000) - now
+    if remaining <= 0:
+        raise SearchTimeout()
+
+    # The first check of a search measures the time since the last search,
+    # which only shrinks the interval; it grows back at most twofold per check
+    elapsed = max(now - player._last_check_ns, 1)
+    player._last_check_ns = now
+    interval = player._check_interval
+    interval = interval * min(CHECK_PERIOD_NS, remaining // 2) // elapsed
+    interval = max(1, min(interval, 2 * player._check_interval, MAX_CHECK_INTERVAL))
+    player._check_interval = player._countdown = interval
+
+
 def custom_score(game, player):
     """Calculate the heuristic value of a game state from the point of view
     of the given player.
@@ -112,6 +159,340 @@ def custom_score_3(game, player):
     return float(max(0, own_moves - 2 * opp_moves))
 
 
+# The mobility scores written in terms of move counts for
+# `AlphaBetaPlayer(batch_leaves=True)`: each maps the player's number of legal
+# moves, the opponent's and the number of moves they share to the score of a
+# non-terminal position
+BATCH_SCORES = {
+    open_move_score: lambda own, opp, shared: own,
+    improved_score: lambda own, opp, shared: own - opp,
+    custom_score: lambda own, opp, shared: own - opp,
+    custom_score_2: lambda own, opp, shared: 2 * own - shared - opp,
+    custom_score_3: lambda own, opp, shared: max(0, own - 2 * opp),
+}
+
+
+TTEntry = namedtuple("TTEntry", ["key", "depth", "score", "flag", "move", "generation"])
+
+# Depth of an empty `TranspositionTable` slot, and the packed empty move
+_EMPTY = -1
+_NO_MOVE = -1
+
+
+class TranspositionTable:
+    """Fixed-size table of alpha-beta search results keyed by `Board.hash()`.
+
+    Each position maps to a single slot (`key % size`), so the table never
+    holds more than `size` entries. An entry records the remaining depth that
+    was searched below the position, the score found, whether that score is
+    exact or only a lower or upper bound (because the search failed high or
+    low), and the best move, which the search tries first when it meets the
+    position again.
+
+    The fields of the entries are kept in one `array` each, with the move
+    packed as `row << 8 | col`, instead of a list of entry objects: the
+    garbage collector never scans arrays, while every full collection walks
+    a list of `size` slots, which takes longer than the search margin once
+    the table is large.
+
+    Parameters
+    ----------
+    size : int (optional)
+        The number of slots in the table.
+
+    replacement : str (optional)
+        The policy used when a result maps to a slot holding a different
+        position. "depth" keeps the existing entry if it was stored by the
+        current search with a greater depth; "always" overwrites it.
+    """
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    REPLACEMENT_POLICIES = ("depth", "always")
+
+    def __init__(self, size=2**18, replacement="depth"):
+        if replacement not in TranspositionTable.REPLACEMENT_POLICIES:
+            raise ValueError("Unknown replacement policy: {}".format(replacement))
+        self.size = size
+        self.replacement = replacement
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        """Remove every entry from the table. """
+        size = self.size
+        self._keys = array("Q", bytes(8 * size))
+        self._depths = array("i", [_EMPTY]) * size
+        self._scores = array("d", bytes(8 * size))
+        self._flags = array("b", bytes(size))
+        self._moves = array("i", bytes(4 * size))
+        self._generations = array("I", bytes(4 * size))
+
+    def new_search(self):
+        """Mark all current entries as belonging to an earlier search, so the
+        "depth" policy may replace them.
+        """
+        self.generation += 1
+
+    def lookup(self, key):
+        """Return the `TTEntry` stored for `key`, or None. """
+        idx = key % self.size
+        if self._depths[idx] == _EMPTY or self._keys[idx] != key:
+            return None
+        move = self._moves[idx]
+        return TTEntry(key, self._depths[idx], self._scores[idx], self._flags[idx],
+                       None if move == _NO_MOVE else (move >> 8, move & 0xFF),
+                       self._generations[idx])
+
+    def probe(self, key, depth, alpha, beta):
+        """Look up a position during the search.
+
+        Returns
+        -------
+        (float or None, (int, int) or None)
+            The stored score if it was searched at least `depth` plies deep
+            and its bound resolves the (alpha, beta) window, or None; and the
+            stored best move, or None.
+        """
+        idx = key % self.size
+        entry_depth = self._depths[idx]
+        if entry_depth == _EMPTY or self._keys[idx] != key:
+            return None, None
+
+        move = self._moves[idx]
+        move = None if move == _NO_MOVE else (move >> 8, move & 0xFF)
+        if entry_depth >= depth:
+            score = self._scores[idx]
+            flag = self._flags[idx]
+            if (flag == TranspositionTable.EXACT or
+                    flag == TranspositionTable.LOWER and score >= beta or
+                    flag == TranspositionTable.UPPER and score <= alpha):
+                return score, move
+
+        return None, move
+
+    def store(self, key, depth, score, alpha, beta, move):
+        """Record the result of searching a position `depth` plies deep with
+        the window (alpha, beta).
+        """
+        if score <= alpha:
+            flag = TranspositionTable.UPPER
+        elif score >= beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+
+        idx = key % self.size
+        if (self.replacement == "depth" and self._depths[idx] > depth and
+                self._generations[idx] == self.generation and
+                self._keys[idx] != key):
+            return
+
+        self._keys[idx] = key
+        self._depths[idx] = depth
+        self._scores[idx] = score
+        self._flags[idx] = flag
+        self._moves[idx] = _NO_MOVE if move is None else move[0] << 8 | move[1]
+        self._generations[idx] = self.generation
+
+
+class MoveOrdering:
+    """Move ordering for alpha-beta search, which tries the moves most likely
+    to cause a cutoff first:
+
+    1. the move played from the position in the principal variation (PV) of
+       the previous iterative deepening pass,
+    2. the best move stored in the transposition table (the hash move),
+    3. the killer moves that caused a beta cutoff at the same ply,
+    4. the remaining moves by their history score, which accumulates
+       `depth ** 2` for every cutoff caused by a move to that destination
+       cell.
+
+    Parameters
+    ----------
+    num_killers : int (optional)
+        The number of killer moves remembered per ply.
+
+    history_decay : float (optional)
+        Factor applied to all history scores at the start of every move, so
+        that cutoffs from earlier in the game gradually lose weight.
+    """
+    HASH_MOVE_PRIORITY = 2e18
+    KILLER_PRIORITY = 1e18
+
+    def __init__(self, num_killers=2, history_decay=0.5):
+        self.num_killers = num_killers
+        self.history_decay = history_decay
+        self.history = dict()
+        self.killers = []
+        self.pv = []
+        self._pv_moves = dict()
+        self._lines = []
+
+    def new_search(self):
+        """Reset the per-move state before searching a new position. """
+        self.killers = []
+        self.pv = []
+        self._pv_moves = dict()
+        self._lines = []
+        for move in self.history:
+            self.history[move] *= self.history_decay
+
+    def new_iteration(self, game):
+        """Remember the PV found by the previous iterative deepening pass from
+        the root `game` so that the next pass searches it first.
+        """
+        self.pv = self._lines[0] if self._lines else []
+        self._pv_moves = dict()
+        for move in self.pv:
+            self._pv_moves[game.hash()] = move
+            game = game.forecast_move(move)
+
+    def clear_pv(self, ply):
+        """Start an empty PV for the node being searched at `ply`. """
+        lines = self._lines
+        while len(lines) <= ply + 1:
+            lines.append([])
+        lines[ply] = []
+
+    def update_pv(self, ply, move):
+        """Record `move` as the new best move of the node at `ply`, followed
+        by the PV of the child it leads to.
+        """
+        self._lines[ply] = [move] + self._lines[ply + 1]
+
+    def order(self, game, legal_moves, ply, hash_move=None):
+        """Return the legal moves of `game` at `ply` sorted best first. """
+        pv_move = self._pv_moves.get(game.hash())
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+        history = self.history
+
+        def priority(move):
+            if move == pv_move:
+                return float("inf")
+            if move == hash_move:
+                return MoveOrdering.HASH_MOVE_PRIORITY
+            if move in killers:
+                return MoveOrdering.KILLER_PRIORITY - killers.index(move)
+            return history.get(move, 0.)
+
+        return sorted(legal_moves, key=priority, reverse=True)
+
+    def cutoff(self, move, ply, depth):
+        """Update the killer moves and history after `move` caused a beta
+        cutoff at `ply` with `depth` plies left to search.
+        """
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[self.num_killers:]
+        self.history[move] = self.history.get(move, 0.) + depth * depth
+
+
+def hash_move_first(legal_moves, move):
+    """Move `move` to the front of `legal_moves` in place if it is present. """
+    if move in legal_moves:
+        legal_moves.remove(move)
+        legal_moves.insert(0, move)
+
+
+class SearchStats:
+    """Statistics of the search for one move.
+
+    Attributes
+    ----------
+    nodes : int
+        Positions visited by the search, including leaves.
+
+    leaves : int
+        Positions given a heuristic or exact leaf value.
+
+    cutoffs : int
+        Nodes whose search stopped early on an alpha-beta cutoff.
+
+    first_move_cutoffs : int
+        Cutoffs caused by the first move searched, a measure of the move
+        ordering.
+
+    tt_probes, tt_hits : int
+        Transposition table lookups, and lookups whose stored value was used
+        instead of searching the position.
+
+    researches : int
+        Moves searched again with a wider window after a null window search
+        failed high, and root searches repeated after failing outside their
+        aspiration window.
+
+    depth : int
+        The deepest completed iterative deepening pass (0 if none).
+
+    missing_shares : int
+        Shares of the root, in a split parallel search, that completed no
+        pass or were not reported in time; the move then does not come from
+        a pass over the whole root (see `parallel_agent`).
+
+    iteration_times : list<float>
+        The duration in seconds of each completed pass.
+
+    iteration_nodes : list<int>
+        The number of nodes visited by each completed pass.
+
+    time : float
+        The duration in seconds of the whole search for the move.
+    """
+    def __init__(self):
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.researches = 0
+        self.depth = 0
+        self.missing_shares = 0
+        self.iteration_times = []
+        self.iteration_nodes = []
+        self.time = 0.
+        self._start = time.perf_counter()
+        self._iteration_start = (self._start, 0)
+
+    def complete_iteration(self, depth):
+        """Record the end of the iterative deepening pass to `depth`. """
+        now = time.perf_counter()
+        start, nodes = self._iteration_start
+        self.depth = depth
+        self.iteration_times.append(now - start)
+        self.iteration_nodes.append(self.nodes - nodes)
+        self._iteration_start = (now, self.nodes)
+
+    def finish(self):
+        """Record the end of the search. """
+        self.time = time.perf_counter() - self._start
+
+    @property
+    def first_move_cutoff_rate(self):
+        """The fraction of cutoffs caused by the first move, or None. """
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else None
+
+    @property
+    def effective_branching_factor(self):
+        """The ratio of the nodes visited by the last two completed passes,
+        or None if fewer than two passes completed.
+        """
+        if len(self.iteration_nodes) < 2 or not self.iteration_nodes[-2]:
+            return None
+        return self.iteration_nodes[-1] / self.iteration_nodes[-2]
+
+    def __repr__(self):
+        return ("SearchStats(depth={}, nodes={}, leaves={}, cutoffs={}, "
+                "tt_hits={}, time={:.4f})").format(
+            self.depth, self.nodes, self.leaves, self.cutoffs, self.tt_hits,
+            self.time)
+
+
 class IsolationPlayer:
     """Base class for minimax and alphabeta agents -- this class is never
     constructed or tested directly.
@@ -141,7 +522,124 @@ class IsolationPlayer:
         self.TIMER_THRESHOLD = timeout
 
 
-class MinimaxPlayer(IsolationPlayer):
+class SearchPlayer(IsolationPlayer):
+    """Base class for the minimax and alphabeta agents that adds the options
+    shared by both searches on top of `IsolationPlayer`.
+
+    Parameters
+    ----------
+    search_depth : int (optional)
+        See `IsolationPlayer`.
+
+    score_fn : callable (optional)
+        See `IsolationPlayer`.
+
+    timeout : float (optional)
+        See `IsolationPlayer`.
+
+    in_place : bool (optional)
+        If True, the search advances the board it was given with
+        `apply_move()` and restores it with `undo_move()` instead of
+        allocating a new board with `forecast_move()` at every node.
+
+    endgame : `isolation.endgame.EndgameSolver` (optional)
+        A solver used once the players are separated: get_move() then plays
+        the first move of the longest remaining path without searching, and
+        leaves of the search are given their exact value instead of the
+        heuristic score. Not used if None.
+
+    Attributes
+    ----------
+    stats : `SearchStats`
+        The statistics of the last search started by get_move().
+
+    stats_log : list<`SearchStats`> or None
+        If set to a list, the statistics of every move are appended to it.
+
+    root_value : float or None
+        The score of the best root move of the last completed pass.
+
+    horizon_reached : bool
+        True if the current pass gave a leaf a heuristic value, i.e. cut a
+        line short at the depth limit. A pass that did not is exact, and
+        deeper passes would only repeat it.
+    """
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=10.,
+                 in_place=False, endgame=None):
+        super().__init__(search_depth, score_fn, timeout)
+        self.in_place = in_place
+        self.endgame = endgame
+        self.stats = SearchStats()
+        self.stats_log = None
+        self.root_value = None
+        self.horizon_reached = False
+        self._countdown = self._check_interval = 1
+        self._last_check_ns = 0
+
+    def new_stats(self):
+        """Start the statistics of a new move. """
+        self.stats = SearchStats()
+        if self.stats_log is not None:
+            self.stats_log.append(self.stats)
+        return self.stats
+
+    def evaluate(self, game, horizon=False):
+        """Return the value of the leaf `game` for this player: its exact
+        value if the endgame solver knows it, or the heuristic score.
+        `horizon` is True if the leaf is not a finished game but is at the
+        depth limit.
+        """
+        self.stats.leaves += 1
+        solver = self.endgame
+        if solver is not None and solver.applies(game):
+            value = solver.evaluate(game, self)
+            if value is not None:
+                return value
+        if horizon:
+            self.horizon_reached = True
+        return self.score(game, self)
+
+    def resolved(self):
+        """Test whether the last completed pass settled the game: it proved
+        a win or a loss, or never reached the depth limit. Deeper passes
+        cannot change its result then.
+        """
+        return not self.horizon_reached or self.root_value in (float("inf"), float("-inf"))
+
+    def endgame_move(self, game):
+        """Return the solver's move if the players of `game` are separated
+        and the endgame can be solved in half the time left, else None.
+        """
+        solver = self.endgame
+        if solver is None or not solver.applies(game):
+            return None
+        limit = (self.time_left() + self.TIMER_THRESHOLD) / 2
+        return solver.best_move(game, stop=lambda: self.time_left() < limit)
+
+    def forecast(self, game, move):
+        """Return the successor of `game` after `move`; in place mode this is
+        `game` itself and must be paired with a call to `retract()`.
+        """
+        if self.in_place:
+            game.apply_move(move)
+            return game
+        return game.forecast_move(move)
+
+    def retract(self, game):
+        """Undo the move applied by the matching call to `forecast()`. """
+        if self.in_place:
+            game.undo_move()
+
+    def unwind(self, game, move_count):
+        """Undo the moves left on `game` by a search that was interrupted
+        by a timeout, restoring the board to `move_count` moves.
+        """
+        if self.in_place:
+            while game.move_count > move_count:
+                game.undo_move()
+
+
+class MinimaxPlayer(SearchPlayer):
     """Game-playing agent that chooses a move using depth-limited minimax
     search. You must finish and test this player to make sure it properly uses
     minimax to return a good move before the search time limit expires.
@@ -176,14 +674,30 @@ class MinimaxPlayer(IsolationPlayer):
             (-1, -1) if there are no available legal moves.
         """
         self.time_left = time_left
+        stats = self.new_stats()
+        best_move = self.endgame_move(game)
+        if best_move is not None:
+            stats.finish()
+            return best_move
+
         best_move = (-1, -1)
+        move_count = game.move_count
 
         try:
             for depth in itertools.count(1):
-                best_move = self.minimax(game, depth)
+                self.horizon_reached = False
+                move = self.minimax(game, depth)
+                stats.complete_iteration(depth)
+                # Once every move is proven lost, keep the move of the last
+                # pass that did not see the loss: it loses the latest
+                if depth == 1 or self.root_value != float("-inf"):
+                    best_move = move
+                if self.resolved():
+                    break
         except SearchTimeout:
-            pass
+            self.unwind(game, move_count)
 
+        stats.finish()
         return best_move
 
     def minimax(self, game, depth):
@@ -202,44 +716,137 @@ class MinimaxPlayer(IsolationPlayer):
         -------
         (int, int)
             The board coordinates of the best move found in the current search;
-            (-1, -1) if there are no legal moves
+            (-1, -1) if there are no legal moves. Its score is saved in
+            `self.root_value`.
 
         """
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
+        self.stats.nodes += 1
 
-        if game.get_legal_moves(self):
-            return max(map(lambda m: (m, self.min_play(game.forecast_move(m), depth-1)),
-                           game.get_legal_moves(self)),
-                       key=lambda x: x[1])[0]
-        else:
+        legal_moves = game.get_legal_moves(self)
+        self.root_value = float("-inf")
+        if not legal_moves:
             return (-1, -1)
 
+        best_move = legal_moves[0]
+        best_score = float("-inf")
+
+        for move in legal_moves:
+            score = self.min_play(self.forecast(game, move), depth-1)
+            self.retract(game)
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+
+        self.root_value = best_score
+        return best_move
+
     def min_play(self, game, depth):
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
+        self.stats.nodes += 1
 
         legal_moves = game.get_legal_moves()
 
         if not legal_moves or depth == 0:
-            return self.score(game, self)
+            return self.evaluate(game, bool(legal_moves))
+
+        value = float("inf")
+        for move in legal_moves:
+            value = min(value, self.max_play(self.forecast(game, move), depth-1))
+            self.retract(game)
 
-        return min(map(lambda m: self.max_play(game.forecast_move(m), depth-1), legal_moves))
+        return value
 
     def max_play(self, game, depth):
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
+        self.stats.nodes += 1
 
         legal_moves = game.get_legal_moves()
 
         if not legal_moves or depth == 0:
-            return self.score(game, self)
+            return self.evaluate(game, bool(legal_moves))
+
+        value = float("-inf")
+        for move in legal_moves:
+            value = max(value, self.min_play(self.forecast(game, move), depth-1))
+            self.retract(game)
 
-        return max(map(lambda m: self.min_play(game.forecast_move(m), depth-1), legal_moves))
+        return value
 
 
-class AlphaBetaPlayer(IsolationPlayer):
+class AlphaBetaPlayer(SearchPlayer):
     """Game-playing agent that chooses a move using iterative deepening minimax
     search with alpha-beta pruning. You must finish and test this player to
     make sure it returns a good move before the search time limit expires.
+
+    Parameters
+    ----------
+    transposition_table : `TranspositionTable` (optional)
+        A table used to remember search results by position. It is kept
+        across iterative deepening passes and across the moves of a game,
+        and cleared when the player starts a new game. No table is used if
+        None.
+
+    move_ordering : `MoveOrdering` (optional)
+        The policy used to sort the moves of every node before searching
+        them. If None, moves are searched in the order returned by the board
+        (with the hash move first when a transposition table is used).
+
+    symmetry : bool (optional)
+        If True, root moves that a rotation or reflection of the current
+        position maps onto another legal move are searched only once. This
+        mostly applies to the opening plies.
+
+    batch_leaves : bool (optional)
+        If True, nodes one ply above the search horizon score all their
+        children at once from bitmask move counts (see `isolation.mobility`)
+        instead of visiting them one by one. Requires a score function
+        listed in `BATCH_SCORES`; the search result is unchanged.
+
+    pvs : bool (optional)
+        If True, use Principal Variation Search: every move after the first
+        one of a node is searched with a null window that only tells whether
+        it beats the best score so far, and searched again with the full
+        window if it does. This pays off when the first move is usually the
+        best one, i.e. with a transposition table or move ordering.
+
+    aspiration : float (optional)
+        If set, each iterative deepening pass after the first one searches
+        the root with the window `root_value +/- aspiration` around the
+        score of the previous pass, and searches again with a window twice
+        as wide on the failing side until the score falls inside it. Not
+        used if None.
+
+    See `SearchPlayer` for the other parameters.
     """
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=10.,
+                 in_place=False, transposition_table=None, move_ordering=None,
+                 symmetry=False, endgame=None, batch_leaves=False, pvs=False,
+                 aspiration=None):
+        super().__init__(search_depth, score_fn, timeout, in_place, endgame)
+        self.transposition_table = transposition_table
+        self.move_ordering = move_ordering
+        self.symmetry = symmetry
+        self.batch_score = None
+        self._child_scores = None
+        if batch_leaves:
+            if score_fn not in BATCH_SCORES:
+                raise ValueError("No batched form of score function: {}".format(score_fn))
+            # Imported only when needed: the stock isolation package that
+            # this file is graded with has no mobility module
+            from isolation.mobility import child_scores
+            self._child_scores = child_scores
+            self.batch_score = BATCH_SCORES[score_fn]
+        if aspiration is not None and not aspiration > 0:
+            raise ValueError("Aspiration window must be positive: {}".format(aspiration))
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self._last_move_count = None
+        self._root_move_count = 0
 
     def get_move(self, game, time_left):
         """Search for the best move from the available legal moves and return a
@@ -263,16 +870,99 @@ class AlphaBetaPlayer(IsolationPlayer):
             (-1, -1) if there are no available legal moves.
         """
         self.time_left = time_left
+        stats = self.new_stats()
+        best_move = self.endgame_move(game)
+        if best_move is not None:
+            stats.finish()
+            return best_move
+
         best_move = (-1, -1)
+        move_count = game.move_count
+        self.new_search(game)
+
+        # The board shuffle is wasted work when the moves are sorted anyway;
+        # the stock board has no such option and always shuffles
+        shuffle_moves = getattr(game, "shuffle_moves", False)
+        if shuffle_moves and self.move_ordering is not None:
+            game.shuffle_moves = False
 
         try:
             for depth in itertools.count(1):
-                best_move = self.alphabeta(game, depth, float("-inf"), float("inf"))
+                self.horizon_reached = False
+                move = self.deepen(game, depth)
+                stats.complete_iteration(depth)
+                # Once every move is proven lost, keep the move of the last
+                # pass that did not see the loss: it loses the latest
+                if depth == 1 or self.root_value != float("-inf"):
+                    best_move = move
+                if self.resolved():
+                    break
         except SearchTimeout:
-            pass
+            self.unwind(game, move_count)
 
+        if shuffle_moves:
+            game.shuffle_moves = True
+        stats.finish()
         return best_move
 
+    def deepen(self, game, depth):
+        """Run the iterative deepening pass to `depth` from `game` and return
+        the best move; the passes after the first one use an aspiration
+        window if `aspiration` is set.
+        """
+        if self.aspiration is not None and depth > 1:
+            return self.aspiration_search(game, depth)
+        if self.move_ordering is not None:
+            self.move_ordering.new_iteration(game)
+        return self.alphabeta(game, depth, float("-inf"), float("inf"))
+
+    def aspiration_search(self, game, depth):
+        """Search the root of `game` to `depth` with an aspiration window
+        centred on the score of the previous pass, widening the failing side
+        until the score is inside the window, and return the best move.
+        """
+        previous = self.root_value
+        delta = self.aspiration
+        if math.isinf(previous):
+            alpha, beta = float("-inf"), float("inf")
+        else:
+            alpha, beta = previous - delta, previous + delta
+
+        while True:
+            if self.move_ordering is not None:
+                self.move_ordering.new_iteration(game)
+            best_move = self.alphabeta(game, depth, alpha, beta)
+            value = self.root_value
+            if (alpha < value or alpha == float("-inf")) and \
+                    (value < beta or beta == float("inf")):
+                return best_move
+
+            # The score is a bound beyond the failing side: move that side
+            # past it, doubling the margin every time
+            self.stats.researches += 1
+            delta *= 2
+            if value <= alpha:
+                alpha = value - delta
+            else:
+                beta = value + delta
+
+    def new_search(self, game):
+        """Prepare the state kept between searches for a search from `game`.
+
+        Transposition table scores are relative to this player, so the table
+        is cleared whenever the player may have changed sides, i.e. when the
+        move count did not advance by a multiple of two since the last search.
+        """
+        table = self.transposition_table
+        if table is not None:
+            last = self._last_move_count
+            if last is None or game.move_count <= last or (game.move_count - last) % 2:
+                table.clear()
+            table.new_search()
+        if self.move_ordering is not None:
+            self.move_ordering.new_search()
+        self._last_move_count = game.move_count
+
     def alphabeta(self, game, depth, alpha=float("-inf"), beta=float("inf")):
         """
         Searches for the best move using minimax and alphabeta pruning with 
@@ -298,55 +988,246 @@ class AlphaBetaPlayer(IsolationPlayer):
         -------
         (int, int)
             The board coordinates of the best move found in the current search;
-            (-1, -1) if there are no legal moves
+            (-1, -1) if there are no legal moves. Its score is saved in
+            `self.root_value`.
         """
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
+        self.stats.nodes += 1
+
+        self._root_move_count = game.move_count
+        ordering = self.move_ordering
+        if ordering is not None:
+            ordering.clear_pv(0)
+
+        legal_moves = self.root_moves(game)
+        table = self.transposition_table
+        hash_move = None
+        if table is not None:
+            entry = table.lookup(game.hash())
+            if entry is not None:
+                hash_move = entry.move
+
+        if ordering is not None:
+            legal_moves = ordering.order(game, legal_moves, 0, hash_move)
+        elif hash_move is not None:
+            hash_move_first(legal_moves, hash_move)
 
-        legal_moves = game.get_legal_moves(self)
         best_move = legal_moves[0] if legal_moves else (-1, -1)
         best_score = float("-inf")
-
-        for move in legal_moves:
-            score = self.min_play(game.forecast_move(move), depth-1, alpha, beta)
+        alpha_orig = alpha
+
+        for i, move in enumerate(legal_moves):
+            if i and self.pvs:
+                score = self.min_play(self.forecast(game, move), depth-1,
+                                      alpha, math.nextafter(alpha, beta))
+                self.retract(game)
+                if alpha < score < beta:
+                    self.stats.researches += 1
+                    score = self.min_play(self.forecast(game, move), depth-1, alpha, beta)
+                    self.retract(game)
+            else:
+                score = self.min_play(self.forecast(game, move), depth-1, alpha, beta)
+                self.retract(game)
 
             if score > best_score:
                 best_score = score
                 best_move = move
+                if ordering is not None:
+                    ordering.update_pv(0, move)
 
+            # Only an aspiration window has a finite beta: its search fails
+            # high as soon as one move reaches beta
+            if best_score >= beta:
+                break
             alpha = max(alpha, best_score)
 
+        if table is not None and legal_moves:
+            table.store(game.hash(), depth, best_score, alpha_orig, beta, best_move)
+
+        self.root_value = best_score
         return best_move
 
+    def batch_scores(self, game, legal_moves, depth):
+        """Return the scores of the children of `game` reached by
+        `legal_moves` if they are leaves and can be scored in one batch, else
+        None. Children that the endgame solver may solve are scored one by
+        one so that they still get their exact value.
+        """
+        if depth != 1 or self.batch_score is None:
+            return None
+        if self.endgame is not None and self.endgame.applies(game, 1):
+            return None
+        return self._child_scores(game, legal_moves, self, self.batch_score)
+
+    def root_moves(self, game):
+        """Return the moves searched at the root of `game`: the legal moves of
+        this player, without symmetric duplicates if `symmetry` is set.
+        """
+        legal_moves = game.get_legal_moves(self)
+        if self.symmetry:
+            # Imported only when needed: the stock isolation package that
+            # this file is graded with has no symmetry module
+            from isolation.symmetry import unique_moves
+            legal_moves = unique_moves(game, legal_moves)
+        return legal_moves
+
     def min_play(self, game, depth, alpha, beta):
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
+        stats = self.stats
+        stats.nodes += 1
+
+        ordering = self.move_ordering
+        if ordering is not None:
+            ply = game.move_count - self._root_move_count
+            ordering.clear_pv(ply)
+
+        table = self.transposition_table
+        hash_move = None
+        if table is not None and depth > 0:
+            stats.tt_probes += 1
+            value, hash_move = table.probe(game.hash(), depth, alpha, beta)
+            if value is not None:
+                stats.tt_hits += 1
+                # A stored score may come from a search cut short by the
+                # depth limit; only won and lost positions are settled
+                if not math.isinf(value):
+                    self.horizon_reached = True
+                return value
 
         legal_moves = game.get_legal_moves()
         value = float("inf")
 
         if not legal_moves or depth == 0:
-            return self.score(game, self)
-
-        for move in legal_moves:
-            value = min(value, self.max_play(game.forecast_move(move), depth-1, alpha, beta))
-            if value <= alpha: return value
+            return self.evaluate(game, bool(legal_moves))
+
+        if ordering is not None:
+            legal_moves = ordering.order(game, legal_moves, ply, hash_move)
+        elif hash_move is not None:
+            hash_move_first(legal_moves, hash_move)
+
+        best_move = legal_moves[0]
+        beta_orig = beta
+
+        scores = self.batch_scores(game, legal_moves, depth)
+        if scores is not None and not all(map(math.isinf, scores)):
+            self.horizon_reached = True
+        if scores is not None and ordering is not None:
+            ordering.clear_pv(ply + 1)
+
+        for i, move in enumerate(legal_moves):
+            if scores is not None:
+                score = scores[i]
+                stats.nodes += 1
+                stats.leaves += 1
+            elif i and self.pvs:
+                # Null window: only test whether the move beats the best
+                # score so far, and search it again if it does
+                score = self.max_play(self.forecast(game, move), depth-1,
+                                      math.nextafter(beta, alpha), beta)
+                self.retract(game)
+                if alpha < score < beta:
+                    stats.researches += 1
+                    score = self.max_play(self.forecast(game, move), depth-1, alpha, beta)
+                    self.retract(game)
+            else:
+                score = self.max_play(self.forecast(game, move), depth-1, alpha, beta)
+                self.retract(game)
+            if score < value:
+                value = score
+                best_move = move
+                if ordering is not None:
+                    ordering.update_pv(ply, move)
+            if value <= alpha:
+                stats.cutoffs += 1
+                stats.first_move_cutoffs += not i
+                if ordering is not None:
+                    ordering.cutoff(move, ply, depth)
+                break
             beta = min(beta, value)
 
+        if table is not None:
+            table.store(game.hash(), depth, value, alpha, beta_orig, best_move)
+
         return value
 
     def max_play(self, game, depth, alpha, beta):
-        if self.time_left() < self.TIMER_THRESHOLD: raise SearchTimeout()
+        self._countdown -= 1
+        if not self._countdown: check_time(self)
+        stats = self.stats
+        stats.nodes += 1
+
+        ordering = self.move_ordering
+        if ordering is not None:
+            ply = game.move_count - self._root_move_count
+            ordering.clear_pv(ply)
+
+        table = self.transposition_table
+        hash_move = None
+        if table is not None and depth > 0:
+            stats.tt_probes += 1
+            value, hash_move = table.probe(game.hash(), depth, alpha, beta)
+            if value is not None:
+                stats.tt_hits += 1
+                # A stored score may come from a search cut short by the
+                # depth limit; only won and lost positions are settled
+                if not math.isinf(value):
+                    self.horizon_reached = True
+                return value
 
         legal_moves = game.get_legal_moves()
         value = float("-inf")
 
         if not legal_moves or depth == 0:
-            return self.score(game, self)
-
-        for move in legal_moves:
-            value = max(value, self.min_play(game.forecast_move(move), depth-1, alpha, beta))
-            if value >= beta: return value
+            return self.evaluate(game, bool(legal_moves))
+
+        if ordering is not None:
+            legal_moves = ordering.order(game, legal_moves, ply, hash_move)
+        elif hash_move is not None:
+            hash_move_first(legal_moves, hash_move)
+
+        best_move = legal_moves[0]
+        alpha_orig = alpha
+
+        scores = self.batch_scores(game, legal_moves, depth)
+        if scores is not None and not all(map(math.isinf, scores)):
+            self.horizon_reached = True
+        if scores is not None and ordering is not None:
+            ordering.clear_pv(ply + 1)
+
+        for i, move in enumerate(legal_moves):
+            if scores is not None:
+                score = scores[i]
+                stats.nodes += 1
+                stats.leaves += 1
+            elif i and self.pvs:
+                score = self.min_play(self.forecast(game, move), depth-1,
+                                      alpha, math.nextafter(alpha, beta))
+                self.retract(game)
+                if alpha < score < beta:
+                    stats.researches += 1
+                    score = self.min_play(self.forecast(game, move), depth-1, alpha, beta)
+                    self.retract(game)
+            else:
+                score = self.min_play(self.forecast(game, move), depth-1, alpha, beta)
+                self.retract(game)
+            if score > value:
+                value = score
+                best_move = move
+                if ordering is not None:
+                    ordering.update_pv(ply, move)
+            if value >= beta:
+                stats.cutoffs += 1
+                stats.first_move_cutoffs += not i
+                if ordering is not None:
+                    ordering.cutoff(move, ply, depth)
+                break
             alpha = max(alpha, value)
 
+        if table is not None:
+            table.store(game.hash(), depth, value, alpha_orig, beta, best_move)
+
         return value
 
 
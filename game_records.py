@@ -0,0 +1,95 @@
+"""Record the games of a tournament to a file as they finish.
+
+Each finished game is appended to the record file as one line of compact
+JSON (the JSON Lines format) and flushed at once, so a long tournament keeps
+no games in memory and an interrupted one keeps every game it finished. A
+record holds:
+
+    players      the names of the first and second player
+    seed         the seed of the match the game belongs to
+    opening      the moves applied before the game was played
+    moves        all moves of the game, starting with the opening
+    times        milliseconds taken by each call of `get_move()`: one entry
+                 per move after the opening, then one for the call that
+                 ended the game
+    winner       the index in `players` of the winner
+    termination  the reason the loser lost, as reported by `Board.play()`
+
+The `moves` list can be pasted into `isoviz/display.html` to replay a game.
+
+Usage:
+
+    python tournament.py --records games.jsonl
+"""
+import json
+
+
+def game_record(players, seed, opening, history, move_times, winner, termination):
+    """Return the record of a game played with `Board.play()`.
+
+    Parameters
+    ----------
+    players : (str, str)
+        The names of the first and second player.
+
+    seed : int
+        The seed of the match the game belongs to.
+
+    opening : list<(int, int)>
+        The moves applied to the board before `play()` was called.
+
+    history, move_times : list
+        The move history returned by `play()` and the times it appended to
+        its `move_times` list.
+
+    winner : int
+        0 if the first player won, 1 if the second player won.
+
+    termination : str
+        The termination reason returned by `play()`.
+    """
+    return {
+        "players": list(players),
+        "seed": seed,
+        "opening": [list(move) for move in opening],
+        "moves": [list(move) for move in opening] + history,
+        "times": [round(t, 3) for t in move_times],
+        "winner": winner,
+        "termination": termination,
+    }
+
+
+class GameRecorder:
+    """Append game records to a JSON Lines file.
+
+    Parameters
+    ----------
+    path : str
+        The name of the record file; records are appended if it exists.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "a")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, record):
+        """Append `record` to the file and flush it. """
+        self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._file.flush()
+
+    def close(self):
+        """Close the record file. """
+        self._file.close()
+
+
+def read_records(path):
+    """Iterate over the records of a record file, one game at a time. """
+    with open(path) as records_file:
+        for line in records_file:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,253 @@
+"""
+This file contains `BoardBatch`, an engine that holds many games of
+Isolation in NumPy arrays and advances all of them with one call.
+
+It is meant for playing large numbers of cheap games -- random or greedy
+self-play, Monte Carlo estimates of a position -- where calling `Board`
+methods one game at a time dominates the cost. Unlike `Board` and
+`BitBoard`, it has no player objects: players are indices (0 for player 1,
+1 for player 2), and moves are cell indices `row + col * height`, the
+numbering used by the other engines.
+
+This module requires NumPy, which the rest of the project does not; it is
+not imported by `isolation/__init__.py`.
+
+    batch = BoardBatch(10000)
+    winners = batch.play()          # random play until every game ends
+    batch.winner.mean()             # share of games won by player 2
+"""
+import numpy as np
+
+from .isolation import Board
+
+_TABLES = {}
+
+
+def adjacency(width, height):
+    """Return the boolean matrix whose entry `[i, j]` is True if a knight
+    moves from cell `i` to cell `j` on a board of the given size.
+    """
+    key = (width, height)
+    if key not in _TABLES:
+        _, moves = Board.move_table(width, height)
+        table = np.zeros((width * height, width * height), dtype=bool)
+        for idx, targets in enumerate(moves):
+            table[idx, [target for target, _ in targets]] = True
+        table.setflags(write=False)
+        _TABLES[key] = table
+    return _TABLES[key]
+
+
+class BoardBatch:
+    """A batch of `n` Isolation games stored as NumPy arrays.
+
+    Parameters
+    ----------
+    n : int
+        The number of games.
+
+    width : int (optional)
+        The number of columns of the boards.
+
+    height : int (optional)
+        The number of rows of the boards.
+
+    Attributes
+    ----------
+    blank : ndarray<bool> of shape (n, width * height)
+        True for the blank cells of each game.
+
+    locations : ndarray<int> of shape (n, 2)
+        The cell of player 1 and player 2 in each game, or -1 before their
+        first move.
+
+    initiative : ndarray<int> of shape (n,)
+        The player to move in each game: 0 for player 1, 1 for player 2.
+
+    move_count : ndarray<int> of shape (n,)
+        The number of moves applied to each game.
+
+    done : ndarray<bool> of shape (n,)
+        True for the games whose player to move has no legal move.
+
+    winner : ndarray<int> of shape (n,)
+        The winner (0 or 1) of each finished game, -1 for games in progress.
+    """
+    def __init__(self, n, width=7, height=7):
+        self.n = n
+        self.width = width
+        self.height = height
+        self._adjacency = adjacency(width, height)
+        self.blank = np.ones((n, width * height), dtype=bool)
+        self.locations = np.full((n, 2), -1, dtype=np.int64)
+        self.initiative = np.zeros(n, dtype=np.int64)
+        self.move_count = np.zeros(n, dtype=np.int64)
+        self.done = np.zeros(n, dtype=bool)
+        self.winner = np.full(n, -1, dtype=np.int64)
+
+    @classmethod
+    def from_board(cls, board, n):
+        """Return a batch of `n` copies of the position of `board` (any
+        engine with the `Board` API).
+        """
+        batch = cls(n, board.width, board.height)
+        blank = board._blank_mask()
+        batch.blank[:] = [bool(blank >> idx & 1) for idx in range(board.width * board.height)]
+        if board.move_count % 2:
+            player_1, player_2 = board.inactive_player, board.active_player
+        else:
+            player_1, player_2 = board.active_player, board.inactive_player
+        for player_idx, player in enumerate((player_1, player_2)):
+            loc = board.get_player_location(player)
+            if loc is not Board.NOT_MOVED:
+                batch.locations[:, player_idx] = loc[0] + loc[1] * board.height
+        batch.initiative[:] = board.move_count % 2
+        batch.move_count[:] = board.move_count
+        batch._update_done()
+        return batch
+
+    def active_locations(self):
+        """Return the cell of the player to move in each game (-1 if it has
+        not moved yet).
+        """
+        return self.locations[np.arange(self.n), self.initiative]
+
+    def legal_moves(self):
+        """Return the legal moves of the player to move in every game.
+
+        Returns
+        -------
+        ndarray<bool> of shape (n, width * height)
+            True for the cells the player to move can move to; a player that
+            has not moved yet can move to any blank cell. Rows of finished
+            games are all False.
+        """
+        locations = self.active_locations()
+        placed = locations >= 0
+        legal = self.blank.copy()
+        legal[placed] &= self._adjacency[locations[placed]]
+        legal[self.done] = False
+        return legal
+
+    def mobility(self):
+        """Return, for every game and cell, the number of blank cells a
+        knight reaches from that cell -- the number of moves a player would
+        have after moving there.
+        """
+        return self.blank.astype(np.int32) @ self._adjacency.T.astype(np.int32)
+
+    def random_moves(self, legal, rng=np.random):
+        """Return one uniformly chosen legal move per game, or -1 for the
+        games without a legal move.
+        """
+        keys = rng.random(legal.shape)
+        keys[~legal] = -1.
+        moves = keys.argmax(axis=1)
+        moves[~legal.any(axis=1)] = -1
+        return moves
+
+    def policy_moves(self, legal, weights, rng=np.random):
+        """Return one legal move per game drawn with probability proportional
+        to `weights` (an array of the shape of `legal`, nonnegative), or -1
+        for the games without a legal move. Legal moves of zero weight are
+        only drawn when all legal moves of the game have zero weight.
+        """
+        weights = np.where(legal, weights, 0.).astype(np.float64)
+        totals = weights.sum(axis=1)
+        weights[totals == 0] = legal[totals == 0]
+        cumulative = weights.cumsum(axis=1)
+        draws = rng.random(self.n) * cumulative[:, -1]
+        moves = (cumulative > draws[:, None]).argmax(axis=1)
+        moves[~legal.any(axis=1)] = -1
+        return moves
+
+    def greedy_moves(self, legal, rng=np.random):
+        """Return the legal move of each game that leaves the player to move
+        the most moves afterwards (like `sample_players.GreedyPlayer` with
+        `open_move_score`), breaking ties at random; -1 for the games
+        without a legal move.
+        """
+        scores = self.mobility() + rng.random(legal.shape)
+        scores[~legal] = -1.
+        moves = scores.argmax(axis=1)
+        moves[~legal.any(axis=1)] = -1
+        return moves
+
+    def step(self, moves):
+        """Apply one move per game and update the finished games.
+
+        Parameters
+        ----------
+        moves : ndarray<int> of shape (n,)
+            The cell the player to move moves to in each game; ignored for
+            finished games.
+
+        Raises
+        ------
+        ValueError
+            If a move of a game in progress is not legal.
+        """
+        moves = np.asarray(moves)
+        games = np.flatnonzero(~self.done)
+        cells = moves[games]
+        if ((cells < 0) | (cells >= self.blank.shape[1])).any():
+            raise ValueError("Illegal move in a game in progress")
+        locations = self.locations[games, self.initiative[games]]
+        legal = self.blank[games, cells] & ((locations < 0) |
+                                            self._adjacency[locations, cells])
+        if not legal.all():
+            raise ValueError("Illegal move in a game in progress")
+
+        self.blank[games, cells] = False
+        self.locations[games, self.initiative[games]] = cells
+        self.initiative[games] ^= 1
+        self.move_count[games] += 1
+        self._update_done()
+
+    def play(self, policies=("random", "random"), rng=np.random, max_moves=None):
+        """Play every game in progress to the end.
+
+        Parameters
+        ----------
+        policies : (str or callable, str or callable) (optional)
+            The move choice of player 1 and player 2: "random", "greedy", or
+            a function `policy(batch, legal)` returning nonnegative weights
+            of the shape of `legal` for `policy_moves()`.
+
+        rng : `numpy.random.Generator` (optional)
+            The source of random numbers.
+
+        max_moves : int (optional)
+            Stop after this many steps even if some games are not finished.
+
+        Returns
+        -------
+        ndarray<int> of shape (n,)
+            The winner of each game (-1 for games left unfinished).
+        """
+        steps = 0
+        while not self.done.all() and (max_moves is None or steps < max_moves):
+            legal = self.legal_moves()
+            choices = [self._choose(policy, legal, rng) for policy in policies]
+            self.step(np.where(self.initiative == 0, choices[0], choices[1]))
+            steps += 1
+        return self.winner
+
+    def _choose(self, policy, legal, rng):
+        if policy == "random":
+            return self.random_moves(legal, rng)
+        if policy == "greedy":
+            return self.greedy_moves(legal, rng)
+        return self.policy_moves(legal, policy(self, legal), rng)
+
+    def _update_done(self):
+        """Mark the games whose player to move has no legal move as won by
+        the other player.
+        """
+        locations = self.active_locations()
+        placed = locations >= 0
+        has_moves = self.blank.any(axis=1)
+        has_moves[placed] = (self.blank[placed] & self._adjacency[locations[placed]]).any(axis=1)
+        finished = ~has_moves & ~self.done
+        self.done |= finished
+        self.winner[finished] = 1 - self.initiative[finished]
@@ -0,0 +1,323 @@
+"""
+This file contains the `BitBoard` class, an alternative engine for the game
+Isolation that exposes the same public API as `isolation.Board` but keeps the
+blank cells in a single integer bitmask and looks up knight moves in tables
+that are precomputed once for each board size.
+
+Cells are indexed exactly like `Board._board_state` (column-major,
+`row + col * height`), so bit `i` of the mask corresponds to the cell at
+index `i` of the list-based board.
+"""
+import random
+
+from .isolation import Board
+from .zobrist import zobrist_keys, board_key
+
+_TABLES = {}
+
+
+def move_tables(width, height):
+    """Return the precomputed move tables for a board of the given size.
+
+    Parameters
+    ----------
+    width : int
+        The number of columns of the board.
+
+    height : int
+        The number of rows of the board.
+
+    Returns
+    -------
+    (tuple, tuple, tuple)
+        A triple `(coords, masks, neighbours)` indexed by cell: the (row,
+        column) pair of the cell, the bitmask of all cells a knight can reach
+        from it, and a tuple of `(bit, (row, column))` pairs for each of
+        those cells.
+    """
+    key = (width, height)
+    if key not in _TABLES:
+        coords, cells = Board.move_table(width, height)
+        neighbours = tuple(tuple((1 << idx, move) for idx, move in moves)
+                           for moves in cells)
+        masks = tuple(sum(bit for bit, _ in moves) for moves in neighbours)
+        _TABLES[key] = (coords, masks, neighbours)
+    return _TABLES[key]
+
+
+class BitBoard(Board):
+    """Implement a model for the game Isolation assuming each player moves like
+    a knight in chess, storing the board as an integer bitmask.
+
+    The public interface is identical to `isolation.Board`; only the internal
+    state differs, so `BitBoard` instances can be passed to any agent written
+    against `Board`.
+
+    Parameters
+    ----------
+    player_1 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    player_2 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    width : int (optional)
+        The number of columns that the board should have.
+
+    height : int (optional)
+        The number of rows that the board should have.
+
+    shuffle_moves : bool (optional)
+        If True, get_legal_moves() returns the moves of a placed player in a
+        random order.
+    """
+
+    def __init__(self, player_1, player_2, width=7, height=7, shuffle_moves=True):
+        self.width = width
+        self.height = height
+        self.shuffle_moves = shuffle_moves
+        self.move_count = 0
+        self._player_1 = player_1
+        self._player_2 = player_2
+        self._active_player = player_1
+        self._inactive_player = player_2
+
+        # Bit i is set while cell i is blank; the player locations are cell
+        # indices (or NOT_MOVED) for player 1 and player 2, and initiative is
+        # 0 when player 1 is to move and 1 otherwise
+        self._coords, self._masks, self._neighbours = move_tables(width, height)
+        self._blank = (1 << (width * height)) - 1
+        self._locations = [Board.NOT_MOVED, Board.NOT_MOVED]
+        self._initiative = 0
+        self._zobrist = zobrist_keys(width, height)
+        self._hash = 0
+        self._undo_log = []
+
+    def hash(self):
+        """Return the 64-bit Zobrist hash of the current state, covering the
+        blocked cells, both player locations and the initiative. The value is
+        stable across processes and runs, and equal to `Board.hash()` for the
+        same position.
+        """
+        return self._hash
+
+    def _compute_hash(self):
+        """Compute the Zobrist hash of the state from scratch. """
+        size = self.width * self.height
+        return board_key(self.width, self.height,
+                         [idx for idx in range(size) if not self._blank >> idx & 1],
+                         self._locations, self._initiative)
+
+    def copy(self):
+        """ Return a deep copy of the current board. """
+        new_board = self.__class__.__new__(self.__class__)
+        new_board.__dict__.update(self.__dict__)
+        new_board._locations = self._locations[:]
+        new_board._undo_log = []
+        return new_board
+
+    def move_is_legal(self, move):
+        """Test whether a move is legal in the current game state.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+
+        Returns
+        -------
+        bool
+            Returns True if the move is legal, False otherwise
+        """
+        return (0 <= move[0] < self.height and 0 <= move[1] < self.width and
+                bool(self._blank >> (move[0] + move[1] * self.height) & 1))
+
+    def get_blank_spaces(self):
+        """Return a list of the locations that are still available on the board.
+        """
+        coords = self._coords
+        blank = self._blank
+        spaces = []
+        while blank:
+            low = blank & -blank
+            spaces.append(coords[low.bit_length() - 1])
+            blank ^= low
+        return spaces
+
+    def get_player_location(self, player):
+        """Find the current location of the specified player on the board.
+
+        Parameters
+        ----------
+        player : object
+            An object registered as a player in the current game.
+
+        Returns
+        -------
+        (int, int) or None
+            The coordinate pair (row, column) of the input player, or None
+            if the player has not moved.
+        """
+        idx = self._locations[self._player_index(player)]
+        if idx is Board.NOT_MOVED:
+            return Board.NOT_MOVED
+        return self._coords[idx]
+
+    def get_legal_moves(self, player=None):
+        """Return the list of all legal moves for the specified player.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the legal moves for the active player on the board.
+
+        Returns
+        -------
+        list<(int, int)>
+            The list of coordinate pairs (row, column) of all legal moves
+            for the player constrained by the current game state.
+        """
+        if player is None:
+            idx = self._locations[self._initiative]
+        else:
+            idx = self._locations[self._player_index(player)]
+
+        if idx is Board.NOT_MOVED:
+            return self.get_blank_spaces()
+
+        blank = self._blank
+        valid_moves = [move for bit, move in self._neighbours[idx]
+                       if blank & bit]
+        if self.shuffle_moves:
+            random.shuffle(valid_moves)
+        return valid_moves
+
+    def apply_move(self, move):
+        """Move the active player to a specified location.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        idx = move[0] + move[1] * self.height
+        last_move = self._locations[self._initiative]
+        self._undo_log.append((self._blank, last_move, self._hash))
+
+        cell_keys, location_keys, initiative_key = self._zobrist
+        location_keys = location_keys[self._initiative]
+        if last_move is not Board.NOT_MOVED:
+            self._hash ^= location_keys[last_move]
+        if self._blank >> idx & 1:
+            self._hash ^= cell_keys[idx]
+        self._hash ^= location_keys[idx] ^ initiative_key
+
+        self._locations[self._initiative] = idx
+        self._blank &= ~(1 << idx)
+        self._initiative ^= 1
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count += 1
+
+    def undo_move(self):
+        """Revert the most recent call to apply_move() on this board, restoring
+        the blocked cells, player locations, initiative and move count exactly
+        as they were before that move.
+        """
+        self._blank, last_move, self._hash = self._undo_log.pop()
+        self._initiative ^= 1
+        self._locations[self._initiative] = last_move
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count -= 1
+
+    def is_winner(self, player):
+        """ Test whether the specified player has won the game. """
+        return player == self._inactive_player and not self._has_moves()
+
+    def is_loser(self, player):
+        """ Test whether the specified player has lost the game. """
+        return player == self._active_player and not self._has_moves()
+
+    def utility(self, player):
+        """Returns the utility of the current game state from the perspective
+        of the specified player.
+
+                    /  +infinity,   "player" wins
+        utility =  |   -infinity,   "player" loses
+                    \\          0,    otherwise
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the utility for the active player on the board.
+
+        Returns
+        ----------
+        float
+            The utility value of the current game state for the specified
+            player. The game has a utility of +inf if the player has won,
+            a value of -inf if the player has lost, and a value of 0
+            otherwise.
+        """
+        if not self._has_moves():
+
+            if player == self._inactive_player:
+                return float("inf")
+
+            if player == self._active_player:
+                return float("-inf")
+
+        return 0.
+
+    def to_string(self, symbols=['1', '2']):
+        """Generate a string representation of the current game state, marking
+        the location of each player and indicating which cells have been
+        blocked, and which remain open.
+        """
+        p1_loc, p2_loc = self._locations
+
+        col_margin = len(str(self.height - 1)) + 1
+        prefix = "{:<" + "{}".format(col_margin) + "}"
+        offset = " " * (col_margin + 3)
+        out = offset + '   '.join(map(str, range(self.width))) + '\n\r'
+        for i in range(self.height):
+            out += prefix.format(i) + ' | '
+            for j in range(self.width):
+                idx = i + j * self.height
+                if self._blank >> idx & 1:
+                    out += ' '
+                elif p1_loc == idx:
+                    out += symbols[0]
+                elif p2_loc == idx:
+                    out += symbols[1]
+                else:
+                    out += '-'
+                out += ' | '
+            out += '\n\r'
+
+        return out
+
+    def _blank_mask(self):
+        """Return the bitmask of the blank cells. """
+        return self._blank
+
+    def _player_index(self, player):
+        """Return 0 for player 1 and 1 for player 2. """
+        if player == self._player_1:
+            return 0
+        elif player == self._player_2:
+            return 1
+        raise RuntimeError(
+            "Invalid player in get_player_location: {}".format(player))
+
+    def _has_moves(self):
+        """Test whether the active player has at least one legal move. """
+        idx = self._locations[self._initiative]
+        if idx is Board.NOT_MOVED:
+            return bool(self._blank)
+        return bool(self._masks[idx] & self._blank)
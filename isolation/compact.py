@@ -0,0 +1,362 @@
+"""
+This file contains the `CompactBoard` class, an engine for the game
+Isolation with the public API of `isolation.Board` and a small memory
+footprint, for searches and caches that keep many boards alive.
+
+A `CompactBoard` has no per-instance `__dict__` (it declares `__slots__`).
+The cells are a `bytearray` with one byte per cell (1 once blocked), indexed
+like `Board._board_state` (`row + col * height`). Players are the indices 0
+(player 1) and 1 (player 2) internally: the player locations are a shared
+tuple of two cell indices (-1 before the first move), the initiative is the
+index of the player to move, and the player objects are only looked up when
+a method takes or returns one.
+
+The methods that do not depend on the engine (`play()`, `forecast_move()`,
+`hash()`, `get_regions()`, `is_partitioned()`) are those of `Board`.
+"""
+import random
+from itertools import compress
+from operator import not_
+
+from .isolation import Board, _BLANK_DIGITS
+from .zobrist import zobrist_keys, board_key
+
+_NOT_MOVED = -1
+
+
+class CompactBoard(object):
+    """Implement a model for the game Isolation assuming each player moves like
+    a knight in chess, with a compact per-board state.
+
+    The public interface is identical to `isolation.Board`.
+
+    Parameters
+    ----------
+    player_1 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    player_2 : object
+        An object with a get_move() function. This is the only function
+        directly called by the Board class for each player.
+
+    width : int (optional)
+        The number of columns that the board should have.
+
+    height : int (optional)
+        The number of rows that the board should have.
+
+    shuffle_moves : bool (optional)
+        If True, get_legal_moves() returns the moves of a placed player in a
+        random order.
+    """
+    __slots__ = ("width", "height", "shuffle_moves", "move_count", "_players",
+                 "_cells", "_locations", "_initiative", "_hash", "_undo_log",
+                 "_coords", "_neighbours", "_zobrist")
+
+    BLANK = Board.BLANK
+    NOT_MOVED = Board.NOT_MOVED
+    DIRECTIONS = Board.DIRECTIONS
+
+    move_table = Board.move_table
+    hash = Board.hash
+    forecast_move = Board.forecast_move
+    get_regions = Board.get_regions
+    is_partitioned = Board.is_partitioned
+    play = Board.play
+    print_board = Board.print_board
+
+    def __init__(self, player_1, player_2, width=7, height=7, shuffle_moves=True):
+        self.width = width
+        self.height = height
+        self.shuffle_moves = shuffle_moves
+        self.move_count = 0
+        self._players = (player_1, player_2)
+        self._cells = bytearray(width * height)
+        self._locations = (_NOT_MOVED, _NOT_MOVED)
+        self._initiative = 0
+        self._hash = 0
+        self._undo_log = []
+        self._coords, self._neighbours = Board.move_table(width, height)
+        self._zobrist = zobrist_keys(width, height)
+
+    def _compute_hash(self):
+        """Compute the Zobrist hash of the state from scratch. """
+        return board_key(self.width, self.height,
+                         [idx for idx, blocked in enumerate(self._cells) if blocked],
+                         tuple(None if idx == _NOT_MOVED else idx for idx in self._locations),
+                         self._initiative)
+
+    def _player_index(self, player):
+        """Return 0 for player 1, 1 for player 2 and None for any other
+        object. Players are compared by identity first, so `==` is only
+        called for objects that are equal to a player without being one.
+        """
+        player_1, player_2 = self._players
+        if player is player_1:
+            return 0
+        if player is player_2:
+            return 1
+        if player == player_1:
+            return 0
+        if player == player_2:
+            return 1
+        return None
+
+    @property
+    def active_player(self):
+        """The object registered as the player holding initiative in the
+        current game state.
+        """
+        return self._players[self._initiative]
+
+    @property
+    def inactive_player(self):
+        """The object registered as the player in waiting for the current
+        game state.
+        """
+        return self._players[self._initiative ^ 1]
+
+    def get_opponent(self, player):
+        """Return the opponent of the supplied player.
+
+        Parameters
+        ----------
+        player : object
+            An object registered as a player in the current game. Raises an
+            error if the supplied object is not registered as a player in
+            this game.
+
+        Returns
+        -------
+        object
+            The opponent of the input player object.
+        """
+        idx = self._player_index(player)
+        if idx is None:
+            raise RuntimeError("`player` must be an object registered as a player in the current game.")
+        return self._players[idx ^ 1]
+
+    def copy(self):
+        """ Return a deep copy of the current board. """
+        new_board = self.__class__.__new__(self.__class__)
+        new_board.width = self.width
+        new_board.height = self.height
+        new_board.shuffle_moves = self.shuffle_moves
+        new_board.move_count = self.move_count
+        new_board._players = self._players
+        new_board._cells = self._cells[:]
+        new_board._locations = self._locations
+        new_board._initiative = self._initiative
+        new_board._hash = self._hash
+        new_board._undo_log = []
+        new_board._coords = self._coords
+        new_board._neighbours = self._neighbours
+        new_board._zobrist = self._zobrist
+        return new_board
+
+    def move_is_legal(self, move):
+        """Test whether a move is legal in the current game state.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+
+        Returns
+        -------
+        bool
+            Returns True if the move is legal, False otherwise
+        """
+        return (0 <= move[0] < self.height and 0 <= move[1] < self.width and
+                not self._cells[move[0] + move[1] * self.height])
+
+    def get_blank_spaces(self):
+        """Return a list of the locations that are still available on the board.
+        """
+        return list(compress(self._coords, map(not_, self._cells)))
+
+    def get_player_location(self, player):
+        """Find the current location of the specified player on the board.
+
+        Parameters
+        ----------
+        player : object
+            An object registered as a player in the current game.
+
+        Returns
+        -------
+        (int, int) or None
+            The coordinate pair (row, column) of the input player, or None
+            if the player has not moved.
+        """
+        player_idx = self._player_index(player)
+        if player_idx is None:
+            raise RuntimeError(
+                "Invalid player in get_player_location: {}".format(player))
+        idx = self._locations[player_idx]
+        if idx == _NOT_MOVED:
+            return Board.NOT_MOVED
+        return self._coords[idx]
+
+    def get_legal_moves(self, player=None):
+        """Return the list of all legal moves for the specified player.
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the legal moves for the active player on the board.
+
+        Returns
+        -------
+        list<(int, int)>
+            The list of coordinate pairs (row, column) of all legal moves
+            for the player constrained by the current game state.
+        """
+        if player is None:
+            idx = self._locations[self._initiative]
+        else:
+            player_idx = self._player_index(player)
+            if player_idx is None:
+                raise RuntimeError(
+                    "Invalid player in get_legal_moves: {}".format(player))
+            idx = self._locations[player_idx]
+
+        if idx == _NOT_MOVED:
+            return self.get_blank_spaces()
+
+        cells = self._cells
+        valid_moves = [move for cell, move in self._neighbours[idx]
+                       if not cells[cell]]
+        if self.shuffle_moves:
+            random.shuffle(valid_moves)
+        return valid_moves
+
+    def apply_move(self, move):
+        """Move the active player to a specified location.
+
+        Parameters
+        ----------
+        move : (int, int)
+            A coordinate pair (row, column) indicating the next position for
+            the active player on the board.
+        """
+        idx = move[0] + move[1] * self.height
+        initiative = self._initiative
+        locations = self._locations
+        last_move = locations[initiative]
+        cells = self._cells
+        self._undo_log.append((idx, cells[idx], locations, self._hash))
+
+        cell_keys, location_keys, initiative_key = self._zobrist
+        location_keys = location_keys[initiative]
+        key = self._hash
+        if last_move != _NOT_MOVED:
+            key ^= location_keys[last_move]
+        if not cells[idx]:
+            key ^= cell_keys[idx]
+        self._hash = key ^ location_keys[idx] ^ initiative_key
+
+        cells[idx] = 1
+        self._locations = (idx, locations[1]) if initiative == 0 else (locations[0], idx)
+        self._initiative = initiative ^ 1
+        self.move_count += 1
+
+    def undo_move(self):
+        """Revert the most recent call to apply_move() on this board, restoring
+        the blocked cells, player locations, initiative and move count exactly
+        as they were before that move.
+        """
+        idx, value, self._locations, self._hash = self._undo_log.pop()
+        self._cells[idx] = value
+        self._initiative ^= 1
+        self.move_count -= 1
+
+    def _blank_mask(self):
+        """Return the bitmask of the blank cells. """
+        # Read the cells, last first, as the binary digits of the mask
+        return int(self._cells[::-1].translate(_BLANK_DIGITS), 2)
+
+    def _has_moves(self):
+        """Test whether the active player has at least one legal move. """
+        idx = self._locations[self._initiative]
+        cells = self._cells
+        if idx == _NOT_MOVED:
+            return 0 in cells
+        for cell, _ in self._neighbours[idx]:
+            if not cells[cell]:
+                return True
+        return False
+
+    def is_winner(self, player):
+        """ Test whether the specified player has won the game. """
+        return (self._player_index(player) == self._initiative ^ 1 and
+                not self._has_moves())
+
+    def is_loser(self, player):
+        """ Test whether the specified player has lost the game. """
+        return (self._player_index(player) == self._initiative and
+                not self._has_moves())
+
+    def utility(self, player):
+        """Returns the utility of the current game state from the perspective
+        of the specified player.
+
+                    /  +infinity,   "player" wins
+        utility =  |   -infinity,   "player" loses
+                    \\          0,    otherwise
+
+        Parameters
+        ----------
+        player : object (optional)
+            An object registered as a player in the current game. If None,
+            return the utility for the active player on the board.
+
+        Returns
+        ----------
+        float
+            The utility value of the current game state for the specified
+            player. The game has a utility of +inf if the player has won,
+            a value of -inf if the player has lost, and a value of 0
+            otherwise.
+        """
+        if not self._has_moves():
+            player_idx = self._player_index(player)
+
+            if player_idx == self._initiative ^ 1:
+                return float("inf")
+
+            if player_idx == self._initiative:
+                return float("-inf")
+
+        return 0.
+
+    def to_string(self, symbols=['1', '2']):
+        """Generate a string representation of the current game state, marking
+        the location of each player and indicating which cells have been
+        blocked, and which remain open.
+        """
+        p1_loc, p2_loc = self._locations
+
+        col_margin = len(str(self.height - 1)) + 1
+        prefix = "{:<" + "{}".format(col_margin) + "}"
+        offset = " " * (col_margin + 3)
+        out = offset + '   '.join(map(str, range(self.width))) + '\n\r'
+        for i in range(self.height):
+            out += prefix.format(i) + ' | '
+            for j in range(self.width):
+                idx = i + j * self.height
+                if not self._cells[idx]:
+                    out += ' '
+                elif p1_loc == idx:
+                    out += symbols[0]
+                elif p2_loc == idx:
+                    out += symbols[1]
+                else:
+                    out += '-'
+                out += ' | '
+            out += '\n\r'
+
+        return out
@@ -0,0 +1,269 @@
+"""
+This file contains an exact solver for Isolation endgames in which the two
+players have been separated.
+
+Once no blank cell can be reached by both players, their moves no longer
+interact: each player just walks the longest knight's path available in its
+own region, and the player to move loses if its path is not strictly longer
+than the opponent's. The solver computes these longest paths exactly with a
+depth-first search memoized on (board size, position, region bitmask).
+
+Regions are bitmasks over the cell index used by the boards (`row + col *
+height`). Flood fills use bit-parallel shifts: a knight move (dr, dc) moves
+cell `i` to `i + dr + dc * height`, so the whole frontier advances in one
+shift per direction after masking out the cells whose target would leave the
+board.
+"""
+DIRECTIONS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+              (1, -2), (1, 2), (2, -1), (2, 1))
+
+_TABLES = {}
+
+
+def knight_tables(width, height):
+    """Return the bitmask tables for a board of the given size.
+
+    Returns
+    -------
+    (tuple<int>, tuple<(int, int)>)
+        The mask of cells a knight reaches from each cell, and for each
+        direction a pair `(sources, shift)`: the mask of cells from which the
+        move stays on the board and the index offset it adds.
+    """
+    key = (width, height)
+    if key not in _TABLES:
+        size = width * height
+        shifts = []
+        for dr, dc in DIRECTIONS:
+            sources = 0
+            for idx in range(size):
+                r, c = idx % height, idx // height
+                if 0 <= r + dr < height and 0 <= c + dc < width:
+                    sources |= 1 << idx
+            shifts.append((sources, dr + dc * height))
+        masks = tuple(_step(1 << idx, shifts) for idx in range(size))
+        _TABLES[key] = (masks, tuple(shifts))
+    return _TABLES[key]
+
+
+def _step(frontier, shifts):
+    """Return the cells a knight reaches in one move from any cell of
+    `frontier`.
+    """
+    reached = 0
+    for sources, shift in shifts:
+        cells = frontier & sources
+        reached |= cells << shift if shift > 0 else cells >> -shift
+    return reached
+
+
+def flood(width, height, start, blank):
+    """Return the mask of blank cells reachable by a knight from cell index
+    `start` moving only through blank cells (`start` itself excluded unless
+    it is reachable again, which it never is for an occupied cell).
+    """
+    _, shifts = knight_tables(width, height)
+    region = 0
+    frontier = 1 << start
+    while frontier:
+        frontier = _step(frontier, shifts) & blank & ~region
+        region |= frontier
+    return region
+
+
+def popcount(mask):
+    """Return the number of set bits of `mask`. """
+    return bin(mask).count("1")
+
+
+class PathBudgetExceeded(Exception):
+    """Raised when a longest path search exceeds its node budget. """
+    pass
+
+
+class EndgameSolver:
+    """Exact solver for separated Isolation positions.
+
+    The memo of longest paths is kept between calls, so later positions of
+    the same endgame are usually solved with a few lookups.
+
+    Parameters
+    ----------
+    max_nodes : int (optional)
+        Largest number of path search nodes spent on one longest path before
+        giving up and reporting the position as unsolved.
+
+    leaf_nodes : int (optional)
+        The node budget used instead of `max_nodes` when evaluating the
+        leaves of a search, where the solver runs many times per move; 0
+        disables the solver at the leaves.
+
+    min_blocked : float (optional)
+        Fraction of the board that must be blocked before the solver checks
+        for a partition at all; players are practically never separated in
+        the early game, and the check costs a few flood fills.
+
+    memo_size : int (optional)
+        Number of memoized paths after which the memo is cleared.
+
+    leaf_cells : int (optional)
+        Largest region searched exactly at the leaves; larger regions are
+        practically never solved within `leaf_nodes`, and every node of
+        their search costs a flood fill of the region.
+    """
+    def __init__(self, max_nodes=100000, leaf_nodes=200, min_blocked=0.3,
+                 memo_size=2**18, leaf_cells=32):
+        self.max_nodes = max_nodes
+        self.leaf_nodes = leaf_nodes
+        self.leaf_cells = leaf_cells
+        self.min_blocked = min_blocked
+        self.memo_size = memo_size
+        self.memo = dict()
+        self._nodes = 0
+        self._budget = max_nodes
+        self._stop = None
+
+    def applies(self, game, plies=0):
+        """Test whether `game`, or the positions `plies` moves after it, are
+        late enough for a partition check.
+        """
+        return game.move_count + plies >= self.min_blocked * game.width * game.height
+
+    def longest_path(self, width, height, start, region, max_nodes=None,
+                     stop=None):
+        """Return the number of moves in the longest knight's path from cell
+        `start` through the cells of `region`, or None if the search exceeds
+        `max_nodes` (by default `self.max_nodes`) or the optional callable
+        `stop`, polled every few hundred nodes, returns True.
+        """
+        masks, _ = knight_tables(width, height)
+        self._nodes = 0
+        self._budget = self.max_nodes if max_nodes is None else max_nodes
+        self._stop = stop
+        try:
+            return self._longest(masks, width, height, start, region)
+        except PathBudgetExceeded:
+            return None
+
+    def _longest(self, masks, width, height, start, region):
+        region = flood(width, height, start, region)
+        key = (width, height, start, region)
+        if key in self.memo:
+            return self.memo[key]
+
+        self._nodes += 1
+        if self._nodes > self._budget or (
+                self._stop is not None and not self._nodes & 0xFF and self._stop()):
+            raise PathBudgetExceeded()
+
+        bound = popcount(region)
+        best = 0
+        moves = masks[start] & region
+        while moves and best < bound:
+            low = moves & -moves
+            moves ^= low
+            length = 1 + self._longest(masks, width, height,
+                                       low.bit_length() - 1, region ^ low)
+            best = max(best, length)
+
+        if len(self.memo) >= self.memo_size:
+            self.memo.clear()
+        self.memo[key] = best
+        return best
+
+    def greedy_path(self, width, height, start, region):
+        """Return the length of the knight's path from cell `start` through
+        `region` that always moves to the cell with the fewest onward moves
+        (Warnsdorff's rule), a lower bound of the longest path.
+        """
+        masks, _ = knight_tables(width, height)
+        length = 0
+        moves = masks[start] & region
+        while moves:
+            best = None
+            while moves:
+                low = moves & -moves
+                moves ^= low
+                onward = masks[low.bit_length() - 1] & region & ~low
+                count = popcount(onward)
+                if best is None or count < best[0]:
+                    best = (count, low, onward)
+            region &= ~best[1]
+            moves = best[2]
+            length += 1
+        return length
+
+    def path_lengths(self, game, max_nodes=None, stop=None):
+        """Return the longest path lengths of the active and inactive player
+        if `game` is partitioned, or None if it is not partitioned or could
+        not be solved within the node budget.
+        """
+        regions = game.get_regions()
+        if regions is None or regions[0] & regions[1]:
+            return None
+
+        lengths = []
+        for player, region in zip((game.active_player, game.inactive_player), regions):
+            r, c = game.get_player_location(player)
+            length = self.longest_path(game.width, game.height,
+                                       r + c * game.height, region, max_nodes, stop)
+            if length is None:
+                return None
+            lengths.append(length)
+        return tuple(lengths)
+
+    def evaluate(self, game, player):
+        """Return the exact utility of `game` for `player` (+inf or -inf) if
+        the players are separated and the endgame can be solved within
+        `leaf_nodes`, else None.
+
+        The outcome is first decided from bounds when possible: a greedy path
+        is a lower bound of a longest path and the region size an upper one.
+        """
+        if not self.leaf_nodes:
+            return None
+        regions = game.get_regions()
+        if regions is None or regions[0] & regions[1]:
+            return None
+
+        lower, upper = [], []
+        for owner, region in zip((game.active_player, game.inactive_player), regions):
+            r, c = game.get_player_location(owner)
+            lower.append(self.greedy_path(game.width, game.height,
+                                          r + c * game.height, region))
+            upper.append(popcount(region))
+        if lower[0] > upper[1]:
+            active_wins = True
+        elif lower[1] >= upper[0]:
+            active_wins = False
+        elif max(upper) > self.leaf_cells:
+            return None
+        else:
+            lengths = self.path_lengths(game, self.leaf_nodes)
+            if lengths is None:
+                return None
+            active_wins = lengths[0] > lengths[1]
+        return float("inf") if active_wins == (player == game.active_player) else float("-inf")
+
+    def best_move(self, game, stop=None):
+        """Return the first move of the longest path of the active player if
+        the players are separated and the endgame can be solved, else None.
+        Since separated players cannot interfere with each other, this move is
+        optimal whatever the outcome. See `longest_path()` for `stop`.
+        """
+        lengths = self.path_lengths(game, stop=stop)
+        if lengths is None or lengths[0] == 0:
+            return None
+
+        height = game.height
+        region = game.get_regions()[0]
+        best = None
+        for move in game.get_legal_moves():
+            idx = move[0] + move[1] * height
+            length = self.longest_path(game.width, height, idx, region & ~(1 << idx),
+                                       stop=stop)
+            if length is None:
+                return None
+            if best is None or length > best[0]:
+                best = (length, move)
+        return best[1]
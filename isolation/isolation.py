@@ -8,11 +8,39 @@ remain compatible with the defaults provided, and none of your changes will
 be available to project reviewers.
 """
 import random
-import timeit
-from copy import copy
+import time
+from itertools import compress
+from operator import not_
+
+from .endgame import flood
+from .zobrist import zobrist_keys, board_key
 
 TIME_LIMIT_MILLIS = 150
 
+# Maps blank and blocked cells to the binary digits "1" and "0"
+_BLANK_DIGITS = bytes.maketrans(b"\x00\x01", b"10")
+
+
+class Deadline(object):
+    """The `time_left` function given to the agents by `Board.play()`.
+
+    Calling it returns the number of milliseconds left in the turn, like any
+    `time_left` function. The end of the turn is also available as the
+    attribute `deadline_ns`, in nanoseconds of `time.monotonic_ns()`, so that
+    agents can compare it to the clock themselves and read the clock only
+    every few nodes.
+
+    Parameters
+    ----------
+    time_limit : numeric
+        The number of milliseconds from now to the deadline.
+    """
+    def __init__(self, time_limit):
+        self.deadline_ns = time.monotonic_ns() + int(time_limit * 1000000)
+
+    def __call__(self):
+        return (self.deadline_ns - time.monotonic_ns()) / 1000000.
+
 
 class Board(object):
     """Implement a model for the game Isolation assuming each player moves like
@@ -33,13 +61,25 @@ class Board(object):
 
     height : int (optional)
         The number of rows that the board should have.
+
+    shuffle_moves : bool (optional)
+        If True, get_legal_moves() returns the moves of a placed player in a
+        random order. Search agents that order moves themselves can set this
+        to False to skip the shuffle.
     """
     BLANK = 0
     NOT_MOVED = None
 
-    def __init__(self, player_1, player_2, width=7, height=7):
+    DIRECTIONS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2),
+                  (1, -2), (1, 2), (2, -1), (2, 1))
+
+    # Move tables for each board size, built on first use by move_table()
+    _MOVE_TABLES = {}
+
+    def __init__(self, player_1, player_2, width=7, height=7, shuffle_moves=True):
         self.width = width
         self.height = height
+        self.shuffle_moves = shuffle_moves
         self.move_count = 0
         self._player_1 = player_1
         self._player_2 = player_2
@@ -51,9 +91,65 @@ class Board(object):
         self._board_state = [Board.BLANK] * (width * height + 3)
         self._board_state[-1] = Board.NOT_MOVED
         self._board_state[-2] = Board.NOT_MOVED
+        self._coords, self._neighbours = Board.move_table(width, height)
+
+        # 64-bit Zobrist hash of the state, updated by apply_move()
+        self._zobrist = zobrist_keys(width, height)
+        self._hash = 0
+
+        # Each apply_move() pushes the cell index, the previous value of that
+        # cell, the index and previous value of the last-move slot it
+        # overwrote, and the previous hash so that undo_move() can restore the
+        # exact prior state
+        self._undo_log = []
+
+    @classmethod
+    def move_table(cls, width, height):
+        """Return the knight-move tables for a board of the given size. The
+        tables are built once per (width, height) and shared by all boards.
+
+        Parameters
+        ----------
+        width : int
+            The number of columns of the board.
+
+        height : int
+            The number of rows of the board.
+
+        Returns
+        -------
+        (tuple, tuple)
+            A pair `(coords, neighbours)` indexed by cell (`row + col *
+            height`): the (row, column) pair of each cell, and a tuple of
+            `(index, (row, column))` pairs for every cell a knight can reach
+            from it.
+        """
+        key = (width, height)
+        if key not in cls._MOVE_TABLES:
+            coords = tuple((idx % height, idx // height)
+                           for idx in range(width * height))
+            neighbours = tuple(
+                tuple((nr + nc * height, (nr, nc))
+                      for nr, nc in ((r + dr, c + dc) for dr, dc in cls.DIRECTIONS)
+                      if 0 <= nr < height and 0 <= nc < width)
+                for r, c in coords)
+            cls._MOVE_TABLES[key] = (coords, neighbours)
+        return cls._MOVE_TABLES[key]
 
     def hash(self):
-        return str(self._board_state).__hash__()
+        """Return the 64-bit Zobrist hash of the current state, covering the
+        blocked cells, both player locations and the initiative. The value is
+        stable across processes and runs.
+        """
+        return self._hash
+
+    def _compute_hash(self):
+        """Compute the Zobrist hash of `_board_state` from scratch. """
+        size = self.width * self.height
+        return board_key(self.width, self.height,
+                         [idx for idx in range(size) if self._board_state[idx]],
+                         (self._board_state[-1], self._board_state[-2]),
+                         self._board_state[-3])
 
     @property
     def active_player(self):
@@ -92,11 +188,12 @@ class Board(object):
 
     def copy(self):
         """ Return a deep copy of the current board. """
-        new_board = Board(self._player_1, self._player_2, width=self.width, height=self.height)
-        new_board.move_count = self.move_count
-        new_board._active_player = self._active_player
-        new_board._inactive_player = self._inactive_player
-        new_board._board_state = copy(self._board_state)
+        # Share the attributes instead of going through __init__(), which
+        # would allocate and then discard a whole blank board state
+        new_board = self.__class__.__new__(self.__class__)
+        new_board.__dict__.update(self.__dict__)
+        new_board._board_state = self._board_state[:]
+        new_board._undo_log = []
         return new_board
 
     def forecast_move(self, move):
@@ -139,8 +236,7 @@ class Board(object):
     def get_blank_spaces(self):
         """Return a list of the locations that are still available on the board.
         """
-        return [(i, j) for j in range(self.width) for i in range(self.height)
-                if self._board_state[i + j * self.height] == Board.BLANK]
+        return list(compress(self._coords, map(not_, self._board_state)))
 
     def get_player_location(self, player):
         """Find the current location of the specified player on the board.
@@ -156,20 +252,21 @@ class Board(object):
             The coordinate pair (row, column) of the input player, or None
             if the player has not moved.
         """
+        idx = self._location_index(player)
+        if idx == Board.NOT_MOVED:
+            return Board.NOT_MOVED
+        return self._coords[idx]
+
+    def _location_index(self, player):
+        """Return the cell index of the specified player, or None if the
+        player has not moved.
+        """
         if player == self._player_1:
-            if self._board_state[-1] == Board.NOT_MOVED:
-                return Board.NOT_MOVED
-            idx = self._board_state[-1]
+            return self._board_state[-1]
         elif player == self._player_2:
-            if self._board_state[-2] == Board.NOT_MOVED:
-                return Board.NOT_MOVED
-            idx = self._board_state[-2]
-        else:
-            raise RuntimeError(
-                "Invalid player in get_player_location: {}".format(player))
-        w = idx // self.height
-        h = idx % self.height
-        return (h, w)
+            return self._board_state[-2]
+        raise RuntimeError(
+            "Invalid player in get_player_location: {}".format(player))
 
     def get_legal_moves(self, player=None):
         """Return the list of all legal moves for the specified player.
@@ -187,8 +284,8 @@ class Board(object):
             for the player constrained by the current game state.
         """
         if player is None:
-            player = self.active_player
-        return self.__get_moves(self.get_player_location(player))
+            player = self._active_player
+        return self.__get_moves(self._location_index(player))
 
     def apply_move(self, move):
         """Move the active player to a specified location.
@@ -201,12 +298,74 @@ class Board(object):
         """
         idx = move[0] + move[1] * self.height
         last_move_idx = int(self.active_player == self._player_2) + 1
+        last_move = self._board_state[-last_move_idx]
+        self._undo_log.append((idx, self._board_state[idx], -last_move_idx,
+                               last_move, self._hash))
+
+        cell_keys, location_keys, initiative_key = self._zobrist
+        location_keys = location_keys[last_move_idx - 1]
+        if last_move is not Board.NOT_MOVED:
+            self._hash ^= location_keys[last_move]
+        if not self._board_state[idx]:
+            self._hash ^= cell_keys[idx]
+        self._hash ^= location_keys[idx] ^ initiative_key
+
         self._board_state[-last_move_idx] = idx
         self._board_state[idx] = 1
         self._board_state[-3] ^= 1
         self._active_player, self._inactive_player = self._inactive_player, self._active_player
         self.move_count += 1
 
+    def undo_move(self):
+        """Revert the most recent call to apply_move() on this board, restoring
+        the blocked cells, player locations, initiative and move count exactly
+        as they were before that move.
+
+        Moves applied before the board was created by copy() or
+        forecast_move() cannot be undone on the copy.
+        """
+        idx, cell, slot, last_move, self._hash = self._undo_log.pop()
+        self._board_state[idx] = cell
+        self._board_state[slot] = last_move
+        self._board_state[-3] ^= 1
+        self._active_player, self._inactive_player = self._inactive_player, self._active_player
+        self.move_count -= 1
+
+    def get_regions(self):
+        """Return the blank cells each player can still reach.
+
+        Returns
+        -------
+        (int, int) or None
+            Bitmasks over the cell indices (`row + col * height`) of the
+            blank cells reachable by knight moves through blank cells from
+            the active and from the inactive player, or None if either
+            player has not moved yet.
+        """
+        blank = self._blank_mask()
+        regions = []
+        for player in (self.active_player, self.inactive_player):
+            loc = self.get_player_location(player)
+            if loc is Board.NOT_MOVED:
+                return None
+            regions.append(flood(self.width, self.height,
+                                 loc[0] + loc[1] * self.height, blank))
+        return tuple(regions)
+
+    def is_partitioned(self):
+        """Test whether the players have been separated, i.e., no blank cell
+        can be reached by both of them. From then on their moves no longer
+        interact and `isolation.endgame` can solve the game exactly.
+        """
+        regions = self.get_regions()
+        return regions is not None and not regions[0] & regions[1]
+
+    def _blank_mask(self):
+        """Return the bitmask of the blank cells. """
+        # Read the cells, last first, as the binary digits of the mask
+        cells = bytes(self._board_state[self.width * self.height - 1::-1])
+        return int(cells.translate(_BLANK_DIGITS), 2)
+
     def is_winner(self, player):
         """ Test whether the specified player has won the game. """
         return player == self._inactive_player and not self.get_legal_moves(self._active_player)
@@ -247,19 +406,18 @@ class Board(object):
 
         return 0.
 
-    def __get_moves(self, loc):
+    def __get_moves(self, idx):
         """Generate the list of possible moves for an L-shaped motion (like a
-        knight in chess).
+        knight in chess) from the cell with index `idx`.
         """
-        if loc == Board.NOT_MOVED:
+        if idx == Board.NOT_MOVED:
             return self.get_blank_spaces()
 
-        r, c = loc
-        directions = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                      (1, -2), (1, 2), (2, -1), (2, 1)]
-        valid_moves = [(r + dr, c + dc) for dr, dc in directions
-                       if self.move_is_legal((r + dr, c + dc))]
-        random.shuffle(valid_moves)
+        state = self._board_state
+        valid_moves = [move for cell, move in self._neighbours[idx]
+                       if not state[cell]]
+        if self.shuffle_moves:
+            random.shuffle(valid_moves)
         return valid_moves
 
     def print_board(self):
@@ -295,15 +453,23 @@ class Board(object):
 
         return out
 
-    def play(self, time_limit=TIME_LIMIT_MILLIS):
+    def play(self, time_limit=TIME_LIMIT_MILLIS, move_times=None):
         """Execute a match between the players by alternately soliciting them
-        to select a move and applying it in the game.
+        to select a move and applying it in the game. Once the game is
+        decided, `game_over(board, winner)` is called on each player that has
+        such a method.
 
         Parameters
         ----------
         time_limit : numeric (optional)
             The maximum number of milliseconds to allow before timeout
-            during each turn.
+            during each turn. Each agent is passed a `Deadline` for its turn
+            as the `time_left` argument of `get_move()`.
+
+        move_times : list (optional)
+            If given, the number of milliseconds each call of `get_move()`
+            took is appended to it. There is one entry for every move of the
+            move history, followed by one for the call that ended the game.
 
         Returns
         ----------
@@ -314,29 +480,40 @@ class Board(object):
         """
         move_history = []
 
-        time_millis = lambda: 1000 * timeit.default_timer()
-
         while True:
 
             legal_player_moves = self.get_legal_moves()
             game_copy = self.copy()
 
-            move_start = time_millis()
-            time_left = lambda : time_limit - (time_millis() - move_start)
-            curr_move = self._active_player.get_move(game_copy, time_left)
+            time_left = Deadline(time_limit)
+            curr_move = self.active_player.get_move(game_copy, time_left)
             move_end = time_left()
+            if move_times is not None:
+                move_times.append(time_limit - move_end)
 
             if curr_move is None:
                 curr_move = Board.NOT_MOVED
 
             if move_end < 0:
-                return self._inactive_player, move_history, "timeout"
+                reason = "timeout"
+                break
 
             if curr_move not in legal_player_moves:
                 if len(legal_player_moves) > 0:
-                    return self._inactive_player, move_history, "forfeit"
-                return self._inactive_player, move_history, "illegal move"
+                    reason = "forfeit"
+                else:
+                    reason = "illegal move"
+                break
 
             move_history.append(list(curr_move))
 
             self.apply_move(curr_move)
+
+        # Let the agents that keep working between turns stop
+        winner = self.inactive_player
+        for player in (self.active_player, self.inactive_player):
+            game_over = getattr(player, "game_over", None)
+            if game_over is not None:
+                game_over(self, winner)
+
+        return winner, move_history, reason
@@ -0,0 +1,89 @@
+"""
+This file contains batched move counting for the children of a node, used
+to score all the leaves below a node at once.
+
+Every mobility-based score (`open_move_score`, `improved_score` and the
+`custom_score` family) depends only on how many moves each player has in the
+scored position and how many of those moves they share. For the children of
+a node, where the player to move (A) picks one of its moves `m` and the
+opponent (B) stays at `loc_b`, these counts are popcounts of the knight-move
+masks and the mask `b` of blank cells of the node:
+
+    A's moves           masks[m] & b
+    B's moves           masks[loc_b] & b & ~(1 << m)
+    shared moves        masks[m] & masks[loc_b] & b
+
+(a knight never reaches its own cell, so moving A to `m` does not change
+A's own moves). Scoring a child this way costs a few integer operations,
+where calling the score function on it applies and undoes the move and
+rebuilds three or four move lists.
+"""
+from .endgame import knight_tables, popcount
+
+
+def child_mobility(game, moves):
+    """Count the moves of both players in each child of `game`.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        The parent position; its active player is A, the other player B.
+
+    moves : list<(int, int)>
+        Legal moves of A in `game`.
+
+    Returns
+    -------
+    (list<int>, list<int>, list<int>)
+        For each move, the number of legal moves of A and of B after the
+        move, and the number of moves they have in common.
+    """
+    height = game.height
+    masks, _ = knight_tables(game.width, height)
+    blank = game._blank_mask()
+    own = [masks[r + c * height] & blank for r, c in moves]
+    mob_a = [popcount(mask) for mask in own]
+
+    loc_b = game.get_player_location(game.inactive_player)
+    if loc_b is None:
+        # B is not placed yet, so every blank cell but A's is a move for B
+        return mob_a, [popcount(blank) - 1] * len(moves), mob_a
+
+    reach_b = masks[loc_b[0] + loc_b[1] * height] & blank
+    mob_b = [popcount(reach_b & ~(1 << (r + c * height))) for r, c in moves]
+    shared = [popcount(mask & reach_b) for mask in own]
+    return mob_a, mob_b, shared
+
+
+def child_scores(game, moves, player, batch_fn):
+    """Score every child of `game` reached by `moves` for `player`.
+
+    Parameters
+    ----------
+    game : `isolation.Board`
+        The parent position.
+
+    moves : list<(int, int)>
+        Legal moves of the active player of `game`.
+
+    player : object
+        The player whose point of view the scores take.
+
+    batch_fn : callable
+        The score function written in terms of move counts: maps the own,
+        opponent and shared move counts of `player` to a score.
+
+    Returns
+    -------
+    list<float>
+        The score of each child, equal to the score function's value on
+        that child, including +inf and -inf for won and lost children.
+    """
+    mob_a, mob_b, shared = child_mobility(game, moves)
+    if player == game.active_player:
+        counts, win = zip(mob_a, mob_b, shared), float("inf")
+    else:
+        counts, win = zip(mob_b, mob_a, shared), float("-inf")
+
+    # B is to move in every child, and loses if it has no moves left
+    return [float(batch_fn(*c)) if b else win for c, b in zip(counts, mob_b)]
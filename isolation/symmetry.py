@@ -0,0 +1,193 @@
+"""
+This file contains helpers for the symmetries of the Isolation board.
+
+Knight moves are preserved by every reflection and rotation of the board
+that maps it onto itself: the 8 transforms of the dihedral group for square
+boards, and the 4 that keep the board's orientation (identity, both mirror
+flips and the half turn) for rectangular boards. Positions related by one of
+these transforms have the same game value, so they can share cache entries,
+and moves related by a symmetry of the current position lead to equivalent
+subtrees and only need to be searched once.
+
+Transforms are represented as permutation tables over the cell index used by
+the boards (`row + col * height`). The helpers only rely on the public
+`Board` API, so they work with any board engine; `board_state()` and
+`build_board()` also serve to move positions between processes without
+pickling the players.
+"""
+from functools import reduce
+from operator import xor
+
+from .zobrist import zobrist_keys
+
+_TRANSFORMS = {}
+
+
+def transforms(width, height):
+    """Return the symmetry transforms of a board of the given size.
+
+    Parameters
+    ----------
+    width : int
+        The number of columns of the board.
+
+    height : int
+        The number of rows of the board.
+
+    Returns
+    -------
+    tuple<tuple<int>>
+        One permutation table per transform, mapping each cell index to the
+        index of its image. The identity always comes first.
+    """
+    key = (width, height)
+    if key not in _TRANSFORMS:
+        h, w = height - 1, width - 1
+        maps = [lambda r, c: (r, c),
+                lambda r, c: (h - r, c),
+                lambda r, c: (r, w - c),
+                lambda r, c: (h - r, w - c)]
+        if width == height:
+            maps += [lambda r, c: (c, r),
+                     lambda r, c: (w - c, h - r),
+                     lambda r, c: (c, h - r),
+                     lambda r, c: (w - c, r)]
+
+        cells = [(idx % height, idx // height) for idx in range(width * height)]
+        _TRANSFORMS[key] = tuple(
+            tuple(nr + nc * height for nr, nc in (f(r, c) for r, c in cells))
+            for f in maps)
+    return _TRANSFORMS[key]
+
+
+def inverse(perm):
+    """Return the permutation table of the inverse transform. """
+    inv = [0] * len(perm)
+    for idx, image in enumerate(perm):
+        inv[image] = idx
+    return tuple(inv)
+
+
+def transform_move(board, perm, move):
+    """Return the image of `move` (a (row, column) pair) under `perm`. """
+    idx = perm[move[0] + move[1] * board.height]
+    return (idx % board.height, idx // board.height)
+
+
+def board_state(board):
+    """Return the state of `board` as `(blocked, locations, initiative)`: the
+    indices of the blocked cells, the cell indices of player 1 and player 2
+    (or None), and 0 if player 1 is to move, 1 otherwise.
+    """
+    initiative = board.move_count % 2
+    if initiative:
+        player_1, player_2 = board.inactive_player, board.active_player
+    else:
+        player_1, player_2 = board.active_player, board.inactive_player
+
+    height = board.height
+    # Walk the set bits of the blocked cell mask, so the cost grows with the
+    # number of blocked cells rather than with the board area
+    blocked_mask = ~board._blank_mask() & ((1 << board.width * height) - 1)
+    blocked = []
+    while blocked_mask:
+        low = blocked_mask & -blocked_mask
+        blocked.append(low.bit_length() - 1)
+        blocked_mask ^= low
+    locations = tuple(None if loc is None else loc[0] + loc[1] * height
+                      for loc in (board.get_player_location(player_1),
+                                  board.get_player_location(player_2)))
+    return blocked, locations, initiative
+
+
+def canonical_key(board):
+    """Return the canonical hash of `board` under its symmetry group.
+
+    The canonical hash is the smallest Zobrist hash of all the transformed
+    positions, so every position in an orbit of the group gets the same key.
+
+    Returns
+    -------
+    (int, tuple<int>)
+        The canonical hash, and the transform mapping `board` onto the
+        canonical position (use its inverse to map canonical moves back).
+    """
+    cell_keys, location_keys, initiative_key = zobrist_keys(board.width, board.height)
+    blocked, locations, initiative = board_state(board)
+    base = initiative_key if initiative else 0
+
+    best = None
+    for perm in transforms(board.width, board.height):
+        key = reduce(xor, (cell_keys[perm[idx]] for idx in blocked), base)
+        for player, idx in enumerate(locations):
+            if idx is not None:
+                key ^= location_keys[player][perm[idx]]
+        if best is None or key < best[0]:
+            best = (key, perm)
+    return best
+
+
+def transform_board(board, perm):
+    """Return a new board holding the image of `board` under `perm`.
+
+    The result has the same class, players, initiative and move count as
+    `board`; blocked cells and both player locations are remapped. It is
+    built with `build_board()`, so it cannot be rewound with `undo_move()`
+    and its shuffle setting is the default.
+    """
+    blocked, locations, initiative = board_state(board)
+    player_1, player_2 = ((board.inactive_player, board.active_player)
+                          if initiative else
+                          (board.active_player, board.inactive_player))
+    return build_board(board.__class__, player_1, player_2, board.width,
+                       board.height, [perm[idx] for idx in blocked],
+                       tuple(None if idx is None else perm[idx] for idx in locations))
+
+
+def build_board(board_cls, player_1, player_2, width, height, blocked, locations):
+    """Create a board of class `board_cls` in the state given by the blocked
+    cells and the player locations (see `board_state()`), with any objects
+    as players. The move count is the number of blocked cells.
+
+    The state is reached by replaying moves onto an empty board: every move
+    blocks exactly one cell, so the vacated cells are blocked first and each
+    player's current cell is the last move of that player in the sequence.
+    """
+    board = board_cls(player_1, player_2, width=width, height=height)
+    move_count = len(blocked)
+    moves = [idx for idx in blocked if idx not in locations]
+    for ply in (move_count - 2, move_count - 1):
+        if ply >= 0:
+            moves.insert(ply, locations[ply % 2])
+    for idx in moves:
+        board.apply_move((idx % height, idx // height))
+    return board
+
+
+def stabilizer(board):
+    """Return the transforms that map `board` onto itself, including the
+    player locations. The identity is always included.
+    """
+    blocked, locations, _ = board_state(board)
+    blocked_set = set(blocked)
+    return [perm for perm in transforms(board.width, board.height)
+            if all(idx is None or perm[idx] == idx for idx in locations) and
+            all(perm[idx] in blocked_set for idx in blocked)]
+
+
+def unique_moves(board, moves):
+    """Remove moves that are symmetric to another move in `moves` under a
+    symmetry of the current position, keeping the order of the remaining
+    moves. On the empty 7x7 board this keeps 10 of the 49 opening moves.
+    """
+    group = stabilizer(board)
+    if len(group) == 1:
+        return moves
+
+    height = board.height
+    unique = []
+    for move in moves:
+        idx = move[0] + move[1] * height
+        if all(perm[idx] >= idx for perm in group):
+            unique.append(move)
+    return unique
@@ -0,0 +1,83 @@
+"""
+This file contains the Zobrist keys used to hash Isolation game states.
+
+A state is hashed by XOR-ing together one 64-bit key for every blocked cell,
+one key for the cell occupied by each player, and an extra key when player 2
+holds the initiative. The boards update their hash incrementally in
+`apply_move()`, so looking it up costs nothing at search time.
+
+The keys are drawn from a generator seeded only by the board size, so the
+hash of a given position is the same in every process and on every run
+(unlike `str.__hash__`, which is salted by PYTHONHASHSEED), and can be shared
+between workers or saved to disk.
+"""
+import random
+
+_KEYS = {}
+
+
+def zobrist_keys(width, height):
+    """Return the Zobrist keys for a board of the given size.
+
+    Parameters
+    ----------
+    width : int
+        The number of columns of the board.
+
+    height : int
+        The number of rows of the board.
+
+    Returns
+    -------
+    (tuple, (tuple, tuple), int)
+        A triple `(cells, locations, initiative)`: the key of each blocked
+        cell indexed like `Board._board_state`, the keys of each cell when
+        occupied by player 1 and by player 2, and the key for player 2
+        holding the initiative.
+    """
+    key = (width, height)
+    if key not in _KEYS:
+        size = width * height
+        rng = random.Random(size * 1000003 + height)
+        cells = tuple(rng.getrandbits(64) for _ in range(size))
+        locations = (tuple(rng.getrandbits(64) for _ in range(size)),
+                     tuple(rng.getrandbits(64) for _ in range(size)))
+        _KEYS[key] = (cells, locations, rng.getrandbits(64))
+    return _KEYS[key]
+
+
+def board_key(width, height, blocked, locations, initiative):
+    """Compute the Zobrist hash of a game state from scratch.
+
+    Parameters
+    ----------
+    width : int
+        The number of columns of the board.
+
+    height : int
+        The number of rows of the board.
+
+    blocked : iterable<int>
+        The indices of all blocked cells.
+
+    locations : (int or None, int or None)
+        The cell index of player 1 and player 2, or None if the player has
+        not moved yet.
+
+    initiative : int
+        0 if player 1 is to move, 1 otherwise.
+
+    Returns
+    -------
+    int
+        The 64-bit hash of the state; equal to the value maintained
+        incrementally by the boards.
+    """
+    cell_keys, location_keys, initiative_key = zobrist_keys(width, height)
+    key = initiative_key if initiative else 0
+    for idx in blocked:
+        key ^= cell_keys[idx]
+    for player, idx in enumerate(locations):
+        if idx is not None:
+            key ^= location_keys[player][idx]
+    return key
@@ -0,0 +1,354 @@
+"""Monte Carlo Tree Search player.
+
+`MCTSPlayer` grows a search tree from the current position for as long as
+the clock allows. Each iteration descends the tree with UCT (the child
+maximizing its win rate plus an exploration bonus), expands the first leaf
+it reaches, plays a random game from there and credits the result to every
+node on the way down. The move played is the most visited child of the root.
+
+Rollouts do not touch the `Board`: the position is three integers -- the
+bitmask of blank cells and the cell indices of the player to move and of its
+opponent -- and moves are drawn from the knight-move tables of
+`isolation.bitboard.move_tables()`, so a rollout costs a few integer
+operations per move.
+
+The tree is a `SearchTree`, whose node statistics live in flat typed arrays
+with the children of a node stored next to each other. After a move, the
+subtree under the move pair that was actually played (ours, then the
+opponent's) becomes the tree of the next turn, so the work spent on the
+expected replies is not lost.
+"""
+import math
+import random
+
+from array import array
+
+from isolation import Board
+from isolation.bitboard import move_tables
+from game_agent import SearchStats
+
+EXPLORATION = math.sqrt(2)  # UCT exploration constant for win rates in [0, 1]
+
+_NOT_MOVED = -1
+_UNEXPANDED = -1
+_TABLES = {}
+
+
+def rollout_tables(width, height):
+    """Return, for each cell of a board of the given size, the bits of the
+    cells a knight reaches from it.
+    """
+    key = (width, height)
+    if key not in _TABLES:
+        _, _, neighbours = move_tables(width, height)
+        _TABLES[key] = tuple(tuple(bit for bit, _ in moves) for moves in neighbours)
+    return _TABLES[key]
+
+
+def position(game):
+    """Return `(blank, own, opp)` for `game`: the bitmask of its blank cells
+    and the cell indices (or -1 before their first move) of the active and
+    the inactive player.
+    """
+    cells = []
+    for player in (game.active_player, game.inactive_player):
+        loc = game.get_player_location(player)
+        cells.append(_NOT_MOVED if loc is Board.NOT_MOVED else loc[0] + loc[1] * game.height)
+    return game._blank_mask(), cells[0], cells[1]
+
+
+def random_bit(mask):
+    """Return a uniformly chosen set bit of the nonzero `mask`. """
+    bits = []
+    while mask:
+        low = mask & -mask
+        bits.append(low)
+        mask ^= low
+    return random.choice(bits)
+
+
+class SearchTree:
+    """A game tree stored as parallel arrays indexed by node.
+
+    Node 0 is the root. The children of an expanded node occupy the
+    `counts[node]` indices starting at `firsts[node]`; `firsts[node]` is -1
+    until the node is expanded.
+
+    Attributes
+    ----------
+    cells : array<int>
+        The cell index of the move leading to each node (-1 for the root).
+
+    firsts, counts : array<int>
+        The index of the first child and the number of children.
+
+    visits : array<int>
+        The number of iterations that went through each node.
+
+    wins : array<float>
+        The number of those iterations won by the player who made the move
+        leading to the node.
+    """
+    def __init__(self):
+        self.clear()
+
+    def __len__(self):
+        return len(self.cells)
+
+    def clear(self):
+        """Remove every node and add a new, unexpanded root. """
+        self.cells = array("i")
+        self.firsts = array("i")
+        self.counts = array("i")
+        self.visits = array("I")
+        self.wins = array("d")
+        self.add(_NOT_MOVED)
+
+    def add(self, cell, visits=0, wins=0.):
+        """Append an unexpanded node and return its index. """
+        self.cells.append(cell)
+        self.firsts.append(_UNEXPANDED)
+        self.counts.append(0)
+        self.visits.append(visits)
+        self.wins.append(wins)
+        return len(self.cells) - 1
+
+    def expand(self, node, moves):
+        """Add a child of `node` for each set bit of the move mask `moves`,
+        in random order.
+        """
+        cells = []
+        while moves:
+            low = moves & -moves
+            cells.append(low.bit_length() - 1)
+            moves ^= low
+        random.shuffle(cells)
+        self.firsts[node] = len(self.cells)
+        self.counts[node] = len(cells)
+        for cell in cells:
+            self.add(cell)
+
+    def child(self, node, cell):
+        """Return the child of `node` reached by moving to `cell`, or None. """
+        first = self.firsts[node]
+        if first == _UNEXPANDED:
+            return None
+        for idx in range(first, first + self.counts[node]):
+            if self.cells[idx] == cell:
+                return idx
+        return None
+
+    def reroot(self, node, stop=None):
+        """Keep only the subtree under `node`, which becomes the root, and
+        return True. The nodes are copied breadth-first, so children stay
+        contiguous. If the optional callable `stop`, polled every few hundred
+        nodes, returns True, the copy is abandoned: the tree is cleared and
+        False is returned.
+        """
+        cells, firsts, counts, visits, wins = (
+            self.cells, self.firsts, self.counts, self.visits, self.wins)
+        self.clear()
+        self.visits[0], self.wins[0] = visits[node], wins[node]
+        queue = [node]
+        for new, old in enumerate(queue):
+            if stop is not None and not new & 0xFF and stop():
+                self.clear()
+                return False
+            first = firsts[old]
+            if first == _UNEXPANDED:
+                continue
+            self.firsts[new] = len(self.cells)
+            self.counts[new] = counts[old]
+            for idx in range(first, first + counts[old]):
+                self.add(cells[idx], visits[idx], wins[idx])
+                queue.append(idx)
+        return True
+
+
+class MCTSPlayer:
+    """Game-playing agent that chooses a move with Monte Carlo Tree Search
+    (UCT) and random rollouts.
+
+    Parameters
+    ----------
+    exploration : float (optional)
+        The UCT exploration constant.
+
+    max_nodes : int (optional)
+        Tree size above which leaves are no longer expanded; iterations then
+        run their rollout from the leaf they reach.
+
+    reuse_tree : bool (optional)
+        If True, the subtree under the moves played since the last call of
+        get_move() is kept as the new tree.
+
+    timeout : float (optional)
+        Time remaining (in milliseconds) when search is stopped.
+
+    Attributes
+    ----------
+    stats : `game_agent.SearchStats`
+        The statistics of the last search: `nodes` counts the tree nodes
+        visited, `leaves` the rollouts and `depth` the deepest node reached.
+
+    stats_log : list<`game_agent.SearchStats`> or None
+        If set to a list, the statistics of every move are appended to it.
+    """
+    def __init__(self, exploration=EXPLORATION, max_nodes=2**20,
+                 reuse_tree=True, timeout=10.):
+        self.exploration = exploration
+        self.max_nodes = max_nodes
+        self.reuse_tree = reuse_tree
+        self.time_left = None
+        self.TIMER_THRESHOLD = timeout
+        self.tree = SearchTree()
+        self.stats = SearchStats()
+        self.stats_log = None
+        self._last = None  # (position after our move, our move's node)
+
+    def get_move(self, game, time_left):
+        """Search for the best move from the available legal moves and return
+        it before the time limit runs out.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game (e.g., player locations and blocked cells).
+
+        time_left : callable
+            A function that returns the number of milliseconds left in the
+            current turn. Returning with any less than 0 ms remaining forfeits
+            the game.
+
+        Returns
+        -------
+        (int, int)
+            Board coordinates corresponding to a legal move; may return
+            (-1, -1) if there are no available legal moves.
+        """
+        self.time_left = time_left
+        self.stats = SearchStats()
+        if self.stats_log is not None:
+            self.stats_log.append(self.stats)
+
+        root = position(game)
+        self.start_tree(root)
+        tree = self.tree
+        masks = move_tables(game.width, game.height)[1]
+        bits = rollout_tables(game.width, game.height)
+        while self.time_left() > self.TIMER_THRESHOLD:
+            self.iterate(root, masks, bits)
+        self.stats.finish()
+
+        node = self.best_child(0)
+        if node is None:
+            self._last = None
+            return (-1, -1)
+        cell = tree.cells[node]
+        blank, own, opp = root
+        self._last = (blank & ~(1 << cell), opp, cell), node
+        return (cell % game.height, cell // game.height)
+
+    def start_tree(self, root):
+        """Make the tree rooted at the position `root`, reusing the subtree
+        of the last search if `root` follows from it by one opponent move.
+        The copy of the subtree is abandoned for an empty tree if it would
+        take more than half of the time left.
+        """
+        tree = self.tree
+        if self.reuse_tree and self._last is not None:
+            (blank, _, ours), node = self._last
+            reply = root[2]
+            if (root[1] == ours and root[0] == blank & ~(1 << reply) and
+                    reply != _NOT_MOVED):
+                child = tree.child(node, reply)
+                if child is not None:
+                    limit = (self.time_left() + self.TIMER_THRESHOLD) / 2
+                    tree.reroot(child, stop=lambda: self.time_left() < limit)
+                    return
+        tree.clear()
+
+    def best_child(self, node):
+        """Return the most visited child of `node`, or None if it has none. """
+        tree = self.tree
+        first = tree.firsts[node]
+        if first == _UNEXPANDED or not tree.counts[node]:
+            return None
+        visits = tree.visits
+        return max(range(first, first + tree.counts[node]), key=visits.__getitem__)
+
+    def select(self, node):
+        """Return the child of the expanded `node` with the highest UCT
+        score; unvisited children come first.
+        """
+        tree = self.tree
+        visits, wins = tree.visits, tree.wins
+        first = tree.firsts[node]
+        explore = self.exploration * math.sqrt(math.log(visits[node] or 1))
+        best, best_score = first, -1.
+        for idx in range(first, first + tree.counts[node]):
+            n = visits[idx]
+            if not n:
+                return idx
+            score = wins[idx] / n + explore / math.sqrt(n)
+            if score > best_score:
+                best, best_score = idx, score
+        return best
+
+    def iterate(self, root, masks, bits):
+        """Run one selection, expansion, rollout and backpropagation pass
+        from the position `root`.
+        """
+        tree = self.tree
+        blank, own, opp = root
+        node = 0
+        path = [0]
+        while tree.firsts[node] != _UNEXPANDED and tree.counts[node]:
+            node = self.select(node)
+            cell = tree.cells[node]
+            blank &= ~(1 << cell)
+            own, opp = opp, cell
+            path.append(node)
+
+        if tree.firsts[node] == _UNEXPANDED and len(tree) < self.max_nodes:
+            tree.expand(node, blank if own == _NOT_MOVED else masks[own] & blank)
+            if tree.counts[node]:
+                node = tree.firsts[node]
+                cell = tree.cells[node]
+                blank &= ~(1 << cell)
+                own, opp = opp, cell
+                path.append(node)
+
+        # Play random moves until the player to move is stuck; after an even
+        # number of plies that is the player to move at the leaf
+        plies = 0
+        while True:
+            if own == _NOT_MOVED:
+                if not blank:
+                    break
+                bit = random_bit(blank)
+            else:
+                moves = [bit for bit in bits[own] if blank & bit]
+                if not moves:
+                    break
+                bit = random.choice(moves)
+            blank &= ~bit
+            own, opp = opp, bit.bit_length() - 1
+            plies += 1
+
+        # The node at depth d was entered by a move of the root's active
+        # player if d is odd; the loser is the player to move after the
+        # leaf's depth plus the rollout's plies
+        leaf_depth = len(path) - 1
+        winner_parity = (leaf_depth + plies + 1) % 2
+        visits, wins = tree.visits, tree.wins
+        for depth, idx in enumerate(path):
+            visits[idx] += 1
+            if depth % 2 != winner_parity:
+                wins[idx] += 1
+
+        stats = self.stats
+        stats.nodes += len(path)
+        stats.leaves += 1
+        stats.depth = max(stats.depth, leaf_depth)
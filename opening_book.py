@@ -0,0 +1,193 @@
+"""Build opening books for Isolation.
+
+An opening book maps every position of the first few plies of the game to
+the move chosen by a long alpha-beta search, so that an agent can play the
+openings -- where `get_legal_moves()` returns every blank cell and an
+iterative deepening search within the turn time reaches almost no depth --
+without searching.
+
+Positions are stored once per orbit of the board's symmetry group: the key is
+the canonical hash from `isolation.symmetry.canonical_key()` and the move is
+stored for the canonical position, then mapped back onto the actual board
+with the inverse transform when it is looked up.
+
+The book file is a fixed header followed by an open-addressing hash table
+with linear probing. `competition_agent.OpeningBook` reads it through `mmap`
+so that opening it costs nothing and each lookup touches a few bytes; the
+reader and the format constants live in `competition_agent.py` because that
+file and the book are all the PvP competition ships:
+
+    header  magic (8 bytes), width, height, plies (uint16 each), 2 padding
+            bytes, number of slots (uint32)
+    slot    canonical hash (uint64), row and column of the canonical move
+            (uint8 each, 0xFF in an empty slot), 2 padding bytes, root score
+            (float32)
+
+All values are little-endian. The default file name is `data.json` because it
+is the only extra file the PvP competition accepts, although the content is
+binary.
+
+Usage:
+
+    python opening_book.py --plies 3 --time 2000 --processes 0
+"""
+import argparse
+import os
+
+from multiprocessing import Pool
+
+from isolation import BitBoard, Deadline
+from isolation.symmetry import (board_state, build_board, canonical_key,
+                                transform_move, unique_moves)
+from game_agent import (AlphaBetaPlayer, MoveOrdering, TranspositionTable,
+                        custom_score)
+from competition_agent import (BOOK_FILE, BOOK_HEADER, BOOK_SLOT, EMPTY_SLOT,
+                               MAGIC)
+
+PLIES = 2  # number of plies covered by the book
+SEARCH_TIME = 10000  # milliseconds spent searching each position
+
+DESCRIPTION = """
+This script builds an opening book: it searches every position of the first
+plies of the game (up to symmetry) with iterative deepening alpha-beta for a
+fixed time, and saves the best moves in a compact file that
+competition_agent.CustomPlayer reads at start-up.
+"""
+
+
+def write_book(path, width, height, plies, entries):
+    """Write an opening book file.
+
+    Parameters
+    ----------
+    path : str
+        The name of the file to write.
+
+    width, height : int
+        The size of the board the book applies to.
+
+    plies : int
+        The number of plies covered by the book.
+
+    entries : dict
+        Maps the canonical hash of each position to `(move, score)`, where
+        `move` is the move for the canonical position.
+    """
+    # Keep the load factor at or below one half so probe sequences stay short
+    size = 1
+    while size < 2 * len(entries):
+        size *= 2
+
+    slots = [None] * size
+    for key, entry in entries.items():
+        idx = key % size
+        while slots[idx] is not None:
+            idx = (idx + 1) % size
+        slots[idx] = (key, entry)
+
+    with open(path, "wb") as book_file:
+        book_file.write(BOOK_HEADER.pack(MAGIC, width, height, plies, size))
+        for slot in slots:
+            if slot is None:
+                book_file.write(BOOK_SLOT.pack(0, EMPTY_SLOT, EMPTY_SLOT, 0.))
+            else:
+                key, ((row, col), score) = slot
+                book_file.write(BOOK_SLOT.pack(key, row, col, score))
+
+
+def book_positions(width, height, plies):
+    """Return one board for each position of the first `plies` plies, up to
+    symmetry, as a dict keyed by canonical hash. The players are placeholder
+    objects.
+    """
+    board = BitBoard(object(), object(), width=width, height=height)
+    frontier = {canonical_key(board)[0]: board}
+    positions = dict()
+    for _ in range(plies):
+        positions.update(frontier)
+        children = dict()
+        for board in frontier.values():
+            for move in unique_moves(board, board.get_legal_moves()):
+                child = board.forecast_move(move)
+                children.setdefault(canonical_key(child)[0], child)
+        frontier = children
+    return positions
+
+
+def search_position(position, search_time):
+    """Search a position given as `(width, height, blocked, locations)` (see
+    `isolation.symmetry.board_state()`) for `search_time` milliseconds.
+
+    Returns
+    -------
+    ((int, int), float)
+        The best move and its score for the player to move.
+    """
+    width, height, blocked, locations = position
+    player = AlphaBetaPlayer(score_fn=custom_score, in_place=True,
+                             transposition_table=TranspositionTable(),
+                             move_ordering=MoveOrdering(), symmetry=True)
+    players = (object(), player) if len(blocked) % 2 else (player, object())
+    game = build_board(BitBoard, players[0], players[1], width, height,
+                       blocked, locations)
+
+    move = player.get_move(game, Deadline(search_time))
+    return move, player.root_value
+
+
+def _search_task(args):
+    return search_position(*args)
+
+
+def build_book(width, height, plies, search_time, processes=1):
+    """Search every position of the first `plies` plies and return the book
+    entries for `write_book()`.
+    """
+    entries = dict()
+    keys, tasks = [], []
+    for key, board in book_positions(width, height, plies).items():
+        blocked, locations, _ = board_state(board)
+        keys.append((key, board))
+        tasks.append(((width, height, blocked, locations), search_time))
+
+    if processes == 1:
+        results = map(_search_task, tasks)
+    else:
+        pool = Pool(processes)
+        results = pool.imap(_search_task, tasks)
+
+    for (key, board), (move, score) in zip(keys, results):
+        _, perm = canonical_key(board)
+        entries[key] = (transform_move(board, perm, move), score)
+        print("{:>6} positions searched".format(len(entries)), end="\r")
+    print()
+
+    if processes != 1:
+        pool.close()
+        pool.join()
+    return entries
+
+
+def main(args):
+    print(DESCRIPTION)
+    entries = build_book(args.width, args.height, args.plies, args.time,
+                         processes=args.processes or os.cpu_count())
+    write_book(args.output, args.width, args.height, args.plies, entries)
+    print("Wrote {} positions to {}".format(len(entries), args.output))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("-n", "--plies", type=int, default=PLIES,
+                        help="number of plies covered by the book")
+    parser.add_argument("-t", "--time", type=int, default=SEARCH_TIME,
+                        help="search time per position in milliseconds")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="number of worker processes (0 uses all cores)")
+    parser.add_argument("-W", "--width", type=int, default=7,
+                        help="number of columns of the board")
+    parser.add_argument("-H", "--height", type=int, default=7,
+                        help="number of rows of the board")
+    parser.add_argument("-o", "--output", default=BOOK_FILE,
+                        help="name of the book file")
+    main(parser.parse_args())
@@ -0,0 +1,521 @@
+"""Multi-core alpha-beta search for a single move.
+
+`ParallelAlphaBetaPlayer` keeps a pool of worker processes and spreads the
+search of every move over the calling process and the workers, in one of two
+modes:
+
+- "split": the root moves are dealt round-robin between the processes, and
+  each one runs its own iterative deepening search over its share. The
+  result is the best move of the deepest iteration that every process
+  completed. If a process completed no iteration or did not answer in time,
+  no iteration covers the whole root, and the hash move stored for the
+  position by an earlier search (e.g. while pondering) is played instead.
+- "lazy": Lazy SMP. Every process searches the whole tree from the root,
+  helpers starting at staggered depths, and all of them share one
+  transposition table so that each benefits from the others' results. The
+  result is the move of the deepest iteration completed by any process.
+
+In both modes the processes share a `SharedTranspositionTable` and stop at
+the same absolute deadline, computed from `time_left()` when the search
+starts.
+
+With `ponder=True` the player also searches on the opponent's time: after
+get_move() returns, a background process searches every reply to the move
+played, storing its results in the shared table. The next get_move() stops
+it and starts from the table, so its first passes are answered from the
+table. The background process competes with the opponent for the CPU, so
+pondering only pays off when there is a core to spare.
+"""
+import ctypes
+import itertools
+import math
+import struct
+import time
+
+from multiprocessing import Pool, RawArray, RawValue
+
+from isolation import BitBoard
+from isolation.symmetry import board_state, build_board
+from game_agent import (AlphaBetaPlayer, MoveOrdering, SearchTimeout,
+                        TranspositionTable, TTEntry, custom_score)
+
+_FLOAT = struct.Struct("<f")
+_UINT = struct.Struct("<I")
+
+_NO_MOVE = 0xFFFF
+_VALID = 1 << 15
+
+
+class SharedTranspositionTable(TranspositionTable):
+    """A `TranspositionTable` stored in shared memory, so that processes forked
+    after its creation all read and write the same entries.
+
+    Each entry is packed into two 64-bit words, `(key ^ data, data)`, where
+    `data` holds the depth (8 bits), bound flag (2 bits), generation (5 bits),
+    a valid bit, the best move (8 bits each for row and column) and the score
+    as a 32-bit float. Writes are not locked: an entry torn by two concurrent
+    writers fails the `key ^ data` check and reads as a miss.
+
+    Parameters
+    ----------
+    size : int (optional)
+        The number of slots in the table.
+
+    replacement : str (optional)
+        See `TranspositionTable`.
+    """
+    def __init__(self, size=2**18, replacement="depth"):
+        if replacement not in TranspositionTable.REPLACEMENT_POLICIES:
+            raise ValueError("Unknown replacement policy: {}".format(replacement))
+        self.size = size
+        self.replacement = replacement
+        self._slots = RawArray(ctypes.c_uint64, 2 * size)
+        self._generation = RawValue(ctypes.c_uint32, 0)
+
+    @property
+    def generation(self):
+        return self._generation.value
+
+    def clear(self):
+        """Remove every entry from the table. """
+        ctypes.memset(ctypes.addressof(self._slots), 0, ctypes.sizeof(self._slots))
+
+    def new_search(self):
+        """Mark all current entries as belonging to an earlier search. """
+        self._generation.value += 1
+
+    def lookup(self, key):
+        """Return the `TTEntry` stored for `key`, or None. """
+        idx = 2 * (key % self.size)
+        data = self._slots[idx + 1]
+        if not data & _VALID or self._slots[idx] ^ data != key:
+            return None
+
+        move = (data >> 16) & 0xFFFF
+        return TTEntry(key, data & 0xFF,
+                       _FLOAT.unpack(_UINT.pack(data >> 32))[0],
+                       (data >> 8) & 0x3,
+                       None if move == _NO_MOVE else (move >> 8, move & 0xFF),
+                       (data >> 10) & 0x1F)
+
+    def probe(self, key, depth, alpha, beta):
+        """Look up a position during the search; see `TranspositionTable`. """
+        entry = self.lookup(key)
+        if entry is None:
+            return None, None
+
+        if entry.depth >= depth:
+            score = entry.score
+            if (entry.flag == TranspositionTable.EXACT or
+                    entry.flag == TranspositionTable.LOWER and score >= beta or
+                    entry.flag == TranspositionTable.UPPER and score <= alpha):
+                return score, entry.move
+
+        return None, entry.move
+
+    def store(self, key, depth, score, alpha, beta, move):
+        """Record the result of searching a position; see `TranspositionTable`.
+        """
+        if score <= alpha:
+            flag = TranspositionTable.UPPER
+        elif score >= beta:
+            flag = TranspositionTable.LOWER
+        else:
+            flag = TranspositionTable.EXACT
+
+        idx = 2 * (key % self.size)
+        generation = self.generation & 0x1F
+        if self.replacement == "depth":
+            data = self._slots[idx + 1]
+            if (data & _VALID and self._slots[idx] ^ data != key and
+                    (data >> 10) & 0x1F == generation and data & 0xFF > depth):
+                return
+
+        packed_move = _NO_MOVE if move is None else (move[0] << 8) | move[1]
+        data = (_UINT.unpack(_FLOAT.pack(score))[0] << 32 | packed_move << 16 |
+                _VALID | generation << 10 | flag << 8 | min(depth, 0xFF))
+        self._slots[idx] = key ^ data
+        self._slots[idx + 1] = data
+
+
+class _Opponent:
+    """Stands in for the opponent on boards rebuilt in a worker process. """
+
+
+class SplitRootPlayer(AlphaBetaPlayer):
+    """An `AlphaBetaPlayer` that can be restricted to a share of the root moves.
+
+    When `root_share` is not None, only the moves it lists are searched at the
+    root; they must be legal in the root position.
+    """
+    root_share = None
+
+    def root_moves(self, game):
+        if self.root_share is not None:
+            return list(self.root_share)
+        return super().root_moves(game)
+
+
+class ParallelAlphaBetaPlayer(SplitRootPlayer):
+    """Game-playing agent that runs an iterative deepening alpha-beta search
+    on several cores at once.
+
+    The searches always use in-place moves, a `MoveOrdering`, symmetric root
+    move pruning and a `SharedTranspositionTable`. The search statistics
+    only cover the calling process's share of the search.
+
+    Parameters
+    ----------
+    processes : int (optional)
+        The number of worker processes used in addition to the calling
+        process. The pool is started on the first call to get_move() and
+        kept until close() is called.
+
+    mode : str (optional)
+        "split" to divide the root moves between the processes, or "lazy" to
+        run Lazy SMP helper searches; see the module documentation.
+
+    table_size : int (optional)
+        The number of slots of the shared transposition table.
+
+    ipc_margin : float (optional)
+        Time (in milliseconds) reserved for collecting the results of the
+        worker processes, on top of the timeout threshold.
+
+    ponder : bool (optional)
+        If True, search the replies to the move played in a background
+        process until the next call of get_move(); see the module
+        documentation. The process is started with the first search and kept
+        until close() is called.
+
+    ponder_limit : float (optional)
+        Time (in milliseconds) after which a background search stops even if
+        get_move() is not called again.
+
+    See `AlphaBetaPlayer` for the other parameters.
+
+    Attributes
+    ----------
+    ponder_depth : int
+        The depth of the last pass completed by the background search that
+        preceded the current move, 0 if there was none.
+    """
+    MODES = ("split", "lazy")
+
+    def __init__(self, search_depth=3, score_fn=custom_score, timeout=10.,
+                 processes=2, mode="split", table_size=2**18, ipc_margin=5.,
+                 ponder=False, ponder_limit=60000.):
+        if mode not in ParallelAlphaBetaPlayer.MODES:
+            raise ValueError("Unknown parallel search mode: {}".format(mode))
+        super().__init__(search_depth, score_fn, timeout, in_place=True,
+                         transposition_table=SharedTranspositionTable(table_size),
+                         move_ordering=MoveOrdering(), symmetry=True)
+        self.processes = processes
+        self.mode = mode
+        self.ipc_margin = ipc_margin
+        self.ponder = ponder
+        self.ponder_limit = ponder_limit
+        self.ponder_depth = 0
+        self._pool = None
+        self._stop = RawValue(ctypes.c_bool, False)
+        self._ponder_pool = None
+        self._ponder_stop = RawValue(ctypes.c_bool, False)
+        self._pondering = None
+
+    def __getstate__(self):
+        # The worker pools belong to the process that started them
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_ponder_pool"] = None
+        state["_pondering"] = None
+        return state
+
+    def close(self):
+        """Stop the worker processes. """
+        self.stop_pondering()
+        for pool in (self._pool, self._ponder_pool):
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        self._pool = self._ponder_pool = None
+
+    def game_over(self, game, winner):
+        """Stop searching on the opponent's time; called by `Board.play()`. """
+        self.stop_pondering()
+
+    def start_pondering(self, game, move):
+        """Start the background search of the replies to `move` in `game`;
+        the pondering pool must be running.
+        """
+        if move == (-1, -1):
+            return
+        game = game.forecast_move(move)
+        if not game.get_legal_moves():
+            return
+
+        blocked, locations, _ = board_state(game)
+        position = (game.width, game.height, blocked, locations)
+        deadline = time.monotonic() + self.ponder_limit / 1000.
+        self._ponder_stop.value = False
+        self._pondering = self._ponder_pool.apply_async(_ponder_task, (position, deadline))
+
+    def stop_pondering(self):
+        """Stop the background search, if any, and record its depth in
+        `ponder_depth`. A background process that does not stop within
+        `ipc_margin` is terminated.
+        """
+        self.ponder_depth = 0
+        if self._pondering is None:
+            return
+        self._ponder_stop.value = True
+        self._pondering.wait(self.ipc_margin / 1000.)
+        if self._pondering.ready():
+            self.ponder_depth = self._pondering.get()
+        else:
+            self._ponder_pool.terminate()
+            self._ponder_pool.join()
+            self._ponder_pool = None
+        self._pondering = None
+
+    def get_move(self, game, time_left):
+        """Search for the best move from the available legal moves and return a
+        result before the time limit expires; with `ponder` set, keep
+        searching the replies to that move until the next call.
+
+        Parameters
+        ----------
+        game : `isolation.Board`
+            An instance of `isolation.Board` encoding the current state of the
+            game (e.g., player locations and blocked cells).
+
+        time_left : callable
+            A function that returns the number of milliseconds left in the
+            current turn. Returning with any less than 0 ms remaining forfeits
+            the game.
+
+        Returns
+        -------
+        (int, int)
+            Board coordinates corresponding to a legal move; may return
+            (-1, -1) if there are no available legal moves.
+        """
+        self.stop_pondering()
+        if self.ponder and self._ponder_pool is None:
+            self._ponder_pool = Pool(1, initializer=_init_worker,
+                                     initargs=(self.score, self.TIMER_THRESHOLD,
+                                               self.transposition_table,
+                                               self._ponder_stop))
+        best_move = self.parallel_search(game, time_left)
+        if self.ponder:
+            self.start_pondering(game, best_move)
+        return best_move
+
+    def parallel_search(self, game, time_left):
+        """Search `game` with the calling process and the workers until
+        `time_left` runs out and return the best move; see get_move().
+        """
+        self.time_left = time_left
+        stats = self.new_stats()
+        self.new_search(game)
+        root_moves = self.root_moves(game)
+        if len(root_moves) <= 1:
+            stats.finish()
+            return root_moves[0] if root_moves else (-1, -1)
+
+        if self._pool is None and self.processes > 0:
+            self._pool = Pool(self.processes, initializer=_init_worker,
+                              initargs=(self.score, self.TIMER_THRESHOLD,
+                                        self.transposition_table, self._stop))
+
+        # Every process stops TIMER_THRESHOLD before the deadline, leaving
+        # ipc_margin to collect the results of the workers
+        deadline = time.monotonic() + (time_left() - self.ipc_margin) / 1000.
+        self._stop.value = False
+
+        # A move from a search of the whole root, in case the split search
+        # does not complete one
+        entry = self.transposition_table.lookup(game.hash())
+        hash_move = entry.move if entry is not None else None
+
+        blocked, locations, _ = board_state(game)
+        position = (game.width, game.height, blocked, locations)
+        if self.mode == "split":
+            shares = [root_moves[i::self.processes + 1]
+                      for i in range(self.processes + 1)]
+            tasks = [(position, share, 1) for share in shares[1:]]
+            own_share, own_start = shares[0], 1
+        else:
+            tasks = [(position, None, 1 + (i + 1) % 2)
+                     for i in range(self.processes)]
+            own_share, own_start = None, 1
+
+        pending = [self._pool.apply_async(_search_task, task + (deadline,))
+                   for task in tasks]
+
+        shuffle_moves = game.shuffle_moves
+        game.shuffle_moves = False
+        results = [iterate(self, game, own_share, own_start,
+                           deadline_timer(deadline, self._stop))]
+        game.shuffle_moves = shuffle_moves
+
+        for result in pending:
+            result.wait(max(0., (time_left() - self.TIMER_THRESHOLD) / 1000.))
+            results.append(result.get() if result.ready() else None)
+        self._stop.value = True
+
+        if self.mode == "split":
+            stats.missing_shares = sum(not result for result in results)
+            best_move = merge_split(results)
+            if best_move is None and hash_move in game.get_legal_moves(self):
+                best_move = hash_move
+        else:
+            best_move = merge_lazy(results)
+        stats.finish()
+        return best_move if best_move is not None else root_moves[0]
+
+
+def deadline_timer(deadline, stop):
+    """Return a `time_left` function counting down to `deadline` (in seconds
+    of `time.monotonic()`, which is shared by all processes) that drops to
+    -inf once the `stop` flag is set.
+    """
+    def time_left():
+        if stop.value:
+            return float("-inf")
+        return 1000. * (deadline - time.monotonic())
+    return time_left
+
+
+def iterate(player, game, root_share, first_depth, time_left):
+    """Run iterative deepening with `player` from `game` until `time_left`
+    runs out, or until a pass over the whole root settles the game,
+    searching only `root_share` at the root if it is not None.
+    Completed passes are recorded in `player.stats`.
+
+    Returns
+    -------
+    dict
+        Maps every completed depth to the pair (best move, root score).
+    """
+    player.time_left = time_left
+    player.root_share = root_share
+    move_count = game.move_count
+    results = dict()
+
+    try:
+        for depth in itertools.count(first_depth):
+            player.horizon_reached = False
+            player.move_ordering.new_iteration(game)
+            move = player.alphabeta(game, depth)
+            results[depth] = (move, player.root_value)
+            player.stats.complete_iteration(depth)
+            # A share of the root settles nothing about the other shares
+            if root_share is None and player.resolved():
+                break
+    except SearchTimeout:
+        player.unwind(game, move_count)
+
+    player.root_share = None
+    return results
+
+
+def ponder(player, game, time_left):
+    """Run iterative deepening with `player` over the replies of its
+    opponent, the player to move in `game`, until `time_left` runs out or a
+    pass settles the game. The results are only kept in the player's
+    transposition table, where they serve the search from the position after
+    the actual reply.
+
+    Returns
+    -------
+    int
+        The depth of the last completed pass, 0 if there was none.
+    """
+    player.time_left = time_left
+    player._root_move_count = game.move_count
+    completed = 0
+
+    try:
+        for depth in itertools.count(1):
+            player.horizon_reached = False
+            player.move_ordering.new_iteration(game)
+            value = player.min_play(game, depth, float("-inf"), float("inf"))
+            completed = depth
+            if not player.horizon_reached or math.isinf(value):
+                break
+    except SearchTimeout:
+        pass
+
+    return completed
+
+
+def merge_split(results):
+    """Return the best move of the deepest iteration completed by every
+    process that searched a share of the root, or None if there is no such
+    iteration. `results` holds the result of `iterate()` for every share,
+    None for a process that did not answer.
+    """
+    if not all(results):
+        return None
+    depth = max(set.intersection(*(set(result) for result in results)), default=None)
+    if depth is None:
+        return None
+    return max((result[depth] for result in results), key=lambda r: r[1])[0]
+
+
+def merge_lazy(results):
+    """Return the move of the deepest iteration completed by any process,
+    preferring the earliest result on ties, or None.
+    """
+    best = None
+    for result in results:
+        if result and (best is None or max(result) > best[0]):
+            best = (max(result), result[max(result)][0])
+    return best[1] if best is not None else None
+
+
+# The player of a worker process, set by _init_worker()
+_worker_player = None
+_worker_stop = None
+
+
+def _init_worker(score_fn, timeout, table, stop):
+    """Create the search player owned by a worker process. """
+    global _worker_player, _worker_stop
+    _worker_player = SplitRootPlayer(score_fn=score_fn, timeout=timeout,
+                                     in_place=True, transposition_table=table,
+                                     move_ordering=MoveOrdering(), symmetry=True)
+    _worker_stop = stop
+
+
+def _worker_board(position, to_move):
+    """Rebuild `position` in a worker process, with the worker's player to
+    move if `to_move` is True and its opponent to move otherwise.
+    """
+    width, height, blocked, locations = position
+    if (len(blocked) % 2 == 1) == to_move:
+        players = (_Opponent(), _worker_player)
+    else:
+        players = (_worker_player, _Opponent())
+    game = build_board(BitBoard, players[0], players[1], width, height,
+                       blocked, locations)
+    game.shuffle_moves = False
+
+    _worker_player.move_ordering.new_search()
+    _worker_player.new_stats()
+    return game
+
+
+def _search_task(position, root_share, first_depth, deadline):
+    """Search `position` in a worker process until `deadline`. """
+    game = _worker_board(position, True)
+    return iterate(_worker_player, game, root_share, first_depth,
+                   deadline_timer(deadline, _worker_stop))
+
+
+def _ponder_task(position, deadline):
+    """Search the opponent's replies in `position` in a worker process until
+    `deadline` or until the worker's stop flag is set.
+    """
+    game = _worker_board(position, False)
+    return ponder(_worker_player, game, deadline_timer(deadline, _worker_stop))
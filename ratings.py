@@ -0,0 +1,242 @@
+"""Rate agents from game results with a Bradley-Terry model.
+
+The model gives every agent a strength `theta` such that agent i beats agent
+j with probability
+
+    p_ij = 1 / (1 + exp(theta_j - theta_i))
+
+Ratings are reported on the Elo scale (400 / ln(10) points per unit of
+theta, so a 200 point lead means a 76% win rate). A normal prior centred on
+0 keeps the ratings of unbeaten and winless agents finite. After each game
+the two agents' ratings are refreshed with a few coordinate Newton steps
+from their current values, so results can be streamed in one game at a
+time. The confidence interval of a rating comes from the curvature of the
+log-posterior at that rating.
+
+Instead of a full round robin, whose cost grows with the square of the
+number of agents, `Ratings.next_pairing()` picks the pair whose next game
+is expected to shrink the rating uncertainty the most: agents with close and
+uncertain ratings that have not played each other much yet.
+
+Usage:
+
+    python ratings.py --records games.jsonl
+    python ratings.py --records games.jsonl --play 200
+"""
+import argparse
+import itertools
+import math
+import random
+
+from game_records import GameRecorder, read_records
+from tournament import Agent, play_fair_pair
+from mcts_agent import MCTSPlayer
+from sample_players import open_move_score, improved_score, center_score
+from game_agent import (MinimaxPlayer, AlphaBetaPlayer, custom_score,
+                        custom_score_2, custom_score_3)
+
+ELO_SCALE = 400 / math.log(10)  # Elo points per unit of theta
+PRIOR_SIGMA = 2.  # standard deviation of the prior on theta
+CONFIDENCE_Z = 1.96  # 95% confidence intervals
+NEWTON_STEPS = 2  # Newton steps per rating and game
+
+DESCRIPTION = """
+This script rates agents with a Bradley-Terry model from a file of game
+records written by tournament.py, and can play more games between the pairs
+of agents whose ratings are the least certain.
+"""
+
+
+class Ratings:
+    """Incremental Bradley-Terry ratings with confidence intervals.
+
+    Parameters
+    ----------
+    prior_sigma : float (optional)
+        The standard deviation of the normal prior on each strength.
+    """
+    def __init__(self, prior_sigma=PRIOR_SIGMA):
+        self.prior_precision = 1 / prior_sigma ** 2
+        self.theta = dict()
+        self.wins = dict()  # wins[a][b]: number of games a won against b
+        self.games = dict()  # games[a][b]: number of games between a and b
+
+    def add_agent(self, name):
+        """Register the agent `name` if it is new. """
+        if name not in self.theta:
+            self.theta[name] = 0.
+            self.wins[name] = dict()
+            self.games[name] = dict()
+
+    def add_game(self, winner, loser):
+        """Add the result of one game and update the ratings of both agents. """
+        for name in (winner, loser):
+            self.add_agent(name)
+        self.wins[winner][loser] = self.wins[winner].get(loser, 0) + 1
+        for a, b in ((winner, loser), (loser, winner)):
+            self.games[a][b] = self.games[a].get(b, 0) + 1
+        for _ in range(NEWTON_STEPS):
+            self._newton_step(winner)
+            self._newton_step(loser)
+
+    def add_record(self, record):
+        """Add a game record written by `game_records.GameRecorder`. """
+        winner = record["players"][record["winner"]]
+        loser = record["players"][1 - record["winner"]]
+        if winner != loser:
+            self.add_game(winner, loser)
+
+    def _gradient_hessian(self, name):
+        # First and (negated) second derivative of the log-posterior in theta
+        theta = self.theta[name]
+        gradient = -self.prior_precision * theta
+        hessian = self.prior_precision
+        wins = self.wins[name]
+        for opponent, games in self.games[name].items():
+            p = 1 / (1 + math.exp(self.theta[opponent] - theta))
+            gradient += wins.get(opponent, 0) - games * p
+            hessian += games * p * (1 - p)
+        return gradient, hessian
+
+    def _newton_step(self, name):
+        gradient, hessian = self._gradient_hessian(name)
+        self.theta[name] += gradient / hessian
+        return abs(gradient / hessian)
+
+    def fit(self, tolerance=1e-6, max_sweeps=1000):
+        """Run Newton sweeps over all agents until the ratings converge. """
+        for _ in range(max_sweeps):
+            if max(map(self._newton_step, list(self.theta)), default=0) < tolerance:
+                break
+
+    def variance(self, name):
+        """Return the variance of the strength of `name` (in theta units). """
+        return 1 / self._gradient_hessian(name)[1]
+
+    def rating(self, name):
+        """Return the Elo rating of `name` and the half-width of its
+        confidence interval.
+        """
+        return (ELO_SCALE * self.theta[name],
+                ELO_SCALE * CONFIDENCE_Z * math.sqrt(self.variance(name)))
+
+    def win_probability(self, a, b):
+        """Return the probability that `a` beats `b`. """
+        return 1 / (1 + math.exp(self.theta[b] - self.theta[a]))
+
+    def information(self, a, b):
+        """Return the expected decrease of the summed rating variances of
+        `a` and `b` after one more game between them, divided by one plus
+        the number of games they already played against each other.
+
+        The variances ignore the correlation between ratings, so they
+        overrate games between agents that keep playing each other: those
+        pin down the difference of their ratings but not where the pair
+        stands among the other agents.
+        """
+        p = self.win_probability(a, b)
+        gain = p * (1 - p)
+        total = 0.
+        for name in (a, b):
+            hessian = self._gradient_hessian(name)[1]
+            total += 1 / hessian - 1 / (hessian + gain)
+        return total / (1 + self.games[a].get(b, 0))
+
+    def next_pairing(self, names=None):
+        """Return the pair of agents, from `names` or all registered agents,
+        whose next game is the most informative.
+        """
+        names = sorted(self.theta if names is None else names)
+        for name in names:
+            self.add_agent(name)
+        return max(itertools.combinations(names, 2),
+                   key=lambda pair: self.information(*pair))
+
+    def table(self):
+        """Return `(name, rating, interval, games)` for every agent, best
+        first.
+        """
+        rows = [(name,) + self.rating(name) + (sum(self.games[name].values()),)
+                for name in self.theta]
+        return sorted(rows, key=lambda row: -row[1])
+
+
+def print_ratings(ratings):
+    """Print the rating table. """
+    print("\n{:<16}{:>8}{:>10}{:>8}".format("Agent", "Elo", "95% CI", "Games"))
+    for name, rating, interval, games in ratings.table():
+        print("{:<16}{:>8.0f}{:>10}{:>8}".format(
+            name, rating, "+/-{:.0f}".format(interval), games))
+
+
+def play_rated(agents, ratings, num_pairs, seed=None, recorder=None):
+    """Play `num_pairs` fair pairs between the pairs of `agents` chosen by
+    `ratings.next_pairing()`, adding every game to `ratings` and writing it
+    to `recorder` if it is given.
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    by_name = {agent.name: agent for agent in agents}
+    for pair_idx in range(num_pairs):
+        a, b = ratings.next_pairing(by_name)
+        records = []
+        play_fair_pair(by_name[a], by_name[b], seed + pair_idx, records)
+        for record in records:
+            ratings.add_record(record)
+            if recorder is not None:
+                recorder.write(record)
+        print("{:>6} pairs played, last {} vs {}".format(pair_idx + 1, a, b),
+              end="\r", flush=True)
+    print()
+
+
+def default_agents():
+    """Return the agents of the tournament, with unique names, and the MCTS
+    agent.
+    """
+    return [
+        Agent(MinimaxPlayer(score_fn=open_move_score), "MM_Open"),
+        Agent(MinimaxPlayer(score_fn=center_score), "MM_Center"),
+        Agent(MinimaxPlayer(score_fn=improved_score), "MM_Improved"),
+        Agent(AlphaBetaPlayer(score_fn=open_move_score), "AB_Open"),
+        Agent(AlphaBetaPlayer(score_fn=center_score), "AB_Center"),
+        Agent(AlphaBetaPlayer(score_fn=improved_score), "AB_Improved"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score), "AB_Custom"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score_2), "AB_Custom_2"),
+        Agent(AlphaBetaPlayer(score_fn=custom_score_3), "AB_Custom_3"),
+        Agent(MCTSPlayer(), "MCTS"),
+    ]
+
+
+def main(args):
+    print(DESCRIPTION)
+    ratings = Ratings()
+    if args.records:
+        try:
+            for record in read_records(args.records):
+                ratings.add_record(record)
+        except FileNotFoundError:
+            pass
+        ratings.fit()
+
+    if args.play:
+        recorder = GameRecorder(args.records) if args.records else None
+        try:
+            play_rated(default_agents(), ratings, args.play, args.seed, recorder)
+        finally:
+            if recorder is not None:
+                recorder.close()
+        ratings.fit()
+
+    print_ratings(ratings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("-r", "--records", default=None,
+                        help="game record file to read, and to append new games to")
+    parser.add_argument("-n", "--play", type=int, default=0,
+                        help="number of scheduled fair pairs to play")
+    parser.add_argument("-s", "--seed", type=int, default=None,
+                        help="seed of the random openings")
+    main(parser.parse_args())
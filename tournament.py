@@ -11,13 +11,18 @@ players, and the players play each match twice -- once as the first player and
 once as the second player.  Randomizing the openings and switching the player
 order corrects for imbalances due to both starting position and initiative.
 """
+import argparse
 import itertools
+import math
+import os
 import random
 import warnings
 
 from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 
-from isolation import Board
+from isolation import BitBoard
+from game_records import GameRecorder, game_record
 from sample_players import (RandomPlayer, open_move_score,
                             improved_score, center_score)
 from game_agent import (MinimaxPlayer, AlphaBetaPlayer, custom_score,
@@ -26,6 +31,11 @@ from game_agent import (MinimaxPlayer, AlphaBetaPlayer, custom_score,
 NUM_MATCHES = 5  # number of matches against each opponent
 TIME_LIMIT = 150  # number of milliseconds before timeout
 
+SPRT_MARGIN = 0.1  # difference in win rate the SPRT mode detects
+SPRT_ALPHA = 0.05  # SPRT error rates
+SPRT_BETA = 0.05
+SPRT_MAX_PAIRS = 1000  # fair pairs played before an SPRT gives up
+
 DESCRIPTION = """
 This script evaluates the performance of the custom_score evaluation
 function against a baseline agent using alpha-beta search and iterative
@@ -37,38 +47,350 @@ game_agent.py.
 Agent = namedtuple("Agent", ["player", "name"])
 
 
-def play_round(cpu_agent, test_agents, win_counts, num_matches):
+def play_fair_pair(cpu_agent, test_agent, seed, records=None):
+    """Play a "fair" pair of games between the cpu agent and a test agent.
+
+    Both games start from the same random opening move and response, drawn
+    from `seed`, and each agent moves first in one of them. The global random
+    state is also reseeded before each game, so board move shuffles and
+    random players are reproducible; the search depth of timed agents still
+    depends on the machine.
+
+    If `records` is a list, the record of each game (see
+    `game_records.game_record()`) is appended to it.
+
+    Returns
+    -------
+    list<(bool, str)>
+        For each game, whether the test agent won and the termination reason
+        reported by `Board.play()`.
+    """
+    rng = random.Random(seed)
+    pairings = [(cpu_agent, test_agent), (test_agent, cpu_agent)]
+    games = [BitBoard(first.player, second.player) for first, second in pairings]
+
+    # initialize both games with a random move and response
+    opening = []
+    for _ in range(2):
+        opening.append(rng.choice(games[0].get_legal_moves()))
+        for game in games:
+            game.apply_move(opening[-1])
+
+    results = []
+    for order, game in enumerate(games):
+        random.seed(2 * seed + order)
+        move_times = [] if records is not None else None
+        winner, history, termination = game.play(time_limit=TIME_LIMIT,
+                                                 move_times=move_times)
+        results.append((winner == test_agent.player, termination))
+        if records is not None:
+            first, second = pairings[order]
+            records.append(game_record(
+                (first.name, second.name), seed, opening, history, move_times,
+                int(winner == second.player), termination))
+    return results
+
+
+def tally(results, cpu_agent, test_agent, win_counts):
+    """Add the results of `play_fair_pair()` to the win counts.
+
+    Returns
+    -------
+    (int, int)
+        The number of games lost on timeout by either agent, and the number
+        of games the test agent forfeited while it still had legal moves.
+    """
+    timeout_count = 0
+    forfeit_count = 0
+    for test_won, termination in results:
+        win_counts[test_agent.player if test_won else cpu_agent.player] += 1
+        if termination == "timeout":
+            timeout_count += 1
+        elif not test_won and termination == "forfeit":
+            forfeit_count += 1
+    return timeout_count, forfeit_count
+
+
+def match_seed(seed, round_idx, match_idx, num_matches):
+    """Return the opening seed of a match; every test agent plays the same
+    opening in the same match against the same cpu agent.
+    """
+    return seed + round_idx * num_matches + match_idx
+
+
+def play_round(cpu_agent, test_agents, win_counts, num_matches, seed=None,
+               recorder=None):
     """Compare the test agents to the cpu agent in "fair" matches.
 
     "Fair" matches use random starting locations and force the agents to
     play as both first and second player to control for advantages resulting
     from choosing better opening moves or having first initiative to move.
+    Every game is written to the `GameRecorder` `recorder` if it is given.
     """
+    if seed is None:
+        seed = random.randrange(2**32)
+
     timeout_count = 0
     forfeit_count = 0
-    for _ in range(num_matches):
+    for match_idx in range(num_matches):
+        for agent in test_agents:
+            records = [] if recorder is not None else None
+            results = play_fair_pair(cpu_agent, agent, seed + match_idx, records)
+            for record in records or ():
+                recorder.write(record)
+            counts = tally(results, cpu_agent, agent, win_counts)
+            timeout_count += counts[0]
+            forfeit_count += counts[1]
 
-        games = sum([[Board(cpu_agent.player, agent.player),
-                      Board(agent.player, cpu_agent.player)]
-                    for agent in test_agents], [])
+    return timeout_count, forfeit_count
 
-        # initialize all games with a random move and response
-        for _ in range(2):
-            move = random.choice(games[0].get_legal_moves())
-            for game in games:
-                game.apply_move(move)
 
-        # play all games and tally the results
-        for game in games:
-            winner, _, termination = game.play(time_limit=TIME_LIMIT)
-            win_counts[winner] += 1
+# Agents owned by a tournament worker process, set by _init_worker()
+_worker_agents = None
 
-        if termination == "timeout":
-            timeout_count += 1
-        elif winner not in test_agents and termination == "forfeit":
-            forfeit_count += 1
 
-    return timeout_count, forfeit_count
+def _init_worker(cpu_agents, test_agents):
+    """Give the worker process its own copies of all agents. """
+    global _worker_agents
+    _worker_agents = (cpu_agents, test_agents)
+
+
+def _play_fair_pair_task(cpu_idx, test_idx, seed, record):
+    """Play a fair pair in a worker process using the worker's agents, and
+    return the results with the search statistics of both agents and the
+    game records (None unless `record` is True).
+    """
+    cpu_agents, test_agents = _worker_agents
+    cpu_agent, test_agent = cpu_agents[cpu_idx], test_agents[test_idx]
+    records = [] if record else None
+    results = play_fair_pair(cpu_agent, test_agent, seed, records)
+    return results, pop_stats(cpu_agent), pop_stats(test_agent), records
+
+
+class StatsSummary:
+    """The search statistics of one agent summed over a tournament. """
+    def __init__(self):
+        self.moves = 0
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.depth = 0
+        self.time = 0.
+        self.ebf_total = 0.
+        self.ebf_count = 0
+
+    def add(self, stats_log):
+        """Add the `SearchStats` of every move in `stats_log`. """
+        for stats in stats_log:
+            self.moves += 1
+            self.nodes += stats.nodes
+            self.leaves += stats.leaves
+            self.cutoffs += stats.cutoffs
+            self.first_move_cutoffs += stats.first_move_cutoffs
+            self.tt_probes += stats.tt_probes
+            self.tt_hits += stats.tt_hits
+            self.depth += stats.depth
+            self.time += stats.time
+            if stats.effective_branching_factor is not None:
+                self.ebf_total += stats.effective_branching_factor
+                self.ebf_count += 1
+
+    def row(self):
+        """Return the per-move averages printed by `print_stats()`. """
+        def ratio(num, den, fmt):
+            return fmt.format(num / den) if den else "-"
+        return (self.moves,
+                ratio(self.depth, self.moves, "{:.2f}"),
+                ratio(self.nodes, self.moves, "{:.0f}"),
+                ratio(self.nodes / 1000., self.time, "{:.1f}"),
+                ratio(self.ebf_total, self.ebf_count, "{:.2f}"),
+                ratio(100. * self.first_move_cutoffs, self.cutoffs, "{:.1f}%"),
+                ratio(100. * self.tt_hits, self.tt_probes, "{:.1f}%"))
+
+
+def enable_stats(agents):
+    """Make the agents that keep search statistics log them for every move. """
+    for agent in agents:
+        if hasattr(agent.player, "stats_log"):
+            agent.player.stats_log = []
+
+
+def pop_stats(agent):
+    """Return the search statistics logged by `agent` since the last call. """
+    stats_log = getattr(agent.player, "stats_log", None) or []
+    if stats_log:
+        agent.player.stats_log = []
+    return stats_log
+
+
+def print_stats(summaries):
+    """Print the search statistics of the agents that logged any. """
+    rows = [(agent.name, summary.row()) for agent, summary in summaries
+            if summary.moves]
+    if not rows:
+        return
+    line = "{:^13}{:>7}{:>9}{:>12}{:>9}{:>7}{:>9}{:>9}"
+    print()
+    print(line.format("Agent", "Moves", "Depth", "Nodes/move", "kNode/s",
+                      "EBF", "1st cut", "TT hits"))
+    for name, row in rows:
+        print(line.format(name, *row))
+
+
+class SPRT:
+    """A sequential test of whether one agent is stronger than another,
+    from the scores of fair pairs of games played between them.
+
+    The score of a fair pair is the fraction of its two games the tested
+    agent won (0, 0.5 or 1), with mean `mu`. Two one-sided generalized
+    sequential probability ratio tests (GSPRT) run side by side, with the
+    log-likelihood ratio of a normal approximation whose variance is
+    estimated from the scores:
+
+        stronger    H0: mu = 0.5    against    H1: mu = 0.5 + margin
+        weaker      H0: mu = 0.5    against    H1: mu = 0.5 - margin
+
+    The test ends as soon as either one accepts H1, or both accept H0 --
+    the agents are then equal within the margin. `alpha` is the probability
+    of declaring equal agents different, and `beta` the probability of
+    missing a difference of `margin`.
+
+    Parameters
+    ----------
+    margin : float (optional)
+        The difference in win rate to detect.
+
+    alpha, beta : float (optional)
+        The error rates of each one-sided test.
+    """
+    def __init__(self, margin=SPRT_MARGIN, alpha=SPRT_ALPHA, beta=SPRT_BETA):
+        self.margin = margin
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.pairs = 0
+        self.total = 0.
+        self.total_sq = 0.
+
+    def add(self, score):
+        """Add the score of one fair pair. """
+        self.pairs += 1
+        self.total += score
+        self.total_sq += score * score
+
+    @property
+    def mean(self):
+        """The mean score of the tested agent, or None before any pair. """
+        return self.total / self.pairs if self.pairs else None
+
+    def variance(self):
+        """Return the variance of a pair score, estimated with one extra
+        pair won and one lost so that it is never zero.
+        """
+        n = self.pairs + 2
+        mean = (self.total + 1) / n
+        return (self.total_sq + 1) / n - mean * mean
+
+    def llr(self, mu1, mu0=0.5):
+        """Return the log-likelihood ratio of mean `mu1` to mean `mu0`. """
+        return (mu1 - mu0) * (self.total - self.pairs * (mu0 + mu1) / 2) \
+            / self.variance()
+
+    def status(self):
+        """Return "stronger", "weaker" or "equal" once the test has ended,
+        or None while it goes on.
+        """
+        stronger = self.llr(0.5 + self.margin)
+        weaker = self.llr(0.5 - self.margin)
+        if stronger >= self.upper:
+            return "stronger"
+        if weaker >= self.upper:
+            return "weaker"
+        if stronger <= self.lower and weaker <= self.lower:
+            return "equal"
+        return None
+
+
+def play_sprt(agent, baseline, sprt, max_pairs=SPRT_MAX_PAIRS, processes=1,
+              seed=None, recorder=None):
+    """Play fair pairs between `agent` and `baseline` until the `SPRT` test
+    `sprt` ends or `max_pairs` pairs have been played.
+
+    The pairs use the openings of consecutive match seeds. With more than
+    one process, up to `processes` pairs are played at a time, but their
+    scores are still added to the test in pair order, as in a sequential
+    run: a pair that ends early (e.g. by a loss on time) waits for the pairs
+    before it, and the pairs played past the one that ends the test are
+    discarded. The result is thus reproducible from `seed` in both modes.
+
+    Returns
+    -------
+    str or None
+        The result of `sprt.status()`: whether `agent` is "stronger",
+        "weaker" or "equal" to `baseline`, or None if no decision was
+        reached.
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+
+    def add(results, records):
+        sprt.add(sum(test_won for test_won, _ in results) / 2)
+        for record in records or ():
+            recorder.write(record)
+        print("{:>6} pairs   score {:.3f}   LLR {:+.2f} / {:+.2f}   [{:.2f}, {:.2f}]"
+              .format(sprt.pairs, sprt.mean, sprt.llr(0.5 + sprt.margin),
+                      sprt.llr(0.5 - sprt.margin), sprt.lower, sprt.upper),
+              end="\r", flush=True)
+        return sprt.status()
+
+    summaries = [(agent, StatsSummary()), (baseline, StatsSummary())]
+    enable_stats([agent, baseline])
+    status = None
+    if processes <= 1:
+        for pair_idx in range(max_pairs):
+            records = [] if recorder is not None else None
+            results = play_fair_pair(baseline, agent, seed + pair_idx, records)
+            summaries[0][1].add(pop_stats(agent))
+            summaries[1][1].add(pop_stats(baseline))
+            status = add(results, records)
+            if status is not None:
+                break
+    else:
+        pool = ProcessPoolExecutor(processes, initializer=_init_worker,
+                                   initargs=([baseline], [agent]))
+        submitted = added = 0
+        running = {}
+        finished = {}
+        while status is None and added < max_pairs:
+            while submitted < max_pairs and len(running) < processes:
+                future = pool.submit(_play_fair_pair_task, 0, 0, seed + submitted,
+                                     recorder is not None)
+                running[future] = submitted
+                submitted += 1
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                finished[running.pop(future)] = future.result()
+            # Add the scores strictly in pair order, so that short pairs do
+            # not reach the test ahead of the longer ones started before them
+            while status is None and added in finished:
+                results, baseline_stats, agent_stats, records = finished.pop(added)
+                summaries[0][1].add(agent_stats)
+                summaries[1][1].add(baseline_stats)
+                status = add(results, records)
+                added += 1
+        for future in running:
+            future.cancel()
+        pool.shutdown()
+
+    verdict = {"stronger": "is stronger than", "weaker": "is weaker than",
+               "equal": "is within {} of".format(sprt.margin),
+               None: "is not separated from"}[status]
+    print("\n\n{} {} {} after {} pairs (mean pair score {:.3f})".format(
+        agent.name, verdict, baseline.name, sprt.pairs, sprt.mean))
+    print_stats(summaries)
+    return status
 
 
 def update(total_wins, wins):
@@ -77,12 +399,49 @@ def update(total_wins, wins):
     return total_wins
 
 
-def play_matches(cpu_agents, test_agents, num_matches):
-    """Play matches between the test agent and each cpu_agent individually. """
+def play_matches(cpu_agents, test_agents, num_matches, processes=1, seed=None,
+                 recorder=None, sprt=None):
+    """Play matches between the test agent and each cpu_agent individually.
+
+    Parameters
+    ----------
+    processes : int (optional)
+        The number of worker processes. With more than one, every fair pair
+        of games is played in a process pool whose workers each own a copy of
+        all agents, so no search state is shared between games running at the
+        same time. Use no more processes than free cores, or the agents will
+        run out of time.
+
+    seed : int (optional)
+        Seed of the random openings; a random seed is drawn if None. The
+        openings (and all other random choices) of a tournament are
+        reproducible from this seed, in both sequential and parallel mode.
+
+    recorder : `game_records.GameRecorder` (optional)
+        If given, every game is written to it as soon as its result reaches
+        the main process.
+
+    sprt : `SPRT` (optional)
+        If given, the round robin is replaced by a sequential test of the
+        second test agent against the first: they play each other in fair
+        pairs until `sprt` ends or `num_matches` pairs have been played (see
+        `play_sprt()`), and the cpu agents are not used.
+
+    The search statistics of the agents that keep them (see
+    `game_agent.SearchStats`) are summed per agent and printed at the end.
+    """
+    if seed is None:
+        seed = random.randrange(2**32)
+    if sprt is not None:
+        return play_sprt(test_agents[1], test_agents[0], sprt, num_matches,
+                         processes, seed, recorder)
+
     total_wins = {agent.player: 0 for agent in test_agents}
     total_timeouts = 0.
     total_forfeits = 0.
     total_matches = 2 * num_matches * len(cpu_agents)
+    summaries = [(agent, StatsSummary()) for agent in test_agents + cpu_agents]
+    enable_stats(test_agents + cpu_agents)
 
     print("\n{:^9}{:^13}{:^13}{:^13}{:^13}{:^13}".format(
         "Match #", "Opponent", test_agents[0].name, test_agents[1].name,
@@ -90,6 +449,17 @@ def play_matches(cpu_agents, test_agents, num_matches):
     print("{:^9}{:^13} {:^5}| {:^5} {:^5}| {:^5} {:^5}| {:^5} {:^5}| {:^5}"
           .format("", "", *(["Won", "Lost"] * 4)))
 
+    pool = None
+    if processes > 1:
+        pool = ProcessPoolExecutor(processes, initializer=_init_worker,
+                                   initargs=(cpu_agents, test_agents))
+        futures = [[[pool.submit(_play_fair_pair_task, cpu_idx, test_idx,
+                                 match_seed(seed, cpu_idx, match_idx, num_matches),
+                                 recorder is not None)
+                     for test_idx in range(len(test_agents))]
+                    for match_idx in range(num_matches)]
+                   for cpu_idx in range(len(cpu_agents))]
+
     for idx, agent in enumerate(cpu_agents):
         wins = {test_agents[0].player: 0,
                 test_agents[1].player: 0,
@@ -99,7 +469,26 @@ def play_matches(cpu_agents, test_agents, num_matches):
 
         print("{!s:^9}{:^13}".format(idx + 1, agent.name), end="", flush=True)
 
-        counts = play_round(agent, test_agents, wins, num_matches)
+        cpu_summary = summaries[len(test_agents) + idx][1]
+        if pool is None:
+            counts = play_round(agent, test_agents, wins, num_matches,
+                                match_seed(seed, idx, 0, num_matches), recorder)
+            cpu_summary.add(pop_stats(agent))
+            for test_agent, summary in summaries[:len(test_agents)]:
+                summary.add(pop_stats(test_agent))
+        else:
+            counts = [0, 0]
+            for match_futures in futures[idx]:
+                for (test_agent, summary), future in zip(summaries, match_futures):
+                    results, cpu_stats, test_stats, records = future.result()
+                    for record in records or ():
+                        recorder.write(record)
+                    pair_counts = tally(results, agent, test_agent, wins)
+                    counts[0] += pair_counts[0]
+                    counts[1] += pair_counts[1]
+                    cpu_summary.add(cpu_stats)
+                    summary.add(test_stats)
+
         total_timeouts += counts[0]
         total_forfeits += counts[1]
         total_wins = update(total_wins, wins)
@@ -109,6 +498,9 @@ def play_matches(cpu_agents, test_agents, num_matches):
         print(" {:^5}| {:^5} {:^5}| {:^5} {:^5}| {:^5} {:^5}| {:^5}"
               .format(*round_totals))
 
+    if pool is not None:
+        pool.shutdown()
+
     print("-" * 74)
     print("{:^9}{:^13}{:^13}{:^13}{:^13}{:^13}\n".format(
         "", "Win Rate:",
@@ -116,6 +508,8 @@ def play_matches(cpu_agents, test_agents, num_matches):
           for a in test_agents]
     ))
 
+    print_stats(summaries)
+
     if total_timeouts:
         print(("\nThere were {} timeouts during the tournament -- make sure " +
                "your agent handles search timeout correctly, and consider " +
@@ -126,7 +520,7 @@ def play_matches(cpu_agents, test_agents, num_matches):
                "legal moves available to play.\n").format(total_forfeits))
 
 
-def main():
+def main(args):
 
     # Define two agents to compare -- these agents will play from the same
     # starting position against the same adversaries in the tournament
@@ -152,8 +546,40 @@ def main():
     print("{:^74}".format("*************************"))
     print("{:^74}".format("Playing Matches"))
     print("{:^74}".format("*************************"))
-    play_matches(cpu_agents, test_agents, NUM_MATCHES)
+    sprt = None
+    num_matches = args.matches or NUM_MATCHES
+    if args.sprt:
+        sprt = SPRT(args.margin, args.alpha, args.beta)
+        num_matches = args.matches or SPRT_MAX_PAIRS
+
+    recorder = GameRecorder(args.records) if args.records else None
+    try:
+        play_matches(cpu_agents, test_agents, num_matches,
+                     processes=args.processes or os.cpu_count(), seed=args.seed,
+                     recorder=recorder, sprt=sprt)
+    finally:
+        if recorder is not None:
+            recorder.close()
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("-m", "--matches", type=int, default=None,
+                        help="number of fair pairs played against each opponent "
+                             "(the most pairs played in SPRT mode)")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="number of worker processes (0 uses all cores)")
+    parser.add_argument("-s", "--seed", type=int, default=None,
+                        help="seed of the random openings")
+    parser.add_argument("-r", "--records", default=None,
+                        help="file to append a JSON record of every game to")
+    parser.add_argument("--sprt", action="store_true",
+                        help="test AB_Custom against AB_Improved with an SPRT "
+                             "instead of playing the round robin")
+    parser.add_argument("--margin", type=float, default=SPRT_MARGIN,
+                        help="difference in win rate the SPRT detects")
+    parser.add_argument("--alpha", type=float, default=SPRT_ALPHA,
+                        help="SPRT probability of separating equal agents")
+    parser.add_argument("--beta", type=float, default=SPRT_BETA,
+                        help="SPRT probability of missing a difference of margin")
+    main(parser.parse_args())